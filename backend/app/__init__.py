@@ -5,6 +5,7 @@ from flask import Flask, request, make_response
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 
 from config import get_config
 
@@ -81,6 +82,22 @@ def init_extensions(app):
     
     # 初始化JWT
     jwt.init_app(app)
+
+    # 初始化响应压缩
+    from app.utils.compression import init_compression
+    init_compression(app)
+
+    # 配置 LaTeX 答案标准化缓存
+    from app.utils.latex_normalizer import init_normalizer_cache
+    init_normalizer_cache(app)
+
+    # 配置追加写缓冲（练习记录、提示记录、复习提交记录）
+    from app.utils.write_behind import init_write_behind
+    init_write_behind(app)
+
+    # 预热判题进程池
+    from app.utils.grading_pool import init_grading_pool
+    init_grading_pool(app)
     
     # JWT错误处理
     @jwt.expired_token_loader
@@ -118,6 +135,22 @@ def init_database(app):
         # 创建索引
         create_indexes()
 
+        # 配置课程目录缓存
+        from app.models.lesson_catalog import lesson_catalog
+        lesson_catalog.check_interval = app.config.get('LESSON_CATALOG_CHECK_INTERVAL', 5)
+        lesson_catalog.invalidate()
+
+        # 首次部署或标准化规则升级后，从现有课程重新生成派生数据
+        # （练习题索引、内容哈希、标准化目标公式）
+        from app.utils.latex_normalizer import NORMALIZER_VERSION
+        stale_card = {'type': 'practice', 'normalizer_version': {'$ne': NORMALIZER_VERSION}}
+        if (db.lessons.find_one({'content_hash': {'$exists': False}}, {'_id': 1})
+                or db.lessons.find_one({'cards': {'$elemMatch': stale_card}}, {'_id': 1})
+                or (db.practice_items.estimated_document_count() == 0
+                    and db.lessons.estimated_document_count() > 0)):
+            from app.utils.lesson_sync import lessons_changed
+            lessons_changed(db)
+
     except Exception as e:
         app.logger.error(f"Failed to connect to MongoDB: {e}")
         raise
@@ -135,17 +168,110 @@ def create_indexes():
         # OAuth 相关索引
         db.users.create_index([("oauth_providers.provider", 1), ("oauth_providers.provider_id", 1)])
 
-        # 课程集合索引
-        db.lessons.create_index("sequence")
+        # 课程集合索引：sequence 唯一，作为 lesson-{sequence} 别名解析的回退查询
+        create_unique_sequence_index()
+
+        # 用户进度索引：(user_id, lesson_id) 唯一，进度以 upsert 做字段级原子更新
+        create_unique_progress_index()
 
         # 复习集合索引
         db.reviews.create_index([("user_id", 1), ("next_review_date", 1)])
+        db.reviews.create_index([("user_id", 1), ("practice_id", 1)])
+        # 每个 (用户, 课程, 卡片) 一条复习记录；迁移前按练习记录创建的旧记录没有 lesson_id，不受约束
+        db.reviews.create_index(
+            [("user_id", 1), ("lesson_id", 1), ("card_index", 1)],
+            unique=True,
+            partialFilterExpression={"lesson_id": {"$type": "string"}}
+        )
+
+        # 练习题索引集合：按难度、主题筛选，按课程和卡片顺序分页
+        db.practice_items.create_index([("difficulty", 1), ("lesson_sequence", 1), ("card_index", 1)])
+        db.practice_items.create_index([("topics", 1), ("lesson_sequence", 1), ("card_index", 1)])
+        db.practice_items.create_index([("lesson_id", 1), ("card_index", 1)])
+        db.practice_items.create_index([("lesson_sequence", 1), ("card_index", 1)])
+
+        # 练习记录索引：按用户和课程聚合作答情况
+        db.practice_records.create_index([("user_id", 1), ("lesson_id", 1), ("card_index", 1), ("submitted_at", -1)])
+        # 离线同步的作答以客户端生成的 client_attempt_id 去重，重复同步不会重复写入
+        db.practice_records.create_index(
+            [("user_id", 1), ("client_attempt_id", 1)],
+            unique=True,
+            partialFilterExpression={"client_attempt_id": {"$type": "string"}}
+        )
+
+        # 常见错误：每张卡片一条文档，submit 答错时按 (lesson_id, card_index) 查询
+        db.common_mistakes.create_index([("lesson_id", 1), ("card_index", 1)], unique=True)
+        db.common_mistakes.create_index("mined_at")
+
+        # 重新判题任务：按状态查找正在执行的任务，按创建时间列出
+        db.regrade_jobs.create_index([("status", 1), ("heartbeat_at", -1)])
+        db.regrade_jobs.create_index([("created_at", -1)])
+
+        # 追加写缓冲的死信：被数据库拒绝的文档，按失败时间排查
+        db.write_behind_dead_letters.create_index([("failed_at", -1)])
+
+        # 实时校验会话的当前答案：过了会话有效期后由 TTL 索引删除
+        db.live_validation_sessions.create_index("expires_at", expireAfterSeconds=0)
 
     except Exception as e:
         # Errors during index creation will be caught by the main app logger.
         print(f"Error creating indexes: {e}")
 
 
+def create_unique_sequence_index():
+    """创建 lessons.sequence 唯一索引，替换旧版本创建的同名非唯一索引"""
+    existing = db.lessons.index_information().get('sequence_1')
+    if existing and existing.get('unique'):
+        return
+    if existing:
+        db.lessons.drop_index('sequence_1')
+    try:
+        db.lessons.create_index("sequence", unique=True)
+    except OperationFailure as e:
+        # 已有重复的 sequence，退回非唯一索引，等待数据修复
+        print(f"Error creating unique lessons.sequence index: {e}")
+        db.lessons.create_index("sequence")
+
+
+def create_unique_progress_index():
+    """
+    创建 user_progress (user_id, lesson_id) 唯一索引
+
+    旧版本的先读后整体替换在并发时可能为同一课程创建多条进度文档，创建索引前先合并：
+    尝试次数相加，任一文档已完成即为完成，首次完成时间取最早的一个。
+    """
+    existing = db.user_progress.index_information().get('user_id_1_lesson_id_1')
+    if existing and existing.get('unique'):
+        return
+
+    duplicates = db.user_progress.aggregate([
+        {'$group': {'_id': {'user_id': '$user_id', 'lesson_id': '$lesson_id'},
+                    'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+    for group in duplicates:
+        documents = list(db.user_progress.find({'_id': {'$in': group['ids']}}).sort('created_at', 1))
+        merged = documents[0]
+        for document in documents[1:]:
+            for card_index, card in (document.get('cards_progress') or {}).items():
+                target = merged.setdefault('cards_progress', {}).setdefault(card_index, {})
+                target['attempts'] = target.get('attempts', 0) + card.get('attempts', 0)
+                completed_at = [value for value in (target.get('first_completed_at'), card.get('first_completed_at'))
+                                if value is not None]
+                target['completed'] = bool(target.get('completed') or card.get('completed'))
+                target['first_completed_at'] = min(completed_at) if completed_at else None
+        db.user_progress.replace_one({'_id': merged['_id']}, merged)
+        db.user_progress.delete_many({'_id': {'$in': [document['_id'] for document in documents[1:]]}})
+
+    if existing:
+        db.user_progress.drop_index('user_id_1_lesson_id_1')
+    try:
+        db.user_progress.create_index([("user_id", 1), ("lesson_id", 1)], unique=True)
+    except OperationFailure as e:
+        print(f"Error creating unique user_progress index: {e}")
+        db.user_progress.create_index([("user_id", 1), ("lesson_id", 1)])
+
+
 def register_blueprints(app):
     """注册蓝图"""
 
@@ -5,8 +5,11 @@ from flask import Blueprint, request, session, redirect, url_for, flash, render_
 from bson import ObjectId
 from datetime import datetime
 import json
+import os
 from .auth import admin_required, verify_admin_password, get_current_admin
 from app.models.admin import Admin
+from app.models.lesson import Lesson
+from app.utils.lesson_sync import lessons_changed
 from app import get_db
 
 admin_bp = Blueprint('admin', __name__)
@@ -401,42 +404,13 @@ def update_lessons():
     try:
         db = get_db()
 
-        # 导入最新的课程数据
-        import sys
-        import os
-
-        # 添加backend目录到Python路径
-        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        if backend_dir not in sys.path:
-            sys.path.insert(0, backend_dir)
-
-        # 导入课程数据
-        from comprehensive_lessons import create_comprehensive_lessons
-        import json
-
-        # 获取课程数据
-        lessons = create_comprehensive_lessons()
-
-        # 加载英文翻译
-        try:
-            with open(os.path.join(backend_dir, 'translations', 'lessons_en_US.json'), 'r', encoding='utf-8') as f:
-                translation_data = json.load(f)
-                raw_lessons_en = translation_data.get('lessons', [])
-
-                # 转换英文翻译数据格式，按sequence索引
-                lessons_en_US = []
-                for i, lesson_data in enumerate(raw_lessons_en):
-                    if 'translations' in lesson_data and 'en-US' in lesson_data['translations']:
-                        en_lesson = lesson_data['translations']['en-US']
-                        en_lesson['sequence'] = i + 1  # 按顺序分配sequence
-                        lessons_en_US.append(en_lesson)
-
-        except Exception as e:
-            lessons_en_US = []
-            print(f"Warning: Failed to load English translations: {e}")
+        # 获取最新的课程数据和英文翻译
+        lessons, lessons_en_US = load_source_bundle()
 
         # 执行增量更新
         update_result = perform_incremental_update(db, lessons, lessons_en_US)
+        if update_result['updated_lessons'] or update_result['new_lessons']:
+            lessons_changed(db)
 
         # 记录操作日志
         admin = get_current_admin()
@@ -479,6 +453,93 @@ def update_lessons():
         }), 500
 
 
+def load_source_bundle():
+    """
+    加载源课程数据及其英文翻译
+
+    Returns:
+        tuple: (课程列表, 英文翻译列表)，英文翻译按文件顺序分配 sequence
+    """
+    import sys
+    import os
+
+    # 添加backend目录到Python路径
+    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+
+    # 导入课程数据
+    from comprehensive_lessons import create_comprehensive_lessons
+    lessons = create_comprehensive_lessons()
+
+    # 加载英文翻译
+    try:
+        with open(os.path.join(backend_dir, 'translations', 'lessons_en_US.json'), 'r', encoding='utf-8') as f:
+            translation_data = json.load(f)
+            raw_lessons_en = translation_data.get('lessons', [])
+
+            # 转换英文翻译数据格式，按sequence索引
+            lessons_en_US = []
+            for i, lesson_data in enumerate(raw_lessons_en):
+                if 'translations' in lesson_data and 'en-US' in lesson_data['translations']:
+                    en_lesson = lesson_data['translations']['en-US']
+                    en_lesson['sequence'] = i + 1  # 按顺序分配sequence
+                    lessons_en_US.append(en_lesson)
+
+    except Exception as e:
+        lessons_en_US = []
+        print(f"Warning: Failed to load English translations: {e}")
+
+    return lessons, lessons_en_US
+
+
+def translations_by_sequence(source_lessons_en):
+    """创建英文翻译映射"""
+    return {lesson['sequence']: lesson for lesson in source_lessons_en if 'sequence' in lesson}
+
+
+def load_current_lesson_hashes(db, source_lessons, en_translations):
+    """
+    按 sequence 加载数据库中课程的内容哈希
+
+    只投影 sequence 和 content_hash；源数据缺少英文翻译的课程额外加载其现有英文字段，
+    因为增量更新会保留这些字段，比较时需要计入。
+    """
+    projection = {'sequence': 1, 'content_hash': 1}
+    current_lessons = {lesson['sequence']: lesson for lesson in db.lessons.find({}, projection)}
+
+    untranslated = [
+        lesson['sequence'] for lesson in source_lessons
+        if lesson.get('sequence') in current_lessons and lesson['sequence'] not in en_translations
+    ]
+    if untranslated:
+        projection.update({'title_en': 1, 'description_en': 1, 'cards_en': 1})
+        for lesson in db.lessons.find({'sequence': {'$in': untranslated}}, projection):
+            current_lessons[lesson['sequence']] = lesson
+
+    return current_lessons
+
+
+def source_content_hash(source_lesson, en_translation=None, current_lesson=None):
+    """计算源课程写入数据库后的内容哈希"""
+    content = {
+        'title': source_lesson.get('title'),
+        'description': source_lesson.get('description'),
+        'cards': source_lesson.get('cards')
+    }
+    if en_translation:
+        content.update({
+            'title_en': en_translation.get('title'),
+            'description_en': en_translation.get('description'),
+            'cards_en': en_translation.get('cards', [])
+        })
+    elif current_lesson:
+        # 没有新的翻译时，更新会保留现有英文字段
+        for field in ('title_en', 'description_en', 'cards_en'):
+            content[field] = current_lesson.get(field)
+    return Lesson.compute_content_hash(content)
+
+
 def perform_incremental_update(db, source_lessons, source_lessons_en):
     """执行增量更新"""
     update_result = {
@@ -490,14 +551,10 @@ def perform_incremental_update(db, source_lessons, source_lessons_en):
     }
 
     try:
-        # 获取当前数据库中的所有课程
-        current_lessons = {lesson['sequence']: lesson for lesson in db.lessons.find({})}
+        en_translations = translations_by_sequence(source_lessons_en)
 
-        # 创建英文翻译映射
-        en_translations = {}
-        for lesson in source_lessons_en:
-            if 'sequence' in lesson:
-                en_translations[lesson['sequence']] = lesson
+        # 获取当前数据库中所有课程的内容哈希
+        current_lessons = load_current_lesson_hashes(db, source_lessons, en_translations)
 
         for source_lesson in source_lessons:
             # 确保课程有sequence字段
@@ -514,11 +571,15 @@ def perform_incremental_update(db, source_lessons, source_lessons_en):
                 # 检查课程是否存在
                 if sequence in current_lessons:
                     current_lesson = current_lessons[sequence]
+                    content_hash = source_content_hash(
+                        source_lesson, en_translations.get(sequence), current_lesson
+                    )
 
-                    # 比较课程内容是否有变化
-                    if lesson_content_changed(current_lesson, source_lesson):
+                    # 比较课程内容哈希是否有变化
+                    if lesson_content_changed(current_lesson, content_hash):
                         # 准备更新数据
                         update_data = prepare_lesson_update_data(source_lesson, en_translations.get(sequence))
+                        update_data['content_hash'] = content_hash
 
                         # 更新课程
                         db.lessons.update_one(
@@ -562,16 +623,9 @@ def perform_incremental_update(db, source_lessons, source_lessons_en):
         return update_result
 
 
-def lesson_content_changed(current_lesson, source_lesson):
-    """检查课程内容是否有变化"""
-    # 比较关键字段
-    fields_to_compare = ['title', 'description', 'cards']
-
-    for field in fields_to_compare:
-        if current_lesson.get(field) != source_lesson.get(field):
-            return True
-
-    return False
+def lesson_content_changed(current_lesson, source_hash):
+    """检查课程内容是否有变化：比较数据库中保存的内容哈希与源课程的内容哈希"""
+    return current_lesson.get('content_hash') != source_hash
 
 
 def prepare_lesson_update_data(source_lesson, en_translation=None):
@@ -614,6 +668,7 @@ def prepare_lesson_insert_data(source_lesson, en_translation=None):
             'cards_en': en_translation.get('cards', [])
         })
 
+    lesson_data['content_hash'] = Lesson.compute_content_hash(lesson_data)
     return lesson_data
 
 
@@ -641,18 +696,11 @@ def update_lessons_status():
 
         # 获取源课程数据并检查是否需要更新
         try:
-            import sys
-            import os
-            backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            if backend_dir not in sys.path:
-                sys.path.insert(0, backend_dir)
-
-            from comprehensive_lessons import create_comprehensive_lessons
-            lessons = create_comprehensive_lessons()
+            lessons, lessons_en_US = load_source_bundle()
             source_lesson_count = len(lessons)
 
             # 检查是否有课程内容变化
-            needs_update = check_lessons_need_update(db, lessons)
+            needs_update = check_lessons_need_update(db, lessons, lessons_en_US)
 
         except Exception:
             source_lesson_count = 'unknown'
@@ -672,11 +720,13 @@ def update_lessons_status():
         }), 500
 
 
-def check_lessons_need_update(db, source_lessons):
-    """检查是否有课程需要更新"""
+def check_lessons_need_update(db, source_lessons, source_lessons_en=None):
+    """检查是否有课程需要更新（只比较内容哈希，不加载课程卡片）"""
     try:
-        # 获取当前数据库中的课程
-        current_lessons = {lesson['sequence']: lesson for lesson in db.lessons.find({})}
+        en_translations = translations_by_sequence(source_lessons_en or [])
+
+        # 获取当前数据库中课程的内容哈希
+        current_lessons = load_current_lesson_hashes(db, source_lessons, en_translations)
 
         # 检查数量是否不同
         if len(current_lessons) != len(source_lessons):
@@ -689,7 +739,9 @@ def check_lessons_need_update(db, source_lessons):
             if sequence not in current_lessons:
                 return True  # 有新课程
 
-            if lesson_content_changed(current_lessons[sequence], source_lesson):
+            current_lesson = current_lessons[sequence]
+            content_hash = source_content_hash(source_lesson, en_translations.get(sequence), current_lesson)
+            if lesson_content_changed(current_lesson, content_hash):
                 return True  # 有内容变化
 
         return False
@@ -698,6 +750,203 @@ def check_lessons_need_update(db, source_lessons):
         return False  # 检查失败时假设不需要更新
 
 
+@admin_bp.route('/metrics')
+@admin_required
+def metrics():
+    """获取当前进程的运行指标（缓存命中率等），用于监控"""
+    from app.models.lesson_catalog import lesson_catalog
+    from app.utils.compression import compression_cache
+    from app.utils.grading_pool import grading_pool
+    from app.utils.latex_normalizer import normalization_cache, NORMALIZER_VERSION
+    from app.utils.write_behind import write_behind
+
+    try:
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            'lesson_catalog': {
+                'version': lesson_catalog.version,
+                'lessons': lesson_catalog.count()
+            },
+            'normalizer_cache': dict(normalization_cache.stats(), normalizer_version=NORMALIZER_VERSION),
+            'compression_cache': compression_cache.stats(),
+            'grading_pool': grading_pool.stats(),
+            'write_behind': write_behind.stats(),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'获取运行指标失败：{str(e)}'
+        }), 500
+
+
+@admin_bp.route('/regrade-jobs', methods=['GET', 'POST'])
+@admin_required
+def regrade_jobs():
+    """
+    历史练习记录重新判题任务
+
+    GET 返回最近的任务；POST 创建新任务并在后台执行（已有任务正在执行时返回 409）
+    """
+    from flask import current_app
+    from app.utils.regrade import active_job, claim_job, create_job, serialize_job, start_job_in_background
+
+    try:
+        db = get_db()
+        if request.method == 'GET':
+            jobs = db.regrade_jobs.find().sort('created_at', -1).limit(20)
+            return jsonify({'success': True, 'jobs': [serialize_job(job) for job in jobs]}), 200
+
+        running = active_job(db)
+        if running is not None:
+            return jsonify({
+                'success': False,
+                'message': '已有重新判题任务正在执行',
+                'job': serialize_job(running)
+            }), 409
+
+        admin = get_current_admin()
+        job = claim_job(db, create_job(db, created_by=admin.username if admin else 'unknown')['_id'])
+        start_job_in_background(current_app._get_current_object(), job)
+        db.admin_logs.insert_one({
+            'action': 'regrade_practice_records',
+            'admin_id': str(admin._id) if admin else 'unknown',
+            'admin_username': admin.username if admin else 'unknown',
+            'timestamp': datetime.utcnow(),
+            'job_id': job['_id'],
+            'success': True
+        })
+        return jsonify({'success': True, 'job': serialize_job(job)}), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'重新判题任务操作失败：{str(e)}'
+        }), 500
+
+
+@admin_bp.route('/regrade-jobs/<job_id>')
+@admin_required
+def regrade_job_detail(job_id):
+    """获取重新判题任务的进度"""
+    from app.utils.regrade import serialize_job
+
+    try:
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        job = get_db().regrade_jobs.find_one({'_id': ObjectId(job_id)})
+        if job is None:
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        return jsonify({'success': True, 'job': serialize_job(job)}), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'获取任务进度失败：{str(e)}'
+        }), 500
+
+
+@admin_bp.route('/regrade-jobs/<job_id>/resume', methods=['POST'])
+@admin_required
+def resume_regrade_job(job_id):
+    """从检查点继续执行失败、中断或执行进程已退出的任务"""
+    from flask import current_app
+    from app.utils.regrade import active_job, claim_job, serialize_job, start_job_in_background
+
+    try:
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        db = get_db()
+        running = active_job(db)
+        if running is not None and str(running['_id']) != job_id:
+            return jsonify({'success': False, 'message': '已有重新判题任务正在执行'}), 409
+
+        job = claim_job(db, job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': '任务不存在、已结束或正在执行'}), 409
+
+        start_job_in_background(current_app._get_current_object(), job)
+        return jsonify({'success': True, 'job': serialize_job(job)}), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'继续执行任务失败：{str(e)}'
+        }), 500
+
+
+@admin_bp.route('/regrade-jobs/<job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_regrade_job(job_id):
+    """取消任务；正在执行的任务在当前批次结束后停止"""
+    from app.utils.regrade import request_cancel
+
+    try:
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        if not request_cancel(get_db(), job_id):
+            return jsonify({'success': False, 'message': '任务不存在或已结束'}), 409
+        return jsonify({'success': True, 'message': '已请求取消任务'}), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'取消任务失败：{str(e)}'
+        }), 500
+
+
+@admin_bp.route('/common-mistakes', methods=['GET', 'POST'])
+@admin_required
+def common_mistakes():
+    """
+    各练习卡片的常见错误
+
+    GET 返回挖掘结果（可按 lesson_id 筛选）；POST 在后台重新挖掘全部卡片，完成后写入操作日志
+    """
+    from flask import current_app
+    from app.utils.common_mistakes import start_mining_in_background
+
+    try:
+        db = get_db()
+        if request.method == 'GET':
+            query = {}
+            lesson_id = request.args.get('lesson_id')
+            if lesson_id:
+                if not ObjectId.is_valid(lesson_id):
+                    return jsonify({'success': False, 'message': '课程ID无效'}), 400
+                query['lesson_id'] = ObjectId(lesson_id)
+            results = []
+            for mistakes in db.common_mistakes.find(query).sort([('lesson_id', 1), ('card_index', 1)]).limit(200):
+                mistakes['_id'] = str(mistakes['_id'])
+                mistakes['lesson_id'] = str(mistakes['lesson_id'])
+                mistakes['mined_at'] = mistakes['mined_at'].isoformat()
+                results.append(mistakes)
+            return jsonify({'success': True, 'cards': results}), 200
+
+        admin = get_current_admin()
+
+        def log_result(db, summary):
+            db.admin_logs.insert_one({
+                'action': 'mine_common_mistakes',
+                'admin_id': str(admin._id) if admin else 'unknown',
+                'admin_username': admin.username if admin else 'unknown',
+                'timestamp': datetime.utcnow(),
+                'result': summary,
+                'success': summary['success']
+            })
+
+        start_mining_in_background(current_app._get_current_object(), log_result)
+        return jsonify({'success': True, 'message': '已开始挖掘常见错误，完成后结果写入操作日志'}), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'常见错误操作失败：{str(e)}'
+        }), 500
+
+
 @admin_bp.route('/users')
 @admin_required
 def users():
@@ -1148,6 +1397,7 @@ def edit_lesson(lesson_id):
             )
 
             if result.modified_count > 0:
+                lessons_changed(db, [ObjectId(lesson_id)])
                 flash(f'课程{"英文" if edit_lang == "en-US" else "中文"}版本更新成功！', 'success')
             else:
                 flash('课程数据未发生变化', 'info')
@@ -1509,6 +1759,7 @@ def create_lesson():
             result = db.lessons.insert_one(new_lesson)
 
             if result.inserted_id:
+                lessons_changed(db, [result.inserted_id])
                 flash('课程创建成功！', 'success')
                 return redirect(url_for('admin.lesson_detail', lesson_id=str(result.inserted_id)))
             else:
@@ -1685,6 +1936,7 @@ def create_card(lesson_id):
             )
 
             if result.modified_count > 0:
+                lessons_changed(db, [ObjectId(lesson_id)])
                 flash('卡片添加成功！', 'success')
                 return redirect(url_for('admin.edit_lesson', lesson_id=lesson_id))
             else:
@@ -1932,6 +2184,7 @@ def edit_card(lesson_id, card_index):
             )
 
             if result.modified_count > 0:
+                lessons_changed(db, [ObjectId(lesson_id)])
                 flash(f'卡片{"英文" if edit_lang == "en-US" else "中文"}版本更新成功！', 'success')
                 return redirect(url_for('admin.edit_lesson', lesson_id=lesson_id))
             else:
@@ -2186,6 +2439,7 @@ def delete_card(lesson_id, card_index):
         )
 
         if result.modified_count > 0:
+            lessons_changed(db, [ObjectId(lesson_id)])
             flash('卡片删除成功！', 'success')
         else:
             flash('卡片删除失败', 'error')
@@ -2308,6 +2562,7 @@ def import_translations():
 
             # 显示导入结果
             if updated_count > 0:
+                lessons_changed(db)
                 flash(f'成功更新 {updated_count} 个课程的翻译数据', 'success')
             if error_count > 0:
                 flash(f'{error_count} 个课程处理失败', 'warning')
@@ -3,8 +3,10 @@
 """
 from .user import User
 from .lesson import Lesson
+from .lesson_catalog import LessonCatalog, lesson_catalog
 from .practice import Practice
+from .practice_item import PracticeItem
 from .review import Review
 from .admin import Admin
 
-__all__ = ['User', 'Lesson', 'Practice', 'Review', 'Admin']
+__all__ = ['User', 'Lesson', 'LessonCatalog', 'lesson_catalog', 'Practice', 'PracticeItem', 'Review', 'Admin']
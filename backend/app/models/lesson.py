@@ -1,9 +1,54 @@
 """
 课程模型 - LaTeX 速成训练器
 """
+import hashlib
+import json
 from datetime import datetime
 from bson import ObjectId
 from app import get_db
+from app.models.lesson_catalog import lesson_catalog
+
+
+# to_dict 可输出的字段，以及每个字段依赖的课程文档字段（用于投影）
+LESSON_FIELD_SOURCES = {
+    'id': ('_id',),
+    '_id': ('_id',),
+    'title': ('title', 'title_en'),
+    'sequence': ('sequence',),
+    'description': ('description', 'description_en', 'title_en'),
+    'cards': ('cards', 'cards_en', 'title_en'),
+    'knowledgePoints': ('cards', 'cards_en', 'title_en'),
+    'exercises': ('cards', 'cards_en', 'title_en'),
+    'created_at': ('created_at',),
+    'title_en': ('title_en',),
+    'description_en': ('description_en',),
+    'has_translation': ('title_en',),
+}
+
+# 需要处理卡片数组的字段
+CARD_FIELDS = frozenset(['cards', 'knowledgePoints', 'exercises'])
+
+# 预定义视图：summary 只包含标题、序号等轻量字段，不加载也不序列化任何卡片
+LESSON_VIEWS = {
+    'summary': ('id', '_id', 'title', 'sequence', 'description', 'created_at',
+                'title_en', 'description_en', 'has_translation'),
+    'full': tuple(LESSON_FIELD_SOURCES),
+}
+
+# 参与内容哈希计算的课程字段（中文内容及英文翻译）
+CONTENT_HASH_FIELDS = ('title', 'description', 'cards', 'title_en', 'description_en', 'cards_en')
+
+# 由卡片内容派生、写入时自动维护的卡片字段，不计入内容哈希，也不返回给客户端
+DERIVED_CARD_FIELDS = frozenset(['target_normalized', 'normalizer_version'])
+
+
+def strip_derived_card_fields(cards):
+    """返回去掉派生字段后的卡片列表"""
+    return [
+        {key: value for key, value in card.items() if key not in DERIVED_CARD_FIELDS}
+        if DERIVED_CARD_FIELDS & card.keys() else card
+        for card in cards
+    ]
 
 
 class Lesson:
@@ -22,8 +67,17 @@ class Lesson:
         self.cards_en = cards_en or []
         self.created_at = created_at or datetime.utcnow()
     
-    def to_dict(self, language='zh-CN'):
-        """转换为字典格式，支持多语言"""
+    def to_dict(self, language='zh-CN', fields=None):
+        """
+        转换为字典格式，支持多语言
+
+        Args:
+            language: 语言代码
+            fields: 需要输出的字段（LESSON_FIELD_SOURCES 的键），None 表示全部字段。
+                    未请求 cards/knowledgePoints/exercises 时完全跳过卡片处理。
+        """
+        wanted = None if fields is None else set(fields)
+
         # 根据语言选择对应的字段
         if language == 'en-US' and self.title_en:
             title = self.title_en
@@ -34,13 +88,16 @@ class Lesson:
             description = self.description
             cards = self.cards
 
+        if wanted is not None and not wanted & CARD_FIELDS:
+            cards = []
+
         # 将cards转换为前端期望的格式
         # 前端期望的是知识点和练习题混合的结构，每个卡片都是一个独立的知识点
         knowledge_points = []
         knowledge_point_counter = 0
         practice_counter = 0
 
-        for i, card in enumerate(cards):
+        for i, card in enumerate(cards if wanted is None or 'knowledgePoints' in wanted else []):
             if card['type'] == 'knowledge':
                 knowledge_point_counter += 1
                 # 根据语言返回合适的标题
@@ -89,7 +146,7 @@ class Lesson:
 
         # 为了向后兼容，也生成分离的exercises数组
         exercises = []
-        for i, card in enumerate(cards):
+        for i, card in enumerate(cards if wanted is None or 'exercises' in wanted else []):
             if card['type'] == 'practice':
                 exercises.append({
                     'id': f"{str(self._id)}_practice_{i}",
@@ -99,13 +156,13 @@ class Lesson:
                     'difficulty': card.get('difficulty', 'easy')
                 })
 
-        return {
+        data = {
             'id': str(self._id),  # 前端期望的字段名
             '_id': str(self._id),  # 保留原字段名以兼容
             'title': title,  # 课程主标题（根据语言选择）
             'sequence': self.sequence,
             'description': description,  # 课程描述（根据语言选择）
-            'cards': cards,  # 保留原始cards数据
+            'cards': strip_derived_card_fields(cards),  # 保留原始cards数据
             'knowledgePoints': knowledge_points,  # 前端期望的格式
             'exercises': exercises,  # 前端期望的格式
             'created_at': self.created_at.isoformat(),
@@ -114,6 +171,50 @@ class Lesson:
             'description_en': self.description_en,
             'has_translation': bool(self.title_en)
         }
+
+        if wanted is not None:
+            data = {key: value for key, value in data.items() if key in wanted}
+        return data
+
+    @staticmethod
+    def compute_content_hash(lesson_data):
+        """
+        计算课程内容哈希
+
+        对 CONTENT_HASH_FIELDS 中非空字段的规范化 JSON（键排序、紧凑分隔符）取 SHA-256，
+        不包含 _id、sequence、时间戳等元数据以及卡片的派生字段（DERIVED_CARD_FIELDS）。
+        内容相同的课程在任何进程中得到相同的哈希，可用于变更检测和缓存键。
+        """
+        content = {
+            field: lesson_data[field]
+            for field in CONTENT_HASH_FIELDS
+            if lesson_data.get(field) not in (None, [], '')
+        }
+        for field in ('cards', 'cards_en'):
+            if field in content:
+                content[field] = strip_derived_card_fields(content[field])
+        canonical = json.dumps(content, sort_keys=True, ensure_ascii=False,
+                               separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def projection_for_fields(fields):
+        """将 to_dict 字段列表转换为课程文档投影（None 表示不投影）"""
+        if fields is None:
+            return None
+        projection = {'_id': 1}
+        for field in fields:
+            for source in LESSON_FIELD_SOURCES[field]:
+                projection[source] = 1
+        return projection
+
+    @classmethod
+    def _project(cls, lesson_data, fields):
+        """按字段列表对课程文档做投影，未请求的卡片数组不会被复制"""
+        projection = cls.projection_for_fields(fields)
+        if projection is None:
+            return lesson_data
+        return {key: value for key, value in lesson_data.items() if key in projection}
     
     @classmethod
     def from_dict(cls, data):
@@ -123,16 +224,19 @@ class Lesson:
         lesson.title = data.get('title')
         lesson.sequence = data.get('sequence')
         lesson.description = data.get('description')
-        lesson.cards = data.get('cards', [])
+        # 复制列表，避免 add_card 等操作修改课程目录缓存中的共享文档
+        lesson.cards = list(data.get('cards') or [])
         # 多语言字段
         lesson.title_en = data.get('title_en')
         lesson.description_en = data.get('description_en')
-        lesson.cards_en = data.get('cards_en', [])
+        lesson.cards_en = list(data.get('cards_en') or [])
         lesson.created_at = data.get('created_at', datetime.utcnow())
         return lesson
     
     def save(self):
         """保存课程到数据库"""
+        from app.utils.lesson_sync import lessons_changed
+
         db = get_db()
         lesson_data = {
             'title': self.title,
@@ -152,71 +256,55 @@ class Lesson:
                 {'_id': self._id},
                 {'$set': lesson_data}
             )
+            if result.modified_count > 0:
+                lessons_changed(db, [self._id])
             return result.modified_count > 0
         else:
             # 创建新课程
             result = db.lessons.insert_one(lesson_data)
             self._id = result.inserted_id
+            lessons_changed(db, [self._id])
             return True
     
     @classmethod
-    def find_by_id(cls, lesson_id):
-        """根据ID查找课程"""
-        db = get_db()
-        if isinstance(lesson_id, str):
-            lesson_id = ObjectId(lesson_id)
-        
-        lesson_data = db.lessons.find_one({'_id': lesson_id})
+    def find_by_id(cls, lesson_id, fields=None):
+        """根据ID查找课程（读取课程目录缓存，fields 同 to_dict）"""
+        lesson_data = lesson_catalog.get_by_id(lesson_id)
         if lesson_data:
-            return cls.from_dict(lesson_data)
+            return cls.from_dict(cls._project(lesson_data, fields))
         return None
     
     @classmethod
     def find_by_sequence(cls, sequence):
-        """根据序号查找课程"""
-        db = get_db()
-        lesson_data = db.lessons.find_one({'sequence': sequence})
+        """根据序号查找课程（读取课程目录缓存）"""
+        lesson_data = lesson_catalog.get_by_sequence(sequence)
         if lesson_data:
             return cls.from_dict(lesson_data)
         return None
     
     @classmethod
-    def get_all_lessons(cls, sort_by_sequence=True):
-        """获取所有课程"""
-        db = get_db()
-        sort_criteria = [('sequence', 1)] if sort_by_sequence else []
-        lessons_data = db.lessons.find().sort(sort_criteria)
-        
-        lessons = []
-        for lesson_data in lessons_data:
-            lessons.append(cls.from_dict(lesson_data))
-        return lessons
+    def get_all_lessons(cls, sort_by_sequence=True, fields=None):
+        """获取所有课程（读取课程目录缓存，始终按序号排序；fields 同 to_dict）"""
+        return [cls.from_dict(cls._project(lesson_data, fields)) for lesson_data in lesson_catalog.all()]
     
     @classmethod
     def get_lessons_up_to_sequence(cls, max_sequence):
         """获取指定序号之前的所有课程（用于检查用户解锁权限）"""
-        db = get_db()
-        lessons_data = db.lessons.find({'sequence': {'$lte': max_sequence}}).sort([('sequence', 1)])
-        
-        lessons = []
-        for lesson_data in lessons_data:
-            lessons.append(cls.from_dict(lesson_data))
-        return lessons
+        return [
+            cls.from_dict(lesson_data)
+            for lesson_data in lesson_catalog.all()
+            if lesson_data.get('sequence') is not None and lesson_data['sequence'] <= max_sequence
+        ]
     
     @classmethod
     def get_next_lesson(cls, current_sequence):
         """获取下一课程"""
-        db = get_db()
-        lesson_data = db.lessons.find_one({'sequence': current_sequence + 1})
-        if lesson_data:
-            return cls.from_dict(lesson_data)
-        return None
+        return cls.find_by_sequence(current_sequence + 1)
     
     @classmethod
     def get_total_count(cls):
         """获取课程总数"""
-        db = get_db()
-        return db.lessons.count_documents({})
+        return lesson_catalog.count()
     
     def add_card(self, card_type, content=None, practice_id=None):
         """添加课程卡片"""
@@ -0,0 +1,187 @@
+"""
+课程目录缓存 - LaTeX 速成训练器
+进程内缓存整个 lessons 集合，按 _id / sequence / lesson-N 别名直接在内存中查找
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from app import get_db
+
+
+# catalog_meta 集合中保存课程目录版本号的文档ID
+CATALOG_META_ID = 'lessons'
+
+# 课程序列化只区分英文和默认中文两种形式（与 Lesson.to_dict 的语言选择一致）
+RENDER_LANGUAGES = ('zh-CN', 'en-US')
+
+
+def normalize_render_language(language):
+    """将任意语言参数归一化为 RENDER_LANGUAGES 中的一项"""
+    return language if language in RENDER_LANGUAGES else RENDER_LANGUAGES[0]
+
+
+def read_catalog_version(db=None):
+    """读取当前课程目录版本号"""
+    db = db if db is not None else get_db()
+    meta = db.catalog_meta.find_one({'_id': CATALOG_META_ID})
+    return meta.get('version', 0) if meta else 0
+
+
+def bump_catalog_version(db=None):
+    """
+    递增课程目录版本号
+
+    所有修改 lessons 集合的路径（管理后台编辑、导入翻译、增量更新、重置数据库等）
+    在写入完成后都必须调用此函数，各进程的 LessonCatalog 会据此重新加载。
+    """
+    db = db if db is not None else get_db()
+    db.catalog_meta.update_one(
+        {'_id': CATALOG_META_ID},
+        {
+            '$inc': {'version': 1},
+            '$set': {'updated_at': datetime.utcnow()}
+        },
+        upsert=True
+    )
+    # 当前进程立即失效，其他进程在 check_interval 内发现版本变化
+    lesson_catalog.invalidate()
+
+
+class _CatalogSnapshot:
+    """某一版本的课程目录快照（只读）"""
+
+    def __init__(self, version, lessons):
+        self.version = version
+        self.lessons = sorted(lessons, key=lambda lesson: lesson.get('sequence') or 0)
+        self.by_id = {}
+        self.by_sequence = {}
+        for lesson in self.lessons:
+            self.by_id[str(lesson['_id'])] = lesson
+            if lesson.get('sequence') is not None:
+                self.by_sequence[lesson['sequence']] = lesson
+        # (lesson_id, language, fields) -> 预先序列化的 JSON 片段
+        self._rendered = {}
+
+    def render(self, lesson, language='zh-CN', fields=None):
+        """
+        返回课程在指定语言下序列化后的 JSON 字节片段
+
+        片段是一个缺少结尾 '}' 的 JSON 对象，调用方追加用户相关字段后自行闭合。
+        fields 为 None 或预定义视图（LESSON_VIEWS）时，每个快照中每个
+        (课程, 语言, 视图) 只序列化一次，内容变化时随快照一起重建；
+        其他任意字段组合按需序列化，不进入缓存。
+        """
+        from app.models.lesson import Lesson, LESSON_VIEWS
+
+        language = normalize_render_language(language)
+        key = (str(lesson['_id']), language, fields)
+        fragment = self._rendered.get(key)
+        if fragment is None:
+            payload = json.dumps(
+                Lesson.from_dict(Lesson._project(lesson, fields)).to_dict(language=language, fields=fields),
+                ensure_ascii=False,
+                separators=(',', ':')
+            )
+            fragment = payload.encode('utf-8')[:-1]
+            if fields is None or fields in LESSON_VIEWS.values():
+                self._rendered[key] = fragment
+        return fragment
+
+
+class LessonCatalog:
+    """
+    进程级课程目录缓存
+
+    首次访问时一次性加载 lessons 集合，之后按 _id、sequence 和 lesson-N 别名
+    在内存中应答查询。每隔 check_interval 秒读取一次 catalog_meta 中的版本号，
+    版本变化时整体重新加载。
+
+    注意：返回的课程文档在各请求间共享，调用方不得修改。
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """丢弃当前快照，下次访问时重新加载"""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+    def _is_fresh(self, snapshot):
+        return snapshot is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def snapshot(self):
+        """获取当前有效的目录快照，必要时重新加载"""
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                return snapshot
+
+            db = get_db()
+            version = read_catalog_version(db)
+            if snapshot is None or snapshot.version != version:
+                snapshot = _CatalogSnapshot(version, db.lessons.find())
+                self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    @property
+    def version(self):
+        """当前目录版本号"""
+        return self.snapshot().version
+
+    def all(self):
+        """按 sequence 排序的全部课程文档"""
+        return self.snapshot().lessons
+
+    def get_by_id(self, lesson_id):
+        """根据 _id（ObjectId 或其字符串形式）查找课程文档"""
+        return self.snapshot().by_id.get(str(lesson_id))
+
+    def get_by_sequence(self, sequence):
+        """根据序号查找课程文档"""
+        return self.snapshot().by_sequence.get(sequence)
+
+    def resolve(self, lesson_ref):
+        """
+        解析任意形式的课程引用
+
+        支持 ObjectId、ObjectId 字符串、lesson-{sequence} 别名和整数序号。
+        """
+        if isinstance(lesson_ref, ObjectId):
+            return self.get_by_id(lesson_ref)
+        if isinstance(lesson_ref, int):
+            return self.get_by_sequence(lesson_ref)
+        if not isinstance(lesson_ref, str):
+            return None
+
+        lesson = self.get_by_id(lesson_ref)
+        if lesson is None and lesson_ref.startswith('lesson-'):
+            try:
+                lesson = self.get_by_sequence(int(lesson_ref[len('lesson-'):]))
+            except ValueError:
+                lesson = None
+        return lesson
+
+    def count(self):
+        """课程总数"""
+        return len(self.snapshot().lessons)
+
+
+# 进程级单例
+lesson_catalog = LessonCatalog()
+
+
+def get_lesson_catalog():
+    """获取课程目录缓存实例"""
+    return lesson_catalog
@@ -5,6 +5,16 @@ from datetime import datetime
 from bson import ObjectId
 import re
 from app import get_db
+from app.utils.latex_normalizer import normalize_latex_answer
+from app.utils.regex_guard import (
+    CompiledPatternCache, RegexBudgetExceeded, compile_or_none, max_input_length, time_budget
+)
+
+
+# 练习ID -> 编译后的答案正则及提示规则，保存练习时失效
+practice_patterns = CompiledPatternCache()
+
+GENERIC_HINT = "请检查您的LaTeX语法，确保命令和括号使用正确。"
 
 
 class Practice:
@@ -64,11 +74,13 @@ class Practice:
                 {'_id': self._id},
                 {'$set': practice_data}
             )
+            practice_patterns.invalidate(str(self._id))
             return result.modified_count > 0
         else:
             # 创建新练习
             result = db.practices.insert_one(practice_data)
             self._id = result.inserted_id
+            practice_patterns.invalidate(str(self._id))
             return True
     
     @classmethod
@@ -107,61 +119,71 @@ class Practice:
     
     def normalize_latex_answer(self, answer):
         """标准化LaTeX答案，去除多余空格和换行"""
-        if not answer:
-            return ""
-        
-        # 去除首尾空白
-        answer = answer.strip()
-        
-        # 标准化空格：将多个连续空格替换为单个空格
-        answer = re.sub(r'\s+', ' ', answer)
-        
-        # 去除花括号内外的多余空格
-        # 例如: \frac { a } { b } -> \frac{a}{b}
-        answer = re.sub(r'\{\s+', '{', answer)
-        answer = re.sub(r'\s+\}', '}', answer)
-        
-        # 去除命令后的多余空格
-        # 例如: \frac  {a}{b} -> \frac{a}{b}
-        answer = re.sub(r'(\\[a-zA-Z]+)\s+', r'\1', answer)
-        
-        return answer
+        return normalize_latex_answer(answer)
     
+    def compiled_patterns(self):
+        """
+        返回 (答案正则, [(提示正则, 提示信息), ...])，按练习ID缓存
+
+        无效的答案正则编译为 None；无效的提示规则被跳过。
+        """
+        hints = tuple(
+            (hint.get('pattern', ''), hint.get('message', ''))
+            for hint in self.hints if isinstance(hint, dict)
+        )
+
+        def build():
+            solution = compile_or_none(self.solution_regex, re.IGNORECASE) if self.solution_regex else None
+            hint_patterns = []
+            for pattern, message in hints:
+                if pattern and message:
+                    compiled = compile_or_none(pattern)
+                    if compiled is not None:
+                        hint_patterns.append((compiled, message))
+            return solution, hint_patterns
+
+        return practice_patterns.get(str(self._id), (self.solution_regex, hints), build)
+
     def check_answer(self, user_answer):
-        """检查用户答案是否正确"""
+        """检查用户答案是否正确（超长答案或超出匹配时间预算时判为错误）"""
         if not self.solution_regex or not user_answer:
             return False
         
         # 标准化用户答案
         normalized_answer = self.normalize_latex_answer(user_answer)
-        
-        try:
-            # 使用正则表达式匹配
-            pattern = re.compile(self.solution_regex, re.IGNORECASE)
-            return bool(pattern.match(normalized_answer))
-        except re.error:
+        if len(normalized_answer) > max_input_length():
+            return False
+
+        pattern, _ = self.compiled_patterns()
+        if pattern is None:
             # 正则表达式错误，返回False
             return False
+
+        try:
+            with time_budget():
+                return bool(pattern.match(normalized_answer))
+        except RegexBudgetExceeded:
+            return False
     
     def get_hint_for_answer(self, user_answer):
         """根据用户答案获取相应的提示"""
         if not user_answer or not self.hints:
             return None
-        
-        # 遍历提示规则，找到匹配的错误模式
-        for hint in self.hints:
-            pattern = hint.get('pattern', '')
-            message = hint.get('message', '')
-            
-            if pattern and message:
-                try:
-                    if re.search(pattern, user_answer):
+        if len(user_answer) > max_input_length():
+            return GENERIC_HINT
+
+        # 遍历提示规则，找到匹配的错误模式（全部规则共享一个时间预算）
+        _, hint_patterns = self.compiled_patterns()
+        try:
+            with time_budget():
+                for pattern, message in hint_patterns:
+                    if pattern.search(user_answer):
                         return message
-                except re.error:
-                    continue
-        
+        except RegexBudgetExceeded:
+            pass
+
         # 如果没有匹配的特定提示，返回通用提示
-        return "请检查您的LaTeX语法，确保命令和括号使用正确。"
+        return GENERIC_HINT
     
     def add_hint(self, pattern, message):
         """添加错误提示规则"""
@@ -0,0 +1,126 @@
+"""
+练习题索引模型 - LaTeX 速成训练器
+由 lessons.cards 中的练习卡片派生的扁平集合，便于在数据库中筛选和分页
+"""
+import re
+from pymongo import ReplaceOne
+from app import get_db
+
+
+# 从目标公式中提取 LaTeX 命令作为主题
+COMMAND_PATTERN = re.compile(r'\\([a-zA-Z]+)')
+
+
+def extract_topics(card):
+    """
+    获取练习卡片的主题标签
+
+    卡片显式提供 topics 时直接使用，否则从目标公式中提取用到的 LaTeX 命令
+    （如 frac、sqrt）以及上标/下标结构。
+    """
+    if card.get('topics'):
+        return sorted(set(card['topics']))
+
+    formula = card.get('target_formula', '')
+    topics = set(COMMAND_PATTERN.findall(formula))
+    if '^' in formula:
+        topics.add('superscript')
+    if '_' in formula:
+        topics.add('subscript')
+    return sorted(topics)
+
+
+class PracticeItem:
+    """练习题索引模型类 - 每个练习卡片对应一条记录"""
+
+    @staticmethod
+    def item_id(lesson_id, card_index):
+        """练习题ID，与 /api/practice/list 返回的 id 格式一致"""
+        return f"{lesson_id}_{card_index}"
+
+    @classmethod
+    def build_items(cls, lesson):
+        """从课程文档构建该课程的全部练习题索引记录"""
+        items = []
+        for card_index, card in enumerate(lesson.get('cards', [])):
+            if card.get('type') != 'practice':
+                continue
+            items.append({
+                '_id': cls.item_id(lesson['_id'], card_index),
+                'lesson_id': lesson['_id'],
+                'lesson_sequence': lesson.get('sequence'),
+                'lesson_title': lesson.get('title'),
+                'lesson_title_en': lesson.get('title_en'),
+                'card_index': card_index,
+                'question': card.get('question', ''),
+                'target_formula': card.get('target_formula', ''),
+                'hints': card.get('hints', []),
+                'difficulty': card.get('difficulty', 'medium'),
+                'topics': extract_topics(card)
+            })
+        return items
+
+    @classmethod
+    def sync_lessons(cls, db=None, lesson_ids=None, lessons=None):
+        """
+        根据课程数据重建练习题索引
+
+        Args:
+            db: 数据库实例，默认使用应用数据库
+            lesson_ids: 需要同步的课程ID列表，None 表示同步全部课程
+            lessons: 已加载的对应课程文档，传入时不再查询 lessons 集合
+
+        Returns:
+            int: 同步后的练习题数量
+        """
+        db = db if db is not None else get_db()
+
+        if lessons is None:
+            lesson_filter = {} if lesson_ids is None else {'_id': {'$in': list(lesson_ids)}}
+            lessons = db.lessons.find(lesson_filter)
+
+        items = []
+        for lesson in lessons:
+            items.extend(cls.build_items(lesson))
+
+        if items:
+            db.practice_items.bulk_write(
+                [ReplaceOne({'_id': item['_id']}, item, upsert=True) for item in items],
+                ordered=False
+            )
+
+        # 删除已不存在的卡片或课程对应的记录
+        stale_filter = {'_id': {'$nin': [item['_id'] for item in items]}}
+        if lesson_ids is not None:
+            stale_filter['lesson_id'] = {'$in': list(lesson_ids)}
+        db.practice_items.delete_many(stale_filter)
+
+        return len(items)
+
+    @classmethod
+    def build_filter(cls, lesson_id=None, difficulty=None, topic=None):
+        """构建练习题筛选条件"""
+        query = {}
+        if lesson_id:
+            query['lesson_id'] = lesson_id
+        if difficulty:
+            query['difficulty'] = difficulty
+        if topic:
+            query['topics'] = topic
+        return query
+
+    @classmethod
+    def find(cls, query, skip=0, limit=0):
+        """按筛选条件分页查询练习题，按课程序号和卡片顺序排序"""
+        db = get_db()
+        cursor = db.practice_items.find(query).sort([('lesson_sequence', 1), ('card_index', 1)])
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    @classmethod
+    def count(cls, query):
+        """统计符合条件的练习题数量"""
+        return get_db().practice_items.count_documents(query)
@@ -4,16 +4,148 @@
 """
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from app import get_db
 
 
+def sm2_schedule(easiness_factor, repetitions, last_interval_days, is_correct, quality=3, now=None):
+    """
+    SM-2 算法：根据一次作答计算新的复习计划（纯函数，不访问数据库）
+
+    Args:
+        easiness_factor, repetitions, last_interval_days: 作答前的复习状态
+        is_correct (bool): 用户是否回答正确
+        quality (int): 回答质量 (0-5)
+        now (datetime): 作答时间，默认当前时间
+
+    Returns:
+        dict: easiness_factor、repetitions、last_interval_days、next_review_date
+    """
+    now = now or datetime.utcnow()
+    if is_correct:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = round(last_interval_days * easiness_factor)
+        repetitions += 1
+    else:
+        # 回答错误，重置重复次数，明天再复习
+        interval = 1
+        repetitions = 0
+
+    return {
+        'easiness_factor': max(1.3, easiness_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))),
+        'repetitions': repetitions,
+        'last_interval_days': interval,
+        'next_review_date': now + timedelta(days=interval)
+    }
+
+
+def sm2_update_pipeline(is_correct, quality=3, now=None):
+    """
+    与 sm2_schedule 等价的聚合管道更新，在数据库中根据文档当前的复习状态计算新计划
+
+    配合 upsert 使用时，一次写操作即可原子地完成"读取状态 - 计算 - 写回"。
+    文档不存在时按初始状态（E-Factor 2.5、重复 0 次、间隔 0 天）计算。
+    last_reviewed_at 记录已计入的最晚作答时间，离线同步据此判断作答是否晚于当前状态。
+    管道更新和 $round 需要 MongoDB 4.2 及以上。
+    """
+    now = now or datetime.utcnow()
+    easiness_factor = {'$ifNull': ['$easiness_factor', 2.5]}
+    repetitions = {'$ifNull': ['$repetitions', 0]}
+    if is_correct:
+        interval = {'$switch': {
+            'branches': [
+                {'case': {'$eq': [repetitions, 0]}, 'then': 1},
+                {'case': {'$eq': [repetitions, 1]}, 'then': 6},
+            ],
+            'default': {'$round': [{'$multiply': [{'$ifNull': ['$last_interval_days', 0]}, easiness_factor]}, 0]}
+        }}
+        new_repetitions = {'$add': [repetitions, 1]}
+    else:
+        interval = 1
+        new_repetitions = 0
+
+    return [
+        # 间隔依赖作答前的 E-Factor 和重复次数，先于它们计算
+        {'$set': {'last_interval_days': interval}},
+        {'$set': {
+            'easiness_factor': {'$max': [1.3, {'$add': [
+                easiness_factor, 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+            ]}]},
+            'repetitions': new_repetitions,
+            'next_review_date': {'$add': [now, {'$multiply': ['$last_interval_days', 24 * 60 * 60 * 1000]}]},
+            'last_reviewed_at': {'$max': ['$last_reviewed_at', now]},
+            'updated_at': datetime.utcnow(),
+            'created_at': {'$ifNull': ['$created_at', datetime.utcnow()]}
+        }}
+    ]
+
+
+def replay_schedule(events):
+    """
+    按时间顺序依次应用一组作答，返回最终的复习状态
+
+    Args:
+        events: [(作答时间, is_correct, quality, ...), ...]，多余的字段忽略
+
+    Returns:
+        dict | None: sm2_schedule 的结果，另加最后一次作答的时间 last_reviewed_at；没有作答时返回 None
+    """
+    state = None
+    for answered_at, is_correct, quality, *_ in sorted(events, key=lambda event: event[0]):
+        state = sm2_schedule(
+            state['easiness_factor'] if state else 2.5, state['repetitions'] if state else 0,
+            state['last_interval_days'] if state else 0, is_correct, quality, answered_at
+        )
+        state['last_reviewed_at'] = answered_at
+    return state
+
+
+def card_review_events(db, user_id, lesson_id, card_index, review_ids=()):
+    """
+    一张卡片上影响复习计划的全部作答：练习记录（submit / sync）和复习提交（/reviews/submit）
+
+    Returns:
+        list: [(作答时间, is_correct, quality, 练习记录ID或None), ...]
+    """
+    events = [
+        (record['submitted_at'], record['is_correct'], 4 if record['is_correct'] else 1, record['_id'])
+        for record in db.practice_records.find(
+            {'user_id': ObjectId(user_id), 'lesson_id': ObjectId(lesson_id), 'card_index': card_index},
+            {'submitted_at': 1, 'is_correct': 1}
+        )
+        if record.get('submitted_at') is not None
+    ]
+    if review_ids:
+        events.extend(
+            (submission['submitted_at'], submission['is_correct'], submission.get('quality', 3), None)
+            for submission in db.review_submissions.find(
+                {'review_id': {'$in': [ObjectId(review_id) for review_id in review_ids]}},
+                {'submitted_at': 1, 'is_correct': 1, 'quality': 1}
+            )
+        )
+    return events
+
+
 class Review:
-    """复习模型类 - 实现SM-2间隔复习算法"""
+    """
+    复习模型类 - 实现SM-2间隔复习算法
+
+    每个 (用户, 课程, 卡片) 一条复习记录（唯一索引），同一卡片的多次作答更新同一条记录；
+    practice_id 为该卡片最近一次作答的练习记录。
+    """
     
     def __init__(self, user_id=None, practice_id=None, next_review_date=None, 
-                 easiness_factor=2.5, repetitions=0, last_interval_days=0, _id=None, created_at=None):
+                 easiness_factor=2.5, repetitions=0, last_interval_days=0, _id=None, created_at=None,
+                 lesson_id=None, card_index=None):
         self._id = _id or ObjectId()
         self.user_id = str(user_id) if user_id else None
+        self.lesson_id = str(lesson_id) if lesson_id else None
+        self.card_index = card_index
         self.practice_id = str(practice_id) if practice_id else None
         self.next_review_date = next_review_date or datetime.utcnow()
         self.easiness_factor = easiness_factor  # SM-2算法的E-Factor，初始值2.5
@@ -26,6 +158,8 @@ class Review:
         return {
             '_id': str(self._id),
             'user_id': self.user_id,
+            'lesson_id': self.lesson_id,
+            'card_index': self.card_index,
             'practice_id': self.practice_id,
             'next_review_date': self.next_review_date.isoformat(),
             'easiness_factor': self.easiness_factor,
@@ -40,6 +174,8 @@ class Review:
         review = cls()
         review._id = data.get('_id', ObjectId())
         review.user_id = data.get('user_id')
+        review.lesson_id = data.get('lesson_id')
+        review.card_index = data.get('card_index')
         review.practice_id = data.get('practice_id')
         
         # 处理日期字段
@@ -62,7 +198,7 @@ class Review:
         return review
     
     def save(self):
-        """保存复习记录到数据库"""
+        """保存复习记录到数据库（按 _id 一次 upsert）"""
         db = get_db()
         review_data = {
             'user_id': self.user_id,
@@ -71,35 +207,29 @@ class Review:
             'easiness_factor': self.easiness_factor,
             'repetitions': self.repetitions,
             'last_interval_days': self.last_interval_days,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'updated_at': datetime.utcnow()
         }
-        
-        # 检查是否是更新操作（_id存在且在数据库中存在）
-        if self._id and db.reviews.find_one({'_id': self._id}):
-            # 更新现有复习记录
-            result = db.reviews.update_one(
-                {'_id': self._id},
-                {'$set': review_data}
-            )
-            return result.modified_count > 0
-        else:
-            # 创建新复习记录
-            result = db.reviews.insert_one(review_data)
-            self._id = result.inserted_id
-            return True
-    
-    @classmethod
-    def find_by_user_and_practice(cls, user_id, practice_id):
-        """根据用户ID和练习ID查找复习记录"""
-        db = get_db()
-        review_data = db.reviews.find_one({
-            'user_id': str(user_id),
-            'practice_id': str(practice_id)
-        })
-        if review_data:
-            return cls.from_dict(review_data)
-        return None
-    
+        if self.lesson_id is not None:
+            review_data['lesson_id'] = self.lesson_id
+            review_data['card_index'] = self.card_index
+
+        result = db.reviews.update_one({'_id': self._id}, {'$set': review_data}, upsert=True)
+        return result.matched_count > 0 or result.upserted_id is not None
+
+    @staticmethod
+    def card_key(user_id, lesson_id, card_index):
+        """复习记录的唯一键 (用户, 课程, 卡片)"""
+        return {'user_id': str(user_id), 'lesson_id': str(lesson_id), 'card_index': card_index}
+
+    @staticmethod
+    def attempt_update(practice_id, is_correct, quality=3, answered_at=None):
+        """一次作答对应的管道更新：按 SM-2 计算新计划，并记录最近一次作答的练习记录"""
+        pipeline = sm2_update_pipeline(is_correct, quality, answered_at)
+        if practice_id is not None:
+            pipeline.append({'$set': {'practice_id': str(practice_id)}})
+        return pipeline
+
     @classmethod
     def get_due_reviews(cls, user_id, date=None):
         """获取用户到期的复习任务"""
@@ -131,50 +261,140 @@ class Review:
     
     def update_review_schedule(self, is_correct, quality=3):
         """
-        根据SM-2算法更新复习计划
+        根据SM-2算法更新复习计划（一次原子的管道更新，以数据库中的当前状态为准）
         
         Args:
             is_correct (bool): 用户是否回答正确
             quality (int): 回答质量 (0-5)，3表示勉强正确，5表示完美
         """
-        if is_correct:
-            if self.repetitions == 0:
-                interval = 1
-            elif self.repetitions == 1:
-                interval = 6
-            else:
-                interval = round(self.last_interval_days * self.easiness_factor)
-            
-            self.repetitions += 1
-            self.last_interval_days = interval
-            self.next_review_date = datetime.utcnow() + timedelta(days=interval)
-        else:
-            # 回答错误，重置重复次数，明天再复习
-            self.repetitions = 0
-            self.last_interval_days = 1
-            self.next_review_date = datetime.utcnow() + timedelta(days=1)
-        
-        # 更新难度因子
-        self.easiness_factor = max(1.3, self.easiness_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
-        
-        return self.save()
-    
+        db = get_db()
+        updated = db.reviews.find_one_and_update(
+            {'_id': self._id},
+            self.attempt_update(None, is_correct, quality),
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            return False
+        self.easiness_factor = updated['easiness_factor']
+        self.repetitions = updated['repetitions']
+        self.last_interval_days = updated['last_interval_days']
+        self.next_review_date = updated['next_review_date']
+        return True
+
     @classmethod
-    def create_or_update_review(cls, user_id, practice_id, is_correct, quality=3):
-        """创建或更新复习记录"""
-        # 查找现有记录
-        existing_review = cls.find_by_user_and_practice(user_id, practice_id)
-        
-        if existing_review:
-            # 更新现有记录
-            existing_review.update_review_schedule(is_correct, quality)
-            return existing_review
-        else:
-            # 创建新记录
-            review = cls(user_id=user_id, practice_id=practice_id)
-            review.update_review_schedule(is_correct, quality)
-            return review
-    
+    def record_attempt(cls, user_id, lesson_id, card_index, practice_id, is_correct, quality=3, answered_at=None):
+        """
+        记录一次练习作答：按 (用户, 课程, 卡片) 一次 find_one_and_update upsert 创建或更新复习记录
+
+        两个请求同时创建同一卡片的复习记录时，唯一索引拒绝其中一个插入，重试即为普通更新。
+        """
+        db = get_db()
+        arguments = (
+            cls.card_key(user_id, lesson_id, card_index),
+            cls.attempt_update(practice_id, is_correct, quality, answered_at)
+        )
+        try:
+            review_data = db.reviews.find_one_and_update(*arguments, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            review_data = db.reviews.find_one_and_update(*arguments, upsert=True, return_document=ReturnDocument.AFTER)
+        return cls.from_dict(review_data)
+
+    @classmethod
+    def bulk_upsert_reviews(cls, user_id, attempts):
+        """
+        批量记录练习作答（离线同步），同一卡片的作答按作答时间依次计算
+
+        作答晚于复习记录的 last_reviewed_at 时直接接在当前状态之后，这些卡片一次 bulk_write 完成；
+        离线作答在同一卡片更新的作答之后才同步时，把较早的作答接在较新的状态之后会得到错误的计划，
+        这些卡片改为按全部作答的时间顺序重放（replay_card）。
+
+        Args:
+            user_id: 用户ID
+            attempts: [(lesson_id, card_index, practice_id, is_correct, quality, 作答时间), ...]，
+                      练习记录已写入数据库
+
+        Returns:
+            int: 记录的作答数
+        """
+        if not attempts:
+            return 0
+        attempts = sorted(attempts, key=lambda attempt: attempt[5])
+        earliest = {}
+        for lesson_id, card_index, _, _, _, answered_at in attempts:
+            earliest.setdefault((str(lesson_id), card_index), answered_at)
+
+        db = get_db()
+        replayed = set()
+        for review in db.reviews.find(
+            {'$or': [cls.card_key(user_id, lesson_id, card_index) for lesson_id, card_index in earliest]},
+            {'lesson_id': 1, 'card_index': 1, 'last_reviewed_at': 1, 'updated_at': 1}
+        ):
+            key = (review['lesson_id'], review['card_index'])
+            # 没有 last_reviewed_at 的旧复习记录以最后写入时间为准
+            reviewed_at = review.get('last_reviewed_at') or review.get('updated_at')
+            if reviewed_at is not None and reviewed_at > earliest[key]:
+                replayed.add(key)
+
+        operations = [
+            UpdateOne(
+                cls.card_key(user_id, lesson_id, card_index),
+                cls.attempt_update(practice_id, is_correct, quality, answered_at),
+                upsert=True
+            )
+            for lesson_id, card_index, practice_id, is_correct, quality, answered_at in attempts
+            if (str(lesson_id), card_index) not in replayed
+        ]
+
+        # 按顺序执行（同一卡片的作答依次计算）；并发创建同一复习记录时从失败的操作处重试
+        pending = operations
+        for _ in range(3):
+            if not pending:
+                break
+            try:
+                db.reviews.bulk_write(pending, ordered=True)
+                break
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if not errors or errors[0].get('code') != 11000:
+                    raise
+                pending = pending[errors[0]['index']:]
+
+        for lesson_id, card_index in replayed:
+            cls.replay_card(db, user_id, lesson_id, card_index)
+        return len(attempts)
+
+    @classmethod
+    def replay_card(cls, db, user_id, lesson_id, card_index):
+        """
+        按时间顺序重放卡片的全部作答（练习记录和复习提交），重写复习记录的计划
+
+        以读取时的 last_reviewed_at 为条件写回；期间有新的作答写入时重新读取并重放。
+
+        Returns:
+            bool: 是否已重写
+        """
+        key = cls.card_key(user_id, lesson_id, card_index)
+        for _ in range(3):
+            review = db.reviews.find_one(key, {'last_reviewed_at': 1})
+            if review is None:
+                return False
+            events = card_review_events(db, user_id, lesson_id, card_index, [review['_id']])
+            state = replay_schedule(events)
+            if state is None:
+                return False
+            fields = dict(state, updated_at=datetime.utcnow())
+            latest_practice = max((event for event in events if event[3] is not None),
+                                  key=lambda event: event[0], default=None)
+            if latest_practice is not None:
+                fields['practice_id'] = str(latest_practice[3])
+            result = db.reviews.update_one(
+                {'_id': review['_id'], 'last_reviewed_at': review.get('last_reviewed_at')},
+                {'$set': fields}
+            )
+            if result.matched_count:
+                return True
+        return False
+
     @classmethod
     def find_by_id(cls, review_id):
         """根据ID查找复习记录"""
@@ -2,15 +2,166 @@
 课程路由 - LaTeX 速成训练器
 处理课程相关的API请求
 """
-from flask import Blueprint, request, jsonify
+import hashlib
+import json
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from app.models.lesson import Lesson
+from app.models.lesson import LESSON_FIELD_SOURCES, LESSON_VIEWS, strip_derived_card_fields
+from app.models.lesson_catalog import lesson_catalog, normalize_render_language
 from app.models.user import User
+from app.utils.compression import representation_etags
+from app.utils.lesson_resolver import resolve_lesson
 
 lessons_bp = Blueprint('lessons', __name__)
 
 
+def parse_lesson_fields():
+    """
+    解析 view=summary|full 和 fields=a,b,c 查询参数
+
+    Returns:
+        tuple | None: 需要输出的字段，None 表示完整视图
+
+    Raises:
+        ValueError: 视图或字段名无效
+    """
+    fields_arg = request.args.get('fields')
+    if fields_arg:
+        requested = {field.strip() for field in fields_arg.split(',') if field.strip()}
+        unknown = requested - set(LESSON_FIELD_SOURCES)
+        if unknown:
+            raise ValueError(f'未知字段: {", ".join(sorted(unknown))}')
+        requested.add('id')  # 始终返回课程ID，便于客户端叠加用户状态
+        fields = tuple(field for field in LESSON_FIELD_SOURCES if field in requested)
+    else:
+        view = request.args.get('view', 'full')
+        if view not in LESSON_VIEWS:
+            raise ValueError(f'未知视图: {view}')
+        fields = LESSON_VIEWS[view]
+
+    return None if fields == LESSON_VIEWS['full'] else fields
+
+
+def render_lesson_with_user_state(snapshot, lesson, language, user, fields=None):
+    """拼接缓存的课程 JSON 片段与用户相关字段"""
+    user_state = json.dumps({
+        'is_completed': user.is_lesson_completed(lesson['_id']),
+        'is_unlocked': True  # 暂时所有课程都解锁，后续可以实现线性解锁
+    }, separators=(',', ':'))
+    fragment = snapshot.render(lesson, language, fields)
+    separator = b',' if len(fragment) > 1 else b''
+    return fragment + separator + user_state[1:].encode('utf-8')
+
+
+def json_bytes_response(body, status=200):
+    """返回已序列化好的 JSON 字节"""
+    return Response(body, status=status, mimetype='application/json')
+
+
+def representation_etag(base, language, user=None, fields=None):
+    """
+    在基础 ETag 上附加语言、字段列表和用户状态
+
+    fields 不为 None 时附加字段列表的摘要；传入 user 时附加其已完成课程集合的摘要，
+    用于包含用户状态的响应。
+    """
+    etag = f'{base}-{normalize_render_language(language)}'
+    if fields is not None:
+        etag += '-f' + hashlib.sha1(','.join(fields).encode('utf-8')).hexdigest()[:8]
+    if user is not None:
+        completed = ','.join(sorted(str(lesson_id) for lesson_id in user.progress.get('completed_lessons', [])))
+        etag += '-' + hashlib.sha1(completed.encode('utf-8')).hexdigest()[:12]
+    return etag
+
+
+def catalog_etag(snapshot, language, user=None, fields=None):
+    """根据课程目录版本和语言生成强 ETag"""
+    return representation_etag(f'lessons-v{snapshot.version}', language, user, fields)
+
+
+def lesson_etag(snapshot, lesson, language, user=None, fields=None):
+    """
+    单个课程的强 ETag
+
+    基于课程的内容哈希生成，修改其他课程不会使其失效；
+    缺少内容哈希的旧数据退回使用目录版本号。
+    """
+    content_hash = lesson.get('content_hash')
+    if content_hash:
+        base = f'lesson-{lesson["_id"]}-s{lesson.get("sequence")}-{content_hash[:16]}'
+    else:
+        base = f'lessons-v{snapshot.version}-{lesson["_id"]}'
+    return representation_etag(base, language, user, fields)
+
+
+def conditional_json_response(etag, build_body, cache_control):
+    """命中 If-None-Match 时返回 304，否则才构建响应体"""
+    if any(request.if_none_match.contains(tag) for tag in representation_etags(etag)):
+        response = Response(status=304)
+    else:
+        response = json_bytes_response(build_body())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+@lessons_bp.route('/catalog', methods=['GET'])
+def get_lesson_catalog():
+    """
+    获取与用户无关的课程目录
+
+    响应不含任何用户状态，可以被浏览器和中间缓存共享；
+    客户端配合 /user-state 返回的完成状态叠加显示。
+    """
+    try:
+        lang = request.args.get('lang', 'zh-CN')
+        try:
+            fields = parse_lesson_fields()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        snapshot = lesson_catalog.snapshot()
+
+        def build_body():
+            lessons_data = [snapshot.render(lesson, lang, fields) + b'}' for lesson in snapshot.lessons]
+            return (b'{"lessons":[' + b','.join(lessons_data) + b'],"total_count":' +
+                    str(len(lessons_data)).encode() + b',"version":' + str(snapshot.version).encode() + b'}')
+
+        return conditional_json_response(
+            catalog_etag(snapshot, lang, fields=fields), build_body, 'public, no-cache'
+        )
+
+    except Exception as e:
+        return jsonify({'message': f'服务器错误: {str(e)}'}), 500
+
+
+@lessons_bp.route('/user-state', methods=['GET'])
+@jwt_required()
+def get_lessons_user_state():
+    """获取当前用户在各课程上的状态（叠加在 /catalog 之上）"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.find_by_id(current_user_id)
+
+        if not user:
+            return jsonify({'message': '用户不存在'}), 404
+
+        snapshot = lesson_catalog.snapshot()
+        return jsonify({
+            'version': snapshot.version,
+            'lessons': {
+                str(lesson['_id']): {
+                    'is_completed': user.is_lesson_completed(lesson['_id']),
+                    'is_unlocked': True  # 暂时所有课程都解锁
+                }
+                for lesson in snapshot.lessons
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'服务器错误: {str(e)}'}), 500
+
+
 @lessons_bp.route('', methods=['GET', 'OPTIONS'])
 def get_lessons():
     """获取课程列表"""
@@ -36,25 +187,26 @@ def get_lessons():
         if not user:
             return jsonify({'message': '用户不存在'}), 404
 
-        # 获取语言参数
+        # 获取语言参数和字段投影（view=summary 时不输出任何卡片数据）
         lang = request.args.get('lang', 'zh-CN')
+        try:
+            fields = parse_lesson_fields()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
 
-        # 获取所有课程
-        lessons = Lesson.get_all_lessons()
+        # 拼接预先序列化的课程片段和用户进度信息，避免每次请求重新构建并序列化课程
+        snapshot = lesson_catalog.snapshot()
 
-        # 转换为字典格式并添加用户进度信息
-        lessons_data = []
-        for lesson in lessons:
-            # 使用数据库中的翻译数据
-            lesson_dict = lesson.to_dict(language=lang)
-            lesson_dict['is_completed'] = user.is_lesson_completed(lesson._id)
-            lesson_dict['is_unlocked'] = True  # 暂时所有课程都解锁，后续可以实现线性解锁
-            lessons_data.append(lesson_dict)
+        def build_body():
+            lessons_data = [
+                render_lesson_with_user_state(snapshot, lesson, lang, user, fields)
+                for lesson in snapshot.lessons
+            ]
+            return b'{"lessons":[' + b','.join(lessons_data) + b'],"total_count":' + str(len(lessons_data)).encode() + b'}'
 
-        return jsonify({
-            'lessons': lessons_data,
-            'total_count': len(lessons_data)
-        }), 200
+        return conditional_json_response(
+            catalog_etag(snapshot, lang, user, fields), build_body, 'private, no-cache'
+        )
 
     except Exception as e:
         return jsonify({'message': f'服务器错误: {str(e)}'}), 500
@@ -77,38 +229,140 @@ def get_lesson(lesson_id):
         if not user:
             return jsonify({'message': '用户不存在'}), 404
 
-        # 支持两种格式的lesson_id：ObjectId 和 lesson-{sequence}
-        lesson = None
+        # 支持 ObjectId 和 lesson-{sequence} 两种格式的lesson_id
+        lesson = resolve_lesson(lesson_id)
+
+        if not lesson:
+            return jsonify({'message': '课程不存在'}), 400
 
-        # 尝试作为ObjectId查找
         try:
-            ObjectId(lesson_id)
-            lesson = Lesson.find_by_id(lesson_id)
-        except:
-            # 如果不是ObjectId，尝试作为lesson-{sequence}格式解析
-            if lesson_id.startswith('lesson-'):
-                try:
-                    sequence = int(lesson_id.replace('lesson-', ''))
-                    lesson = Lesson.find_by_sequence(sequence)
-                except ValueError:
-                    pass
+            fields = parse_lesson_fields()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        # 拼接预先序列化的课程片段和用户进度信息
+        snapshot = lesson_catalog.snapshot()
+        etag = lesson_etag(snapshot, lesson, 'zh-CN', user, fields)
+        return conditional_json_response(
+            etag,
+            lambda: b'{"lesson":' + render_lesson_with_user_state(snapshot, lesson, 'zh-CN', user, fields) + b'}',
+            'private, no-cache'
+        )
+
+    except Exception as e:
+        return jsonify({'message': f'服务器错误: {str(e)}'}), 500
+
+
+# 分页加载卡片的默认和最大每页数量
+DEFAULT_CARD_PAGE_SIZE = 5
+MAX_CARD_PAGE_SIZE = 50
+
+
+def localized_cards(lesson, language):
+    """按语言选择课程卡片（与 Lesson.to_dict 的选择规则一致）"""
+    if language == 'en-US' and lesson.get('title_en') and lesson.get('cards_en'):
+        return lesson['cards_en']
+    return lesson.get('cards', [])
+
+
+def parse_card_page_args():
+    """
+    解析卡片分页参数 offset / limit
+
+    Raises:
+        ValueError: 参数不是合法的非负整数
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', DEFAULT_CARD_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('offset 和 limit 必须是整数')
+    if offset < 0 or limit < 1:
+        raise ValueError('offset 不能为负数，limit 必须大于0')
+    return offset, min(limit, MAX_CARD_PAGE_SIZE)
+
+
+@lessons_bp.route('/<lesson_id>/header', methods=['GET'])
+@jwt_required()
+def get_lesson_header(lesson_id):
+    """获取课程头信息：基本信息、卡片数量和类型，不含卡片内容"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.find_by_id(current_user_id)
+
+        if not user:
+            return jsonify({'message': '用户不存在'}), 404
 
+        lesson = resolve_lesson(lesson_id)
         if not lesson:
             return jsonify({'message': '课程不存在'}), 400
 
-        # 转换为字典格式并添加用户进度信息
-        lesson_dict = lesson.to_dict()
-        lesson_dict['is_completed'] = user.is_lesson_completed(lesson._id)
-        lesson_dict['is_unlocked'] = True  # 暂时所有课程都解锁
+        lang = request.args.get('lang', 'zh-CN')
+        use_english = lang == 'en-US' and lesson.get('title_en')
+        card_types = [card.get('type') for card in localized_cards(lesson, lang)]
 
         return jsonify({
-            'lesson': lesson_dict
+            'id': str(lesson['_id']),
+            'title': lesson['title_en'] if use_english else lesson.get('title'),
+            'description': lesson.get('description_en') if use_english else lesson.get('description'),
+            'sequence': lesson.get('sequence'),
+            'total_cards': len(card_types),
+            'knowledge_count': card_types.count('knowledge'),
+            'practice_count': card_types.count('practice'),
+            'card_types': card_types,
+            'has_translation': bool(lesson.get('title_en')),
+            'is_completed': user.is_lesson_completed(lesson['_id']),
+            'is_unlocked': True  # 暂时所有课程都解锁
         }), 200
 
     except Exception as e:
         return jsonify({'message': f'服务器错误: {str(e)}'}), 500
 
 
+@lessons_bp.route('/<lesson_id>/cards', methods=['GET'])
+@jwt_required()
+def get_lesson_cards(lesson_id):
+    """
+    分页获取课程卡片
+
+    客户端先通过 /header 获取卡片数量和类型，再随学习进度按 offset/limit 逐页加载卡片。
+    卡片直接从课程目录缓存中切片，不必加载和序列化整个课程。
+    """
+    try:
+        lesson = resolve_lesson(lesson_id)
+        if not lesson:
+            return jsonify({'message': '课程不存在'}), 400
+
+        try:
+            offset, limit = parse_card_page_args()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        lang = request.args.get('lang', 'zh-CN')
+        snapshot = lesson_catalog.snapshot()
+
+        def build_body():
+            cards = localized_cards(lesson, lang)
+            page = [
+                {'index': index, **card}
+                for index, card in enumerate(strip_derived_card_fields(cards[offset:offset + limit]), start=offset)
+            ]
+            return json.dumps({
+                'lesson_id': str(lesson['_id']),
+                'offset': offset,
+                'limit': limit,
+                'total_cards': len(cards),
+                'has_more': offset + len(page) < len(cards),
+                'cards': page
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        etag = f'{lesson_etag(snapshot, lesson, lang)}-cards-{offset}-{limit}'
+        return conditional_json_response(etag, build_body, 'private, no-cache')
+
+    except Exception as e:
+        return jsonify({'message': f'服务器错误: {str(e)}'}), 500
+
+
 @lessons_bp.route('/<lesson_id>/complete', methods=['POST'])
 @jwt_required()
 def complete_lesson(lesson_id):
@@ -120,21 +374,8 @@ def complete_lesson(lesson_id):
         if not user:
             return jsonify({'message': '用户不存在'}), 404
 
-        # 支持两种格式的lesson_id：ObjectId 和 lesson-{sequence}
-        lesson = None
-
-        # 尝试作为ObjectId查找
-        try:
-            ObjectId(lesson_id)
-            lesson = Lesson.find_by_id(lesson_id)
-        except:
-            # 如果不是ObjectId，尝试作为lesson-{sequence}格式解析
-            if lesson_id.startswith('lesson-'):
-                try:
-                    sequence = int(lesson_id.replace('lesson-', ''))
-                    lesson = Lesson.find_by_sequence(sequence)
-                except ValueError:
-                    pass
+        # 支持 ObjectId 和 lesson-{sequence} 两种格式的lesson_id
+        lesson = resolve_lesson(lesson_id)
 
         if not lesson:
             return jsonify({'message': '课程不存在'}), 400
@@ -145,13 +386,13 @@ def complete_lesson(lesson_id):
 
         # 获取课程中的所有练习题
         practice_cards = []
-        for i, card in enumerate(lesson.cards):
+        for i, card in enumerate(lesson['cards']):
             if card.get('type') == 'practice':
                 practice_cards.append(i)
 
         if not practice_cards:
             # 如果没有练习题，可以直接完成
-            if user.update_progress(str(lesson._id), completed=True):
+            if user.update_progress(str(lesson['_id']), completed=True):
                 return jsonify({
                     'message': '课程完成状态已更新',
                     'lesson_id': lesson_id,
@@ -163,7 +404,7 @@ def complete_lesson(lesson_id):
         # 检查用户是否完成了所有练习题
         user_progress = db.user_progress.find_one({
             'user_id': ObjectId(current_user_id),
-            'lesson_id': lesson._id
+            'lesson_id': lesson['_id']
         })
 
         if not user_progress:
@@ -191,7 +432,7 @@ def complete_lesson(lesson_id):
             }), 400
 
         # 所有练习题都已完成，可以完成课程
-        if user.update_progress(str(lesson._id), completed=True):
+        if user.update_progress(str(lesson['_id']), completed=True):
             return jsonify({
                 'message': '恭喜！课程已完成，您已掌握所有知识点',
                 'lesson_id': lesson_id,
@@ -206,6 +447,105 @@ def complete_lesson(lesson_id):
         return jsonify({'message': f'服务器错误: {str(e)}'}), 500
 
 
+def build_completion_status(lesson, user_progress, user):
+    """
+    根据课程卡片布局和用户进度计算课程完成状态
+
+    Args:
+        lesson: 课程文档
+        user_progress: 该用户在此课程上的 user_progress 文档（可为 None）
+        user: 用户实例（可为 None）
+    """
+    # 获取课程中的所有练习题
+    practice_cards = []
+    for i, card in enumerate(lesson['cards']):
+        if card.get('type') == 'practice':
+            practice_cards.append({
+                'index': i,
+                'title': card.get('title', f'练习题 {i+1}'),
+                'target_formula': card.get('target_formula', '')
+            })
+
+    cards_progress = user_progress.get('cards_progress', {}) if user_progress else {}
+    completed_practices = []
+    pending_practices = []
+
+    for practice in practice_cards:
+        card_progress = cards_progress.get(str(practice['index']))
+        if card_progress and card_progress.get('completed', False):
+            completed_practices.append({
+                **practice,
+                'completed_at': card_progress.get('first_completed_at'),
+                'attempts': card_progress.get('attempts', 0)
+            })
+        else:
+            pending_practices.append({
+                **practice,
+                'attempts': card_progress.get('attempts', 0) if card_progress else 0
+            })
+
+    total_practices = len(practice_cards)
+    completed_count = len(completed_practices)
+    can_complete = completed_count == total_practices and total_practices > 0
+
+    # 检查用户是否已经完成了课程
+    is_already_completed = user.is_lesson_completed(str(lesson['_id'])) if user else False
+
+    return {
+        'lesson_title': lesson['title'],
+        'total_practices': total_practices,
+        'completed_practices': completed_count,
+        'can_complete': can_complete,
+        'is_already_completed': is_already_completed,
+        'completion_percentage': round((completed_count / total_practices * 100) if total_practices > 0 else 100, 1),
+        'completed_practice_details': completed_practices,
+        'pending_practice_details': pending_practices
+    }
+
+
+@lessons_bp.route('/completion-status', methods=['GET'])
+@jwt_required()
+def get_all_lessons_completion_status():
+    """
+    批量获取所有课程的完成状态和进度
+
+    只查询一次 user_progress 和一次用户信息，在内存中与课程卡片布局合并，
+    替代逐课调用 /<lesson_id>/completion-status。
+    """
+    try:
+        current_user_id = get_jwt_identity()
+
+        from app import get_db
+        db = get_db()
+
+        lessons = lesson_catalog.all()
+        progress_by_lesson = {
+            str(progress['lesson_id']): progress
+            for progress in db.user_progress.find({
+                'user_id': ObjectId(current_user_id),
+                'lesson_id': {'$in': [lesson['_id'] for lesson in lessons]}
+            })
+        }
+        user = User.find_by_id(current_user_id)
+
+        statuses = {}
+        for lesson in lessons:
+            lesson_id = str(lesson['_id'])
+            statuses[lesson_id] = {
+                'lesson_id': lesson_id,
+                'sequence': lesson.get('sequence'),
+                **build_completion_status(lesson, progress_by_lesson.get(lesson_id), user)
+            }
+
+        return jsonify({
+            'lessons': statuses,
+            'total_count': len(statuses)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'服务器错误: {str(e)}'}), 500
+
+
 @lessons_bp.route('/<lesson_id>/completion-status', methods=['GET'])
 @jwt_required()
 def get_lesson_completion_status(lesson_id):
@@ -213,21 +553,8 @@ def get_lesson_completion_status(lesson_id):
     try:
         current_user_id = get_jwt_identity()
 
-        # 支持两种格式的lesson_id：ObjectId 和 lesson-{sequence}
-        lesson = None
-
-        # 尝试作为ObjectId查找
-        try:
-            ObjectId(lesson_id)
-            lesson = Lesson.find_by_id(lesson_id)
-        except:
-            # 如果不是ObjectId，尝试作为lesson-{sequence}格式解析
-            if lesson_id.startswith('lesson-'):
-                try:
-                    sequence = int(lesson_id.replace('lesson-', ''))
-                    lesson = Lesson.find_by_sequence(sequence)
-                except ValueError:
-                    pass
+        # 支持 ObjectId 和 lesson-{sequence} 两种格式的lesson_id
+        lesson = resolve_lesson(lesson_id)
 
         if not lesson:
             return jsonify({'message': '课程不存在'}), 400
@@ -235,64 +562,16 @@ def get_lesson_completion_status(lesson_id):
         from app import get_db
         db = get_db()
 
-        # 获取课程中的所有练习题
-        practice_cards = []
-        for i, card in enumerate(lesson.cards):
-            if card.get('type') == 'practice':
-                practice_cards.append({
-                    'index': i,
-                    'title': card.get('title', f'练习题 {i+1}'),
-                    'target_formula': card.get('target_formula', '')
-                })
-
         # 获取用户进度
         user_progress = db.user_progress.find_one({
             'user_id': ObjectId(current_user_id),
-            'lesson_id': lesson._id
+            'lesson_id': lesson['_id']
         })
-
-        completed_practices = []
-        pending_practices = []
-
-        for practice in practice_cards:
-            card_index = practice['index']
-            if user_progress:
-                card_progress = user_progress['cards_progress'].get(str(card_index))
-                if card_progress and card_progress.get('completed', False):
-                    completed_practices.append({
-                        **practice,
-                        'completed_at': card_progress.get('first_completed_at'),
-                        'attempts': card_progress.get('attempts', 0)
-                    })
-                else:
-                    pending_practices.append({
-                        **practice,
-                        'attempts': card_progress.get('attempts', 0) if card_progress else 0
-                    })
-            else:
-                pending_practices.append({
-                    **practice,
-                    'attempts': 0
-                })
-
-        total_practices = len(practice_cards)
-        completed_count = len(completed_practices)
-        can_complete = completed_count == total_practices and total_practices > 0
-
-        # 检查用户是否已经完成了课程
         user = User.find_by_id(current_user_id)
-        is_already_completed = user.is_lesson_completed(str(lesson._id)) if user else False
 
         return jsonify({
             'lesson_id': lesson_id,
-            'lesson_title': lesson.title,
-            'total_practices': total_practices,
-            'completed_practices': completed_count,
-            'can_complete': can_complete,
-            'is_already_completed': is_already_completed,
-            'completion_percentage': round((completed_count / total_practices * 100) if total_practices > 0 else 100, 1),
-            'completed_practice_details': completed_practices,
-            'pending_practice_details': pending_practices
+            **build_completion_status(lesson, user_progress, user)
         }), 200
 
     except Exception as e:
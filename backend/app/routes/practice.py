@@ -2,18 +2,48 @@
 练习路由 - LaTeX 速成训练器
 处理练习相关的API请求
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app
+import io
+import json
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from datetime import datetime
-import re
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from app.models.lesson import Lesson
+from app.models.lesson_catalog import lesson_catalog
+from app.models.practice_item import PracticeItem
 from app.models.user import User
+from app.utils.common_mistakes import targeted_hint
+from app.utils.grading_pool import grade_answer, normalize_answers
+from app.utils.latex_normalizer import normalized_target
+from app.utils.lesson_resolver import resolve_lesson
+from app.utils.write_behind import write_behind
 
 practice_bp = Blueprint('practice', __name__)
 
 
+@practice_bp.before_request
+def limit_request_size():
+    """
+    拒绝超过 PRACTICE_MAX_REQUEST_BYTES 的请求体，避免在解析 JSON 前就占用 worker
+
+    没有 Content-Length 的请求体（分块传输）由服务器标记为 wsgi.input_terminated，
+    werkzeug 会原样读到结束：这里最多读取上限加一个字节，超过即拒绝，未超过的请求体
+    放回 environ 供后续解析。
+    """
+    max_bytes = current_app.config.get('PRACTICE_MAX_REQUEST_BYTES', 512 * 1024)
+    if request.content_length is not None:
+        if request.content_length > max_bytes:
+            return jsonify({'error': f'请求体过大（最多 {max_bytes} 字节）'}), 413
+    elif request.environ.get('wsgi.input_terminated'):
+        body = request.environ['wsgi.input'].read(max_bytes + 1)
+        if len(body) > max_bytes:
+            return jsonify({'error': f'请求体过大（最多 {max_bytes} 字节）'}), 413
+        request.environ['wsgi.input'] = io.BytesIO(body)
+
+
 @practice_bp.route('/submit', methods=['POST'])
 @jwt_required()
 def submit_practice():
@@ -30,28 +60,18 @@ def submit_practice():
 
         lesson_id = data['lesson_id']
         card_index = data['card_index']
+        if not isinstance(data['user_answer'], str):
+            return jsonify({'error': '答案格式无效'}), 400
         user_answer = data['user_answer'].strip()
+        max_length = current_app.config.get('PRACTICE_MAX_ANSWER_LENGTH', 2000)
+        if len(user_answer) > max_length:
+            return jsonify({'error': f'答案过长（最多 {max_length} 个字符）'}), 413
 
         from app import get_db
         db = get_db()
 
-        # 获取课程和练习题 - 支持两种格式的lesson_id
-        lesson = None
-        try:
-            # 首先尝试作为ObjectId查找
-            if ObjectId.is_valid(lesson_id):
-                lesson = db.lessons.find_one({'_id': ObjectId(lesson_id)})
-        except:
-            pass
-
-        if not lesson:
-            # 如果ObjectId查找失败，尝试按sequence查找（如lesson-1 -> sequence=1）
-            if lesson_id.startswith('lesson-'):
-                try:
-                    sequence = int(lesson_id.split('-')[1])
-                    lesson = db.lessons.find_one({'sequence': sequence})
-                except (ValueError, IndexError):
-                    pass
+        # 获取课程和练习题 - 支持 ObjectId 和 lesson-{sequence} 两种格式的lesson_id
+        lesson = resolve_lesson(lesson_id)
 
         if not lesson:
             return jsonify({'error': '课程不存在'}), 404
@@ -63,9 +83,11 @@ def submit_practice():
         if card['type'] != 'practice':
             return jsonify({'error': '该卡片不是练习题'}), 400
 
-        # 检查答案正确性
+        # 检查答案正确性：目标公式的标准化形式在写入课程时已预先计算；
+        # 较长的答案在判题进程池中标准化，超时按错误处理
         target_formula = card['target_formula']
-        is_correct = check_latex_answer(user_answer, target_formula)
+        target_normalized = normalized_target(card)
+        is_correct, grading_status = grade_answer(user_answer, target_normalized)
 
         # 保存练习记录
         practice_record = {
@@ -77,9 +99,11 @@ def submit_practice():
             'is_correct': is_correct,
             'submitted_at': datetime.utcnow()
         }
+        if grading_status != 'ok':
+            practice_record['grading_status'] = grading_status
 
-        result = db.practice_records.insert_one(practice_record)
-        practice_record_id = result.inserted_id
+        # 练习记录经写缓冲批量写入，_id 在入队时分配
+        practice_record_id = write_behind.append('practice_records', practice_record)
 
         # 更新用户进度
         update_user_progress(db, user_id, str(lesson['_id']), card_index, is_correct)
@@ -87,16 +111,22 @@ def submit_practice():
         # 集成复习系统：创建或更新复习记录
         from app.models.review import Review
         quality = 4 if is_correct else 1  # 正确答案质量较高，错误答案质量较低
-        Review.create_or_update_review(user_id, str(practice_record_id), is_correct, quality)
+        Review.record_attempt(user_id, str(lesson['_id']), card_index, practice_record_id, is_correct, quality)
 
         response_data = {
             'is_correct': is_correct,
             'target_answer': target_formula,
             'feedback': get_feedback(is_correct, user_answer, target_formula)
         }
+        if grading_status != 'ok':
+            response_data['grading_status'] = grading_status
 
-        # 如果答案错误，提供提示
+        # 如果答案错误，提供提示；答案属于该卡片的常见错误时附带针对性提示
         if not is_correct:
+            if grading_status == 'ok':
+                mistake = targeted_hint(db, lesson['_id'], card_index, user_answer, target_normalized)
+                if mistake:
+                    response_data['targeted_hint'] = mistake
             hints = card.get('hints', [])
             if hints:
                 response_data['hint'] = hints[0]  # 提供第一个提示
@@ -107,6 +137,303 @@ def submit_practice():
         return jsonify({'error': f'提交练习时出错: {str(e)}'}), 500
 
 
+@practice_bp.route('/check-batch', methods=['POST'])
+@jwt_required()
+def check_answers_batch():
+    """
+    批量检查练习答案（只判题，不保存练习记录、不更新进度和复习记录）
+
+    请求体: {"items": [{"lesson_id": ..., "card_index": 0, "user_answer": "..."}, ...]}
+    返回与 items 顺序一致的 results；单个题目出错只影响该题的结果。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, list):
+            return jsonify({'error': '缺少必需字段: items'}), 400
+
+        max_items = current_app.config.get('PRACTICE_CHECK_BATCH_MAX_ITEMS', 200)
+        if len(items) > max_items:
+            return jsonify({'error': f'单次最多检查 {max_items} 道题'}), 400
+
+        # 先解析全部题目（同一课程只解析一次），再统一标准化去重后的答案
+        lessons = {}
+        resolved = []
+        for item in items:
+            resolved.append(resolve_batch_item(item, lessons))
+
+        answers = {answer for card, _, answer, _ in resolved if card is not None}
+        normalized_answers = normalize_answers(answers)
+
+        results = []
+        correct_count = 0
+        for item, (card, _, user_answer, error) in zip(items, resolved):
+            if card is None:
+                results.append({'error': error})
+                continue
+
+            target_formula = card['target_formula']
+            is_correct = normalized_answers[user_answer] == normalized_target(card)
+            correct_count += is_correct
+
+            result = {
+                'lesson_id': str(item['lesson_id']),
+                'card_index': item['card_index'],
+                'is_correct': is_correct,
+                'target_answer': target_formula,
+                'feedback': get_feedback(is_correct, user_answer, target_formula)
+            }
+            if normalized_answers[user_answer] is None:
+                result['grading_status'] = 'timeout'
+            if not is_correct:
+                hints = card.get('hints', [])
+                if hints:
+                    result['hint'] = hints[0]
+            results.append(result)
+
+        return jsonify({
+            'results': results,
+            'total': len(items),
+            'correct_count': correct_count
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'批量检查答案时出错: {str(e)}'}), 500
+
+
+@practice_bp.route('/sync', methods=['POST'])
+@jwt_required()
+def sync_offline_practice():
+    """
+    同步离线练习的作答记录
+
+    请求体: {"attempts": [{"lesson_id": ..., "card_index": 0, "user_answer": "...",
+                           "submitted_at": "2024-01-01T08:00:00Z", "client_id": "..."}, ...]}
+
+    保留客户端的作答时间；练习记录一次 insert_many 写入，用户进度按课程合并后一次
+    bulk_write，复习记录一次 bulk_write。带 client_id 的作答重复同步时不会重复写入。
+    早于卡片最近一次作答的离线作答不接在当前复习状态之后，该卡片按作答时间重放全部作答。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        attempts = data.get('attempts')
+        if not isinstance(attempts, list):
+            return jsonify({'error': '缺少必需字段: attempts'}), 400
+
+        max_items = current_app.config.get('PRACTICE_SYNC_MAX_ITEMS', 500)
+        if len(attempts) > max_items:
+            return jsonify({'error': f'单次最多同步 {max_items} 条作答'}), 400
+
+        user_id = get_jwt_identity()
+        user_object_id = ObjectId(user_id)
+        now = datetime.utcnow()
+
+        from app import get_db
+        db = get_db()
+
+        # 解析全部作答（同一课程只解析一次）
+        lessons = {}
+        results = [None] * len(attempts)
+        pending = []
+        for position, item in enumerate(attempts):
+            card, lesson, user_answer, error = resolve_batch_item(item, lessons)
+            if error is None:
+                submitted_at, error = parse_client_timestamp(item.get('submitted_at'), now)
+            if error is None:
+                client_id = item.get('client_id')
+                if client_id is not None and not isinstance(client_id, str):
+                    error = 'client_id 格式无效'
+            if error is not None:
+                results[position] = {'error': error}
+                continue
+            pending.append((position, lesson, item['card_index'], card, user_answer, submitted_at, client_id))
+
+        # 已同步过的作答（按 client_id）直接跳过
+        client_ids = [entry[6] for entry in pending if entry[6] is not None]
+        synced_ids = set()
+        if client_ids:
+            synced_ids = {
+                record['client_attempt_id']
+                for record in db.practice_records.find(
+                    {'user_id': user_object_id, 'client_attempt_id': {'$in': client_ids}},
+                    {'client_attempt_id': 1}
+                )
+            }
+
+        normalized_answers = normalize_answers([entry[4] for entry in pending])
+
+        records = []
+        positions = []
+        for position, lesson, card_index, card, user_answer, submitted_at, client_id in pending:
+            is_correct = normalized_answers[user_answer] == normalized_target(card)
+            results[position] = {
+                'client_id': client_id,
+                'is_correct': is_correct,
+                'target_answer': card['target_formula'],
+                'status': 'synced'
+            }
+            if normalized_answers[user_answer] is None:
+                results[position]['grading_status'] = 'timeout'
+            if client_id is not None:
+                if client_id in synced_ids:
+                    results[position]['status'] = 'duplicate'
+                    continue
+                synced_ids.add(client_id)
+
+            record = {
+                'user_id': user_object_id,
+                'lesson_id': lesson['_id'],
+                'card_index': card_index,
+                'user_answer': user_answer,
+                'target_answer': card['target_formula'],
+                'is_correct': is_correct,
+                'submitted_at': submitted_at,
+                'synced_at': now
+            }
+            if normalized_answers[user_answer] is None:
+                record['grading_status'] = 'timeout'
+            if client_id is not None:
+                record['client_attempt_id'] = client_id
+            records.append(record)
+            positions.append(position)
+
+        inserted = records
+        if records:
+            try:
+                db.practice_records.insert_many(records, ordered=False)
+            except BulkWriteError as e:
+                # 并发同步同一批作答时，唯一索引拒绝的重复记录视为已同步
+                failed = {}
+                for write_error in e.details.get('writeErrors', []):
+                    if write_error.get('code') != 11000:
+                        raise
+                    failed[write_error['index']] = True
+                for index in failed:
+                    results[positions[index]]['status'] = 'duplicate'
+                inserted = [record for index, record in enumerate(records) if index not in failed]
+
+        if inserted:
+            # 按作答时间顺序合并进度和复习计划
+            inserted.sort(key=lambda record: record['submitted_at'])
+            bulk_update_user_progress(db, user_id, inserted)
+
+            from app.models.review import Review
+            Review.bulk_upsert_reviews(user_id, [
+                (record['lesson_id'], record['card_index'], record['_id'], record['is_correct'],
+                 4 if record['is_correct'] else 1, record['submitted_at'])
+                for record in inserted
+            ])
+
+        return jsonify({
+            'results': results,
+            'total': len(attempts),
+            'synced': len(inserted),
+            'duplicates': sum(1 for result in results if result and result.get('status') == 'duplicate'),
+            'failed': sum(1 for result in results if result and 'error' in result)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'同步离线练习时出错: {str(e)}'}), 500
+
+
+@practice_bp.route('/live/sessions', methods=['POST'])
+@jwt_required()
+def create_live_session():
+    """
+    为一张练习卡片创建实时校验会话
+
+    请求体: {"lesson_id": ..., "card_index": 0}
+    """
+    try:
+        from app.utils.live_validation import create_session_token
+
+        data = request.get_json(silent=True) or {}
+        card, lesson, error = resolve_practice_card(data.get('lesson_id'), data.get('card_index'))
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        return jsonify({
+            'session_id': create_session_token(get_jwt_identity(), lesson['_id'], data['card_index']),
+            'expires_in': current_app.config.get('LIVE_VALIDATION_SESSION_TTL', 1800)
+        }), 201
+
+    except Exception as e:
+        return jsonify({'error': f'创建实时校验会话时出错: {str(e)}'}), 500
+
+
+@practice_bp.route('/live/sessions/<session_id>/edits', methods=['POST'])
+@jwt_required()
+def validate_live_edits(session_id):
+    """
+    提交一组编辑，以 NDJSON 返回每次编辑后的校验结果（每行一个 JSON 对象，按编辑顺序）
+
+    这是批量请求而不是长连接：客户端把编辑器在一个去抖间隔内的修改合并为一次 POST，
+    服务端处理完整组编辑、保存会话的最新答案后一次性返回。gunicorn 同步 worker 不适合
+    为每个输入框保持一个长连接；会话答案保存在数据库中，连续的请求可以落在不同的 worker 上。
+
+    请求体: {"edits": [{"seq": 1, "answer": "x^"}, {"seq": 2, "start": 2, "end": 2, "text": "2"}, ...]}
+    每行结果: {"seq": n, "status": "match" | "prefix" | "diverged" | "resync", ...}
+    status 为 resync 时会话没有序号为 n-1 的答案（已过期或请求乱序），客户端需发送完整答案。
+    """
+    try:
+        from app import get_db
+        from app.utils.live_validation import (
+            LiveSessionError, apply_edit, compare_answer, load_session_state, load_session_token,
+            save_session_state
+        )
+
+        try:
+            lesson_id, card_index = load_session_token(session_id, get_jwt_identity())
+        except LiveSessionError as e:
+            return jsonify({'error': str(e)}), 401
+
+        data = request.get_json(silent=True) or {}
+        edits = data.get('edits')
+        if not isinstance(edits, list) or not edits:
+            return jsonify({'error': '缺少必需字段: edits'}), 400
+        max_edits = current_app.config.get('LIVE_VALIDATION_MAX_EDITS', 100)
+        if len(edits) > max_edits:
+            return jsonify({'error': f'单次最多提交 {max_edits} 次编辑'}), 400
+
+        card, _, error = resolve_practice_card(lesson_id, card_index)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # 目标公式的标准化形式在写入课程时已预先计算，会话内只比较用户答案
+        target = normalized_target(card)
+        max_length = current_app.config.get('LIVE_VALIDATION_MAX_ANSWER_LENGTH', 1000)
+
+        db = get_db()
+        initial = state = load_session_state(db, session_id)
+        lines = []
+        for edit in edits:
+            seq = edit.get('seq') if isinstance(edit, dict) else None
+            try:
+                if not isinstance(edit, dict):
+                    raise ValueError('编辑格式无效')
+                answer = apply_edit(state, edit)
+            except ValueError as e:
+                lines.append(json.dumps({'seq': seq, 'error': str(e)}, ensure_ascii=False) + '\n')
+                continue
+
+            if answer is None:
+                result = {'status': 'resync'}
+            elif len(answer) > max_length:
+                result = {'status': 'diverged', 'error': '答案过长'}
+            else:
+                state = (seq, answer)
+                result = compare_answer(answer.strip(), target)
+            lines.append(json.dumps({'seq': seq, **result}, ensure_ascii=False) + '\n')
+
+        if state is not None and state != initial:
+            save_session_state(db, session_id, state[0], state[1],
+                               current_app.config.get('LIVE_VALIDATION_SESSION_TTL', 1800))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    except Exception as e:
+        return jsonify({'error': f'实时校验答案时出错: {str(e)}'}), 500
+
+
 @practice_bp.route('/hint', methods=['POST'])
 @jwt_required()
 def get_hint():
@@ -123,7 +450,7 @@ def get_hint():
         db = get_db()
 
         # 获取课程和练习题
-        lesson = db.lessons.find_one({'_id': ObjectId(lesson_id)})
+        lesson = resolve_lesson(lesson_id)
         if not lesson:
             return jsonify({'error': '课程不存在'}), 404
 
@@ -138,13 +465,13 @@ def get_hint():
         # 记录提示使用
         hint_record = {
             'user_id': ObjectId(user_id),
-            'lesson_id': ObjectId(lesson_id),
+            'lesson_id': lesson['_id'],
             'card_index': card_index,
             'hint_level': hint_level,
             'used_at': datetime.utcnow()
         }
 
-        db.hint_records.insert_one(hint_record)
+        write_behind.append('hint_records', hint_record)
 
         return jsonify({
             'hint': hints[hint_level],
@@ -195,7 +522,12 @@ def get_practice_progress(lesson_id):
 @practice_bp.route('/list', methods=['GET'])
 @jwt_required()
 def get_practice_list():
-    """获取所有练习题列表"""
+    """
+    获取练习题列表
+
+    查询参数：course（课程ID）、difficulty、topic 用于筛选，offset / limit 用于分页
+    （不传 limit 时返回全部）。筛选和分页在 practice_items 集合上完成。
+    """
     try:
         user_id = get_jwt_identity()
         from app import get_db
@@ -206,49 +538,66 @@ def get_practice_list():
         difficulty_filter = request.args.get('difficulty')
         topic_filter = request.args.get('topic')
 
-        # 获取所有课程中的练习题
-        lessons = list(db.lessons.find({}).sort('sequence', 1))
-        practice_list = []
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', 0))
+        except ValueError:
+            return jsonify({'error': 'offset 和 limit 必须是整数'}), 400
+        if offset < 0 or limit < 0:
+            return jsonify({'error': 'offset 和 limit 不能为负数'}), 400
+
+        lesson_id = None
+        if course_filter:
+            lesson = resolve_lesson(course_filter)
+            if not lesson:
+                return jsonify({'practices': [], 'total': 0}), 200
+            lesson_id = lesson['_id']
+
+        query = PracticeItem.build_filter(lesson_id, difficulty_filter, topic_filter)
+        items = PracticeItem.find(query, skip=offset, limit=limit)
+        total = PracticeItem.count(query) if (offset or limit) else len(items)
+
+        # 一次聚合获取当前页练习题的用户作答记录
+        user_records = {}
+        if items:
+            pipeline = [
+                {'$match': {
+                    'user_id': ObjectId(user_id),
+                    'lesson_id': {'$in': list({item['lesson_id'] for item in items})}
+                }},
+                {'$sort': {'submitted_at': -1}},
+                {'$group': {
+                    '_id': {'lesson_id': '$lesson_id', 'card_index': '$card_index'},
+                    'attempts': {'$sum': 1},
+                    'is_correct': {'$first': '$is_correct'},
+                    'submitted_at': {'$first': '$submitted_at'}
+                }}
+            ]
+            for record in db.practice_records.aggregate(pipeline):
+                key = (record['_id']['lesson_id'], record['_id']['card_index'])
+                user_records[key] = record
 
-        for lesson in lessons:
-            for card_index, card in enumerate(lesson['cards']):
-                if card['type'] == 'practice':
-                    # 获取用户在此练习题的记录
-                    user_record = db.practice_records.find_one({
-                        'user_id': ObjectId(user_id),
-                        'lesson_id': lesson['_id'],
-                        'card_index': card_index
-                    }, sort=[('submitted_at', -1)])
-
-                    practice_item = {
-                        'id': f"{lesson['_id']}_{card_index}",
-                        'lesson_id': str(lesson['_id']),
-                        'lesson_title': lesson['title'],
-                        'card_index': card_index,
-                        'question': card['question'],
-                        'target_formula': card['target_formula'],
-                        'difficulty': card.get('difficulty', 'medium'),
-                        'hints': card.get('hints', []),
-                        'completed': user_record['is_correct'] if user_record else False,
-                        'attempts': len(list(db.practice_records.find({
-                            'user_id': ObjectId(user_id),
-                            'lesson_id': lesson['_id'],
-                            'card_index': card_index
-                        }))),
-                        'last_attempt': user_record['submitted_at'] if user_record else None
-                    }
-
-                    # 应用筛选条件
-                    if course_filter and str(lesson['_id']) != course_filter:
-                        continue
-                    if difficulty_filter and practice_item['difficulty'] != difficulty_filter:
-                        continue
-
-                    practice_list.append(practice_item)
+        practice_list = []
+        for item in items:
+            user_record = user_records.get((item['lesson_id'], item['card_index']))
+            practice_list.append({
+                'id': item['_id'],
+                'lesson_id': str(item['lesson_id']),
+                'lesson_title': item['lesson_title'],
+                'card_index': item['card_index'],
+                'question': item['question'],
+                'target_formula': item['target_formula'],
+                'difficulty': item['difficulty'],
+                'topics': item['topics'],
+                'hints': item['hints'],
+                'completed': user_record['is_correct'] if user_record else False,
+                'attempts': user_record['attempts'] if user_record else 0,
+                'last_attempt': user_record['submitted_at'] if user_record else None
+            })
 
         return jsonify({
             'practices': practice_list,
-            'total': len(practice_list)
+            'total': total
         }), 200
 
     except Exception as e:
@@ -310,7 +659,7 @@ def get_practice_stats():
 
         # 按难度统计
         difficulty_stats = {}
-        lessons = {str(l['_id']): l for l in db.lessons.find({})}
+        lessons = lesson_catalog.snapshot().by_id
 
         for record in records:
             lesson = lessons.get(str(record['lesson_id']))
@@ -361,131 +710,93 @@ def get_practice_stats():
         return jsonify({'error': f'获取练习统计时出错: {str(e)}'}), 500
 
 
-def check_latex_answer(user_answer, target_answer):
-    """检查 LaTeX 答案是否正确 - 支持语义等价性检查"""
-
-def normalize_latex(latex_str):
-    """增强的LaTeX标准化函数，与前端逻辑对齐"""
-    if not latex_str:
-        return ""
-
-    try:
-        # 移除首尾空格
-        latex_str = latex_str.strip()
-
-        # 1. 标准化数学环境分隔符
-        if latex_str.startswith('\\begin{equation}') and latex_str.endswith('\\end{equation}'):
-            latex_str = latex_str[len('\\begin{equation}'):-len('\\end{equation}')].strip()
-        if latex_str.startswith('$$') and latex_str.endswith('$$'):
-            latex_str = latex_str[2:-2].strip()
-        if latex_str.startswith('\\(') and latex_str.endswith('\\)'):
-            latex_str = latex_str[2:-2].strip()
-        if latex_str.startswith('$') and latex_str.endswith('$'):
-            latex_str = latex_str[1:-1].strip()
-
-        # 2. 标准化括号
-        latex_str = latex_str.replace('\\left', '').replace('\\right', '')
-
-        # 3. 移除常见空格命令
-        spacing_commands = ['\\,', '\\thinspace', '\\:', '\\medspace', '\\;', '\\thickspace', '\\!', '\\negthinspace', '\\negmedspace', '\\negthickspace', '\\quad', '\\qquad']
-        for cmd in spacing_commands:
-            latex_str = latex_str.replace(cmd, ' ')
-
-        # 4. 标准化等价命令 (核心变更)
-        # 将各种形式映射到单一的、标准的LaTeX形式
-        equivalence_mappings = {
-            '\\ne': '\\neq',
-            '\\le': '\\leq',
-            '\\ge': '\\geq',
-            '\\to': '\\rightarrow',
-            '\\gets': '\\leftarrow',
-            '\\iff': '\\leftrightarrow',
-            '\\cong': '\\approx',
-            '\\subset': '\\subseteq',
-            '\\supset': '\\supseteq',
-            '\\lt': '<',
-            '\\gt': '>',
-            '\\cdot': '\\times',
-        }
-        # 4. 标准化等价命令 (最终修复方案：使用 re.sub 和精确的负向先行断言)
-        replacement_map = {
-            '\\ne': '\\neq',
-            '\\le': '\\leq',
-            '\\ge': '\\geq',
-            '\\to': '\\rightarrow',
-            '\\gets': '\\leftarrow',
-            '\\iff': '\\leftrightarrow',
-            '\\cong': '\\approx',
-            '\\subset': '\\subseteq',
-            '\\supset': '\\supseteq',
-            '\\lt': '<',
-            '\\gt': '>',
-            '\\cdot': '\\times',
-        }
-
-        # 按键(old)的长度降序排序，以优先匹配更长的字符串（如 \gets vs \ge）
-        sorted_keys = sorted(replacement_map.keys(), key=len, reverse=True)
-        
-        # 为每个key创建一个带负向先行断言的pattern，确保匹配的是完整命令
-        # 例如，`\ne` 会变成 `\\ne(?![a-zA-Z])`
-        # 这能匹配 `\ne ` 或 `\ne{`，但不会匹配 `\neq` 中的 `\ne`
-        pattern = re.compile("|".join(f"{re.escape(k)}(?![a-zA-Z])" for k in sorted_keys))
-
-        # 定义一个清晰的回调函数来执行替换
-        def replacer(match):
-            # match.group(0) 是匹配到的完整字符串，例如 `\ne`
-            return replacement_map[match.group(0)]
-
-        # 执行安全的、非递归的替换
-        latex_str = pattern.sub(replacer, latex_str)
-        
-        # 5. 标准化数学函数名
-        function_mappings = {
-            ' sin ': ' \\sin ', ' cos ': ' \\cos ', ' tan ': ' \\tan ',
-            ' cot ': ' \\cot ', ' sec ': ' \\sec ', ' csc ': ' \\csc ',
-            ' ln ': ' \\ln ', ' log ': ' \\log ', ' exp ': ' \\exp ',
-            'sin(': '\\sin(', 'cos(': '\\cos(', 'tan(': '\\tan(',
-            'ln(': '\\ln(', 'log(': '\\log(', 'exp(': '\\exp(',
-        }
-        latex_str = ' ' + latex_str + ' '
-        for old, new in function_mappings.items():
-            latex_str = latex_str.replace(old, new)
-        latex_str = latex_str.strip()
-
-        # 6. 结构化标准化
-        latex_str = re.sub(r'\^([a-zA-Z0-9])', r'^{\1}', latex_str)
-        latex_str = re.sub(r'_([a-zA-Z0-9])', r'_{\1}', latex_str)
-        latex_str = re.sub(r'\\frac\s*\{\s*([^}]+)\s*\}\s*\{\s*([^}]+)\s*\}', r'\\frac{\1}{\2}', latex_str)
-        latex_str = re.sub(r'\\sqrt\s*\{\s*([^}]+)\s*\}', r'\\sqrt{\1}', latex_str)
+def resolve_practice_card(lesson_id, card_index, lessons=None):
+    """
+    解析课程引用和卡片索引
 
-        # 7. 最终清理
-        # 移除所有空格进行比较。这是在完全对齐前端的复杂语义分析之前，
-        # 实现鲁棒性价比较高的方式。它能处理绝大多数格式问题。
-        latex_str = re.sub(r'\s+', '', latex_str)
+    Args:
+        lessons: 可选的 课程引用 -> 课程文档 缓存，批量接口中同一课程只解析一次
 
-        return latex_str.lower()
-
-    except Exception:
-        # 如果出错，回退到简单处理
-        return latex_str.strip().lower().replace(' ', '')
+    Returns:
+        tuple: (练习卡片, 课程文档, None) 或 (None, None, (错误信息, 状态码))
+    """
+    if lesson_id is None or card_index is None:
+        return None, None, ('缺少必需字段: lesson_id 或 card_index', 400)
 
+    if lessons is None:
+        lesson = resolve_lesson(lesson_id)
+    else:
+        key = str(lesson_id)
+        if key not in lessons:
+            lessons[key] = resolve_lesson(lesson_id)
+        lesson = lessons[key]
+    if not lesson:
+        return None, None, ('课程不存在', 404)
+
+    if not isinstance(card_index, int) or isinstance(card_index, bool) \
+            or not 0 <= card_index < len(lesson['cards']):
+        return None, None, ('卡片索引无效', 400)
+
+    card = lesson['cards'][card_index]
+    if card['type'] != 'practice':
+        return None, None, ('该卡片不是练习题', 400)
+    return card, lesson, None
+
+
+def resolve_batch_item(item, lessons):
+    """
+    解析批量判题中的一道题
+
+    Args:
+        item: 请求中的题目
+        lessons: 本次请求内 课程引用 -> 课程文档 的缓存
+
+    Returns:
+        tuple: (练习卡片, 课程文档, 去除首尾空白的答案, 错误信息)；出错时卡片为 None
+    """
+    if not isinstance(item, dict):
+        return None, None, None, '题目格式无效'
+    for field in ('lesson_id', 'card_index', 'user_answer'):
+        if field not in item:
+            return None, None, None, f'缺少必需字段: {field}'
+
+    user_answer = item['user_answer']
+    if not isinstance(user_answer, str):
+        return None, None, None, '答案格式无效'
+    if len(user_answer) > current_app.config.get('PRACTICE_MAX_ANSWER_LENGTH', 2000):
+        return None, None, None, '答案过长'
+
+    card, lesson, error = resolve_practice_card(item['lesson_id'], item['card_index'], lessons)
+    if error:
+        return None, None, None, error[0]
+    return card, lesson, user_answer.strip(), None
+
+
+def parse_client_timestamp(value, now):
+    """
+    解析客户端作答时间（ISO 8601 字符串或毫秒时间戳），转换为 UTC naive datetime
+
+    Returns:
+        tuple: (datetime, 错误信息)；未提供时使用服务器当前时间
+    """
+    if value is None:
+        return now, None
     try:
-        user_normalized = normalize_latex(user_answer)
-        target_normalized = normalize_latex(target_answer)
-
-        # 直接比较标准化后的结果
-        result = user_normalized == target_normalized
-
-        return result
-
-    except Exception:
-        # 出错时回退到简单比较
-        try:
-            simple_user = user_answer.strip().lower().replace(' ', '')
-            simple_target = target_answer.strip().lower().replace(' ', '')
-            return simple_user == simple_target
-        except:
-            return False
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            timestamp = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+        elif isinstance(value, str):
+            timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            return None, '作答时间格式无效'
+    except (ValueError, OverflowError, OSError):
+        return None, '作答时间格式无效'
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    # 允许少量时钟偏差，明显来自未来的时间视为无效
+    if timestamp > now + timedelta(minutes=5):
+        return None, '作答时间无效'
+    return timestamp, None
 
 
 def get_feedback(is_correct, user_answer, target_answer):
@@ -504,47 +815,100 @@ def get_feedback(is_correct, user_answer, target_answer):
         }
 
 
-def update_user_progress(db, user_id, lesson_id, card_index, is_correct):
-    """更新用户学习进度"""
-    # 查找或创建进度记录
-    progress = db.user_progress.find_one({
-        'user_id': ObjectId(user_id),
-        'lesson_id': ObjectId(lesson_id)
-    })
-
-    if not progress:
-        progress = {
-            'user_id': ObjectId(user_id),
-            'lesson_id': ObjectId(lesson_id),
-            'cards_progress': {},
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
-
-    # 更新卡片进度
-    if str(card_index) not in progress['cards_progress']:
-        progress['cards_progress'][str(card_index)] = {
-            'completed': False,
-            'attempts': 0,
-            'first_completed_at': None
-        }
+def upsert_progress(db, query, update):
+    """
+    按 (user_id, lesson_id) upsert 进度文档
 
-    card_progress = progress['cards_progress'][str(card_index)]
-    card_progress['attempts'] += 1
+    两个请求同时创建同一进度文档时，唯一索引拒绝其中一个插入；此时文档已存在，重试即为普通更新。
+    """
+    try:
+        return db.user_progress.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        return db.user_progress.update_one(query, update, upsert=True)
 
-    if is_correct and not card_progress['completed']:
-        card_progress['completed'] = True
-        card_progress['first_completed_at'] = datetime.utcnow()
 
-    progress['updated_at'] = datetime.utcnow()
+def update_user_progress(db, user_id, lesson_id, card_index, is_correct):
+    """
+    更新用户学习进度
+
+    原子的字段级更新：尝试次数用 $inc 累加，只修改这张卡片的字段，
+    并发提交不会丢失尝试次数，也不会重写整个 cards_progress。进度文档已存在时为一次写操作；
+    答对时完成状态只由条件更新写入，不依赖 (user_id, lesson_id) 唯一索引拒绝 upsert。
+    """
+    now = datetime.utcnow()
+    card = f'cards_progress.{card_index}'
+    query = {'user_id': ObjectId(user_id), 'lesson_id': ObjectId(lesson_id)}
+    update = {
+        '$inc': {f'{card}.attempts': 1},
+        '$set': {'updated_at': now},
+        '$setOnInsert': {'created_at': now}
+    }
 
-    # 保存进度
-    db.user_progress.replace_one(
-        {
-            'user_id': ObjectId(user_id),
-            'lesson_id': ObjectId(lesson_id)
-        },
-        progress,
-        upsert=True
-    )
+    if is_correct:
+        # 只在卡片尚未完成时写入完成状态和首次完成时间（不 upsert，正确性不依赖唯一索引）
+        completion = {f'{card}.completed': {'$ne': True}}
+        first_completion = {f'{card}.completed': True, f'{card}.first_completed_at': now}
+        result = db.user_progress.update_one(
+            dict(query, **completion), dict(update, **{'$set': dict(first_completion, updated_at=now)})
+        )
+        if result.matched_count:
+            return
+
+    # $max 只在字段不存在时写入 False，不会覆盖已完成的状态
+    update['$max'] = {f'{card}.completed': False}
+    upsert_progress(db, query, update)
 
+    if is_correct:
+        # 进度文档刚被创建：补写完成状态；卡片已完成（或并发请求已先完成）时不匹配
+        db.user_progress.update_one(dict(query, **completion), {'$set': first_completion})
+
+
+def bulk_update_user_progress(db, user_id, records):
+    """
+    将一批练习记录合并到用户进度，一次 bulk_write 完成，不读取现有进度
+
+    每门课程一条 upsert：尝试次数用 $inc 累加。每张有正确作答的卡片再跟一条条件更新：
+    卡片尚未完成时写入完成状态和最早的正确作答时间。records 需按作答时间排序。
+    """
+    user_object_id = ObjectId(user_id)
+    by_lesson = {}
+    for record in records:
+        by_lesson.setdefault(record['lesson_id'], []).append(record)
+
+    now = datetime.utcnow()
+    operations = []
+    for lesson_id, lesson_records in by_lesson.items():
+        query = {'user_id': user_object_id, 'lesson_id': lesson_id}
+        increments = {}
+        first_correct = {}
+        for record in lesson_records:
+            card = f'cards_progress.{record["card_index"]}'
+            increments[f'{card}.attempts'] = increments.get(f'{card}.attempts', 0) + 1
+            if record['is_correct']:
+                first_correct.setdefault(card, record['submitted_at'])
+
+        operations.append(UpdateOne(query, {
+            '$inc': increments,
+            '$max': {f'{field.rsplit(".", 1)[0]}.completed': False for field in increments},
+            '$set': {'updated_at': now},
+            '$setOnInsert': {'created_at': now}
+        }, upsert=True))
+        for card, completed_at in first_correct.items():
+            operations.append(UpdateOne(
+                dict(query, **{f'{card}.completed': {'$ne': True}}),
+                {'$set': {f'{card}.completed': True, f'{card}.first_completed_at': completed_at}}
+            ))
+
+    # 按顺序执行（完成状态的更新依赖前面的 upsert）；并发创建同一进度文档时从失败的操作处重试
+    pending = operations
+    for _ in range(3):
+        try:
+            if pending:
+                db.user_progress.bulk_write(pending, ordered=True)
+            break
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if not errors or errors[0].get('code') != 11000:
+                raise
+            pending = pending[errors[0]['index']:]
+    return len(by_lesson)
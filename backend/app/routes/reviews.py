@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 
 from app.models.review import Review
 from app.models.lesson import Lesson
+from app.utils.lesson_resolver import resolve_lesson
+from app.utils.write_behind import write_behind
 
 reviews_bp = Blueprint('reviews', __name__)
 
@@ -32,20 +34,13 @@ def get_today_reviews():
         db = get_db()
 
         for review in due_reviews:
-            # 通过practice记录找到对应的课程和卡片
-            # 尝试两种user_id格式：字符串和ObjectId
-            practice_record = db.practice_records.find_one({
-                '$or': [
-                    {'user_id': user_id, '_id': ObjectId(review.practice_id)},
-                    {'user_id': ObjectId(user_id), '_id': ObjectId(review.practice_id)}
-                ]
-            })
-
-            if practice_record:
+            lesson_id, card_index = review_card_location(db, review, user_id)
+
+            if lesson_id is not None:
                 # 获取课程信息
-                lesson = db.lessons.find_one({'_id': practice_record['lesson_id']})
-                if lesson and practice_record['card_index'] < len(lesson['cards']):
-                    card = lesson['cards'][practice_record['card_index']]
+                lesson = resolve_lesson(lesson_id)
+                if lesson and card_index < len(lesson['cards']):
+                    card = lesson['cards'][card_index]
 
                     # 根据语言选择课程标题
                     lesson_title = lesson['title']
@@ -57,7 +52,7 @@ def get_today_reviews():
                         'practice_id': review.practice_id,
                         'lesson_id': str(lesson['_id']),
                         'lesson_title': lesson_title,
-                        'card_index': practice_record['card_index'],
+                        'card_index': card_index,
                         'question': card.get('question', ''),
                         'target_formula': card.get('target_formula', ''),
                         'difficulty': card.get('difficulty', 'medium'),
@@ -110,10 +105,7 @@ def submit_review():
         # 更新复习计划
         review.update_review_schedule(is_correct, quality)
 
-        # 保存复习提交记录
-        from app import get_db
-        db = get_db()
-
+        # 保存复习提交记录（经写缓冲批量写入）
         review_submission = {
             'user_id': ObjectId(user_id),
             'review_id': ObjectId(review_id),
@@ -127,7 +119,7 @@ def submit_review():
             'repetitions': review.repetitions
         }
 
-        db.review_submissions.insert_one(review_submission)
+        write_behind.append('review_submissions', review_submission)
 
         # 计算下次复习时间的友好显示
         next_review_friendly = get_friendly_time_delta(review.next_review_date)
@@ -165,20 +157,13 @@ def get_review_items():
         db = get_db()
 
         for review in reviews:
-            # 通过practice记录找到对应的课程和卡片
-            # 尝试两种user_id格式：字符串和ObjectId
-            practice_record = db.practice_records.find_one({
-                '$or': [
-                    {'user_id': user_id, '_id': ObjectId(review.practice_id)},
-                    {'user_id': ObjectId(user_id), '_id': ObjectId(review.practice_id)}
-                ]
-            })
-
-            if practice_record:
+            lesson_id, card_index = review_card_location(db, review, user_id)
+
+            if lesson_id is not None:
                 # 获取课程信息
-                lesson = db.lessons.find_one({'_id': practice_record['lesson_id']})
-                if lesson and practice_record['card_index'] < len(lesson['cards']):
-                    card = lesson['cards'][practice_record['card_index']]
+                lesson = resolve_lesson(lesson_id)
+                if lesson and card_index < len(lesson['cards']):
+                    card = lesson['cards'][card_index]
 
                     # 根据语言选择课程标题
                     lesson_title = lesson['title']
@@ -190,7 +175,7 @@ def get_review_items():
                         'practice_id': review.practice_id,
                         'lesson_id': str(lesson['_id']),
                         'lesson_title': lesson_title,
-                        'card_index': practice_record['card_index'],
+                        'card_index': card_index,
                         'question': card.get('question', ''),
                         'target_formula': card.get('target_formula', ''),
                         'difficulty': card.get('difficulty', 'medium'),
@@ -323,6 +308,30 @@ def get_review_stats():
         return jsonify({'error': f'获取统计信息失败: {str(e)}'}), 500
 
 
+def review_card_location(db, review, user_id):
+    """
+    复习记录对应的课程和卡片
+
+    复习记录保存了 lesson_id 和 card_index；迁移前的旧记录通过练习记录查找。
+
+    Returns:
+        tuple: (课程引用, 卡片索引)；找不到时为 (None, None)
+    """
+    if review.lesson_id is not None:
+        return review.lesson_id, review.card_index
+
+    # 尝试两种user_id格式：字符串和ObjectId
+    practice_record = db.practice_records.find_one({
+        '$or': [
+            {'user_id': user_id, '_id': ObjectId(review.practice_id)},
+            {'user_id': ObjectId(user_id), '_id': ObjectId(review.practice_id)}
+        ]
+    })
+    if practice_record:
+        return practice_record['lesson_id'], practice_record['card_index']
+    return None, None
+
+
 def get_friendly_time_delta(future_date):
     """将时间差转换为友好的显示格式"""
     from datetime import timedelta
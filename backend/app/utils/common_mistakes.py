@@ -0,0 +1,352 @@
+"""
+常见错误挖掘 - LaTeX 速成训练器
+离线批处理：把 practice_records 中的错误答案按 (课程, 卡片) 聚类，保存出现最多的错误簇，
+submit 接口答错时用一次索引查询返回针对性提示。
+
+聚类分两步：先按标准化形式合并（写法不同但等价的答案归为一类），再按记号级编辑距离合并
+相近、且与目标公式第一个不同记号位置相同的标准化形式（不同位置的错误不会并入同一簇）。
+编辑距离只在记号数相差不超过阈值的形式之间计算（按长度分块），每张卡片是一个独立任务，
+在进程池中并行处理。簇只提供错误的次数和占比，提示中的具体差异按学生自己的答案计算。
+"""
+import multiprocessing
+import threading
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from pymongo import ReplaceOne
+
+from app.utils.latex_ast import TOKEN_PATTERN
+from app.utils.latex_normalizer import NORMALIZER_VERSION, normalize_latex, normalized_target
+
+
+DEFAULTS = {
+    'COMMON_MISTAKES_TOP_N': 5,
+    'COMMON_MISTAKES_MIN_COUNT': 3,
+    'COMMON_MISTAKES_WORKERS': 2,
+}
+
+# 两个标准化形式合并为同一簇的最大记号编辑距离（同时不超过较短形式记号数的八分之一，至少为 1）
+MAX_CLUSTER_DISTANCE = 3
+# 每次提交给进程池的卡片数，限制同时驻留内存的错误答案
+CARDS_PER_CHUNK = 64
+
+
+def _config(name):
+    if has_app_context():
+        return current_app.config.get(name, DEFAULTS[name])
+    return DEFAULTS[name]
+
+
+def tokenize(normalized):
+    """标准化形式的比较记号（忽略空白）"""
+    return tuple(token for token in TOKEN_PATTERN.findall(normalized) if not token.isspace())
+
+
+def token_edit_distance(first, second, limit):
+    """
+    记号序列的编辑距离（Levenshtein），超过 limit 时提前返回 limit + 1
+
+    只计算对角线两侧 limit 宽的带状区域。
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, token in enumerate(first, 1):
+        low, high = max(1, i - limit), min(len(second), i + limit)
+        current = [limit + 1] * (len(second) + 1)
+        current[0] = i if i <= limit else limit + 1
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (token != second[j - 1])
+            )
+        if min(current[max(0, low - 1):high + 1]) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[len(second)], limit + 1)
+
+
+def cluster_threshold(tokens):
+    return min(MAX_CLUSTER_DISTANCE, max(1, len(tokens) // 8))
+
+
+def first_difference(tokens, expected):
+    """
+    答案与目标公式第一个不同的记号
+
+    Returns:
+        dict: position（记号位置）、found（答案中的记号，答案提前结束时为 None）、
+              expected（目标公式中的记号，目标提前结束时为 None）
+    """
+    position = 0
+    while position < min(len(tokens), len(expected)) and tokens[position] == expected[position]:
+        position += 1
+    return {
+        'position': position,
+        'found': tokens[position] if position < len(tokens) else None,
+        'expected': expected[position] if position < len(expected) else None,
+    }
+
+
+def cluster_card_answers(task):
+    """
+    聚类一张卡片的错误答案（模块级函数，spawn 子进程可导入）
+
+    Args:
+        task: (课程ID, 卡片索引, 目标公式, [(错误答案, 次数), ...], top_n, min_count)
+
+    Returns:
+        tuple: (课程ID, 卡片索引, 标准化目标公式, 错误总数, 簇列表)
+    """
+    lesson_id, card_index, target_formula, answers, top_n, min_count = task
+    target_normalized = normalize_latex(target_formula)
+
+    # 1. 按标准化形式合并；每个形式保留出现最多的原始写法作为示例
+    forms = {}
+    for answer, count in answers:
+        normalized = normalize_latex(answer)
+        if normalized == target_normalized:
+            continue  # 旧规则下判错、新规则下等价的答案不算错误
+        form = forms.setdefault(normalized, {'count': 0, 'example': answer, 'example_count': 0})
+        form['count'] += count
+        if count > form['example_count']:
+            form['example'], form['example_count'] = answer, count
+
+    # 2. 按出现次数从多到少，依次并入错误位置相同、编辑距离足够近的簇（簇代表是簇内最常见的形式）
+    expected = tokenize(target_normalized)
+    clusters = []
+    by_length = {}
+    for normalized, form in sorted(forms.items(), key=lambda item: (-item[1]['count'], item[0])):
+        tokens = tokenize(normalized)
+        threshold = cluster_threshold(tokens)
+        position = first_difference(tokens, expected)['position']
+        best = None
+        for length in range(len(tokens) - threshold, len(tokens) + threshold + 1):
+            for cluster in by_length.get((position, length), ()):
+                limit = min(threshold, cluster['threshold'])
+                if token_edit_distance(tokens, cluster['tokens'], limit) <= limit:
+                    if best is None or cluster['count'] > best['count']:
+                        best = cluster
+        if best is not None:
+            best['count'] += form['count']
+            best['forms'].append(normalized)
+            continue
+        cluster = {
+            'normalized': normalized,
+            'tokens': tokens,
+            'threshold': threshold,
+            'count': form['count'],
+            'example': form['example'],
+            'forms': [normalized],
+        }
+        clusters.append(cluster)
+        by_length.setdefault((position, len(tokens)), []).append(cluster)
+
+    top = sorted((cluster for cluster in clusters if cluster['count'] >= min_count),
+                 key=lambda cluster: -cluster['count'])[:top_n]
+    total = sum(form['count'] for form in forms.values())
+    return lesson_id, card_index, target_normalized, total, [
+        {
+            'normalized': cluster['normalized'],
+            'forms': cluster['forms'][:20],
+            'count': cluster['count'],
+            'share': round(cluster['count'] / total, 3),
+            'example': cluster['example'],
+            'difference': first_difference(cluster['tokens'], expected),
+        }
+        for cluster in top
+    ]
+
+
+def current_card_target(lesson_id, card_index):
+    """
+    卡片在当前课程目录中的目标公式及其标准化形式
+
+    Returns:
+        tuple | None: (目标公式, 标准化目标公式)；课程或卡片已不存在、不是练习题时返回 None
+    """
+    from app.models.lesson_catalog import lesson_catalog
+
+    lesson = lesson_catalog.get_by_id(lesson_id)
+    cards = lesson.get('cards', []) if lesson else []
+    if not isinstance(card_index, int) or not 0 <= card_index < len(cards) or cards[card_index].get('type') != 'practice':
+        return None
+    return cards[card_index]['target_formula'], normalized_target(cards[card_index])
+
+
+def iter_card_tasks(db, top_n, min_count):
+    """
+    按 (课程, 卡片) 顺序流式生成聚类任务
+
+    在数据库中按 (课程, 卡片, 目标公式, 答案) 汇总错误次数，逐张卡片产出，内存中只保留当前卡片的答案。
+    目标公式取自当前课程目录；管理员修改目标公式之前（按旧目标判题）的记录不参与聚类。
+    """
+    pipeline = [
+        {'$match': {'is_correct': False, 'user_answer': {'$type': 'string'}}},
+        {'$group': {
+            '_id': {'lesson_id': '$lesson_id', 'card_index': '$card_index',
+                    'target': '$target_answer', 'answer': '$user_answer'},
+            'count': {'$sum': 1}
+        }},
+        {'$sort': {'_id.lesson_id': 1, '_id.card_index': 1}}
+    ]
+    current_key, current, answers = None, None, {}
+    matches_target = {}
+    for row in db.practice_records.aggregate(pipeline, allowDiskUse=True):
+        key = (row['_id']['lesson_id'], row['_id']['card_index'])
+        if key != current_key:
+            if answers:
+                yield current_key + (current[0], list(answers.items()), top_n, min_count)
+            current_key, answers, matches_target = key, {}, {}
+            current = current_card_target(*key)
+        if current is None:
+            continue
+        target = row['_id'].get('target')
+        if target not in matches_target:
+            matches_target[target] = isinstance(target, str) and normalize_latex(target) == current[1]
+        if matches_target[target]:
+            answer = row['_id']['answer']
+            answers[answer] = answers.get(answer, 0) + row['count']
+    if answers:
+        yield current_key + (current[0], list(answers.items()), top_n, min_count)
+
+
+def mine_common_mistakes(db, workers=None, top_n=None, min_count=None):
+    """
+    重新挖掘全部卡片的常见错误，写入 common_mistakes 集合
+
+    每张卡片一条文档（只保存出现最多的 top_n 个簇）；本次没有错误簇的卡片的旧文档被删除。
+
+    Returns:
+        dict: 处理的卡片数、保存的卡片数、错误答案总数
+    """
+    workers = workers or _config('COMMON_MISTAKES_WORKERS')
+    top_n = top_n or _config('COMMON_MISTAKES_TOP_N')
+    min_count = min_count or _config('COMMON_MISTAKES_MIN_COUNT')
+    started_at = datetime.utcnow()
+    summary = {'cards': 0, 'stored': 0, 'wrong_answers': 0}
+
+    def flush(pool, chunk):
+        operations = []
+        for lesson_id, card_index, target_normalized, total, clusters in pool.map(cluster_card_answers, chunk):
+            summary['cards'] += 1
+            summary['wrong_answers'] += total
+            if not clusters:
+                continue
+            operations.append(ReplaceOne(
+                {'lesson_id': lesson_id, 'card_index': card_index},
+                {
+                    'lesson_id': lesson_id,
+                    'card_index': card_index,
+                    'target_normalized': target_normalized,
+                    'normalizer_version': NORMALIZER_VERSION,
+                    'total_wrong': total,
+                    'clusters': clusters,
+                    'mined_at': datetime.utcnow(),
+                },
+                upsert=True
+            ))
+        if operations:
+            db.common_mistakes.bulk_write(operations, ordered=False)
+            summary['stored'] += len(operations)
+
+    pool = multiprocessing.get_context('spawn').Pool(processes=workers)
+    try:
+        chunk = []
+        for task in iter_card_tasks(db, top_n, min_count):
+            chunk.append(task)
+            if len(chunk) >= CARDS_PER_CHUNK:
+                flush(pool, chunk)
+                chunk = []
+        if chunk:
+            flush(pool, chunk)
+    finally:
+        pool.terminate()
+
+    db.common_mistakes.delete_many({'mined_at': {'$lt': started_at}})
+    summary['duration_seconds'] = round((datetime.utcnow() - started_at).total_seconds(), 2)
+    return summary
+
+
+def start_mining_in_background(app, on_complete=None):
+    """在后台线程中挖掘常见错误（管理后台触发），完成后以结果摘要调用 on_complete"""
+    def target():
+        with app.app_context():
+            from app import get_db
+            db = get_db()
+            try:
+                summary = dict(mine_common_mistakes(db), success=True)
+            except Exception as e:
+                summary = {'success': False, 'error': str(e)}
+            if on_complete is not None:
+                on_complete(db, summary)
+
+    thread = threading.Thread(target=target, name='common-mistakes', daemon=True)
+    thread.start()
+    return thread
+
+
+def match_common_mistake(mistakes, normalized):
+    """
+    在卡片的常见错误簇中查找与答案匹配的簇
+
+    先按簇内的标准化形式精确匹配，再按记号编辑距离匹配与目标公式第一个不同记号位置相同的相近簇。
+
+    Returns:
+        dict | None: 匹配的簇
+    """
+    if not mistakes or mistakes.get('normalizer_version') != NORMALIZER_VERSION:
+        return None
+    clusters = mistakes.get('clusters', [])
+    for cluster in clusters:
+        if normalized in cluster.get('forms', ()) or normalized == cluster['normalized']:
+            return cluster
+
+    tokens = tokenize(normalized)
+    expected = tokenize(mistakes.get('target_normalized', ''))
+    position = first_difference(tokens, expected)['position']
+    for cluster in clusters:
+        if cluster['difference']['position'] != position:
+            continue
+        cluster_tokens = tokenize(cluster['normalized'])
+        limit = min(cluster_threshold(tokens), cluster_threshold(cluster_tokens))
+        if token_edit_distance(tokens, cluster_tokens, limit) <= limit:
+            return cluster
+    return None
+
+
+def targeted_hint(db, lesson_id, card_index, user_answer, target_normalized):
+    """
+    为错误答案查找针对性提示（一次按 (lesson_id, card_index) 的索引查询）
+
+    只处理可在请求线程中经缓存标准化的答案，较长的答案返回 None。
+    挖掘时的目标公式与卡片当前的标准化目标公式（target_normalized）不同时（管理员修改了目标，
+    尚未重新挖掘）返回 None。簇只用于判断这是否是常见错误及其占比；差异按学生提交的答案与目标公式计算。
+
+    Returns:
+        dict | None: message_key 与第一个不同记号的位置、答案中的记号、期望的记号及该错误的占比
+    """
+    if len(user_answer) > current_app.config.get('GRADING_INLINE_MAX_LENGTH', 256):
+        return None
+    mistakes = db.common_mistakes.find_one(
+        {'lesson_id': lesson_id, 'card_index': card_index},
+        {'normalizer_version': 1, 'target_normalized': 1, 'clusters': 1}
+    )
+    if not mistakes or mistakes.get('target_normalized') != target_normalized:
+        return None
+    normalized = normalize_latex(user_answer)
+    cluster = match_common_mistake(mistakes, normalized)
+    if cluster is None:
+        return None
+    difference = first_difference(tokenize(normalized), tokenize(target_normalized))
+    return dict(difference, message_key='practice.commonMistake', share=cluster['share'])
+
+
+if __name__ == '__main__':
+    # 在前台执行：python -m app.utils.common_mistakes
+    from app import create_app, get_db
+
+    app = create_app()
+    with app.app_context():
+        print(mine_common_mistakes(get_db()))
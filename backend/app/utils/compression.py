@@ -0,0 +1,152 @@
+"""
+响应压缩 - LaTeX 速成训练器
+按 Accept-Encoding 协商 gzip/deflate 压缩 API 的 JSON 响应
+"""
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+
+# 支持的压缩编码，按优先级排序
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+# 可压缩的响应类型
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'application/javascript',
+])
+
+
+def compress_bytes(data, encoding, level):
+    """按指定编码压缩字节数据"""
+    if encoding == 'gzip':
+        # mtime=0 保证相同输入得到相同输出，便于缓存
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
+
+
+def representation_etags(etag):
+    """
+    返回一个 ETag 在各种编码下对应的全部表示形式
+
+    压缩后的响应使用 "<etag>-<encoding>" 作为强 ETag，条件请求需要同时接受这些形式。
+    """
+    return (etag,) + tuple(f'{etag}-{encoding}' for encoding in SUPPORTED_ENCODINGS)
+
+
+class CompressionCache:
+    """
+    压缩结果的 LRU 缓存
+
+    只缓存带强 ETag 的响应（例如课程目录），键为 (ETag, 编码, 压缩级别)，
+    避免对相同字节反复压缩。按缓存总字节数限制容量。
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+compression_cache = CompressionCache()
+
+
+def choose_encoding():
+    """根据 Accept-Encoding 选择压缩编码，不接受压缩时返回 None"""
+    best, best_quality = None, 0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def init_compression(app):
+    """为 /api/ 下的响应注册压缩处理"""
+    compression_cache.max_bytes = app.config.get('COMPRESS_CACHE_MAX_BYTES', compression_cache.max_bytes)
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config.get('COMPRESS_ENABLED', True) or not request.path.startswith('/api/'):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        encoding = choose_encoding()
+        if encoding is None:
+            return response
+
+        level = app.config.get('COMPRESS_LEVEL', 6)
+        etag, weak = response.get_etag()
+        cache_key = (etag, encoding, level) if etag and not weak else None
+
+        compressed = compression_cache.get(cache_key) if cache_key else None
+        if compressed is None:
+            compressed = compress_bytes(data, encoding, level)
+            if cache_key:
+                compression_cache.put(cache_key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # 不同编码是不同的表示，强 ETag 需要区分
+            response.set_etag(f'{etag}-{encoding}', weak=weak)
+        return response
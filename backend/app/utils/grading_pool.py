@@ -0,0 +1,286 @@
+"""
+隔离判题进程池 - LaTeX 速成训练器
+较长的答案在独立的子进程中标准化，并设置超时：超大或恶意构造的答案不会长时间占用
+gunicorn 同步 worker，超时的进程池被终止并重建。短答案（绝大多数提交）仍在请求线程中
+经 LRU 缓存直接标准化，避免进程间通信的开销。
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+from app.utils.latex_normalizer import normalize_latex, normalize_latex_uncached
+
+
+DEFAULTS = {
+    'GRADING_POOL_ENABLED': True,
+    'GRADING_POOL_WORKERS': 2,
+    'GRADING_POOL_WARM': True,
+    'GRADING_TIMEOUT_MS': 500,
+    'GRADING_INLINE_MAX_LENGTH': 256,
+}
+
+
+def _config(name):
+    if has_app_context():
+        return current_app.config.get(name, DEFAULTS[name])
+    return DEFAULTS[name]
+
+
+def _normalize_in_worker(answer):
+    """在子进程中执行的标准化（模块级函数，spawn 子进程可导入）"""
+    return normalize_latex_uncached(answer)
+
+
+class _Task:
+    """一个已提交到进程池的答案；由进程池的回调或终止进程池的线程完成"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.status = 'pending'  # pending / ok / error / killed
+        self.result = None
+        self.done = threading.Event()
+
+    def finish(self, status, result=None):
+        if self.status == 'pending':
+            self.status, self.result = status, result
+            self.done.set()
+
+
+class _PoolHandle:
+    """一个进程池及其中尚未完成的任务"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.pid = os.getpid()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.killed = False
+
+    def submit(self, answer):
+        task = _Task(answer)
+        with self.lock:
+            if self.killed:
+                task.finish('killed')
+                return task
+            self.in_flight.add(task)
+
+        def complete(status, result=None):
+            with self.lock:
+                self.in_flight.discard(task)
+            task.finish(status, result)
+
+        self.pool.apply_async(
+            _normalize_in_worker, (answer,),
+            callback=lambda result: complete('ok', result),
+            error_callback=lambda error: complete('error')
+        )
+        return task
+
+    def kill(self):
+        """终止进程池；其中其他请求的任务标记为 killed，由提交者重新提交"""
+        with self.lock:
+            self.killed = True
+            tasks, self.in_flight = self.in_flight, set()
+        self.pool.terminate()
+        for task in tasks:
+            task.finish('killed')
+
+
+class GradingPool:
+    """
+    判题子进程池（spawn 方式启动，不继承父进程的数据库连接等状态）
+
+    进程池在应用启动时于后台线程中创建并预热（init_grading_pool），fork 出的子进程中重新预热；
+    未预热时由第一次使用的请求创建。创建过程只持有 _start_lock，不阻塞统计信息和其他锁。
+    任务超时后终止整个进程池（无法单独终止卡住的子进程），下次使用时重建：只有超时的请求
+    把自己的任务判为超时，同一进程池中其他请求尚未完成的任务在新进程池中重新提交一次。
+    """
+
+    def __init__(self):
+        self._handle = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._warm_workers = None
+        self.submitted = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.restarts = 0
+        self.resubmitted = 0
+
+    def _current(self):
+        handle = self._handle
+        if handle is not None and handle.pid == os.getpid() and not handle.killed:
+            return handle
+        return None
+
+    def _get_handle(self, workers):
+        handle = self._current()
+        if handle is not None:
+            return handle
+        with self._start_lock:
+            handle = self._current()
+            if handle is None:
+                pool = multiprocessing.get_context('spawn').Pool(processes=workers)
+                # 等待子进程完成启动和导入，启动耗时不计入判题超时
+                pool.apply(_normalize_in_worker, ('',))
+                handle = _PoolHandle(pool)
+                with self._lock:
+                    self._handle = handle
+            return handle
+
+    def warm(self, workers):
+        """在后台线程中创建并预热进程池（应用启动时、fork 后调用）"""
+        self._warm_workers = workers
+
+        def target():
+            try:
+                self._get_handle(workers)
+            except OSError as e:
+                print(f"Grading pool warm-up failed: {e}")
+
+        threading.Thread(target=target, name='grading-pool-warm', daemon=True).start()
+
+    def _after_fork(self):
+        # 子进程不能使用父进程的进程池：重置状态，父进程预热过时在子进程中重新预热
+        self._handle = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        if self._warm_workers:
+            self.warm(self._warm_workers)
+
+    def _restart(self, handle):
+        """终止仍在执行超时任务的进程池"""
+        with self._lock:
+            if self._handle is handle:
+                self._handle = None
+                self.restarts += 1
+        handle.kill()
+
+    def normalize_many(self, answers, timeout, workers):
+        """
+        在子进程中标准化一组答案，所有答案共享同一个截止时间
+
+        Returns:
+            dict: 答案 -> 标准化结果；超时或失败的答案为 None
+        """
+        if not answers:
+            return {}
+        handle = self._get_handle(workers)
+        tasks = [handle.submit(answer) for answer in answers]
+        with self._lock:
+            self.submitted += len(tasks)
+
+        deadline = time.monotonic() + timeout
+        results = {}
+        timed_out = False
+        resubmitted = False
+        while tasks:
+            killed = []
+            for task in tasks:
+                if not task.done.wait(max(0.0, deadline - time.monotonic())):
+                    results[task.answer] = None
+                    timed_out = True
+                    with self._lock:
+                        self.timeouts += 1
+                elif task.status == 'ok':
+                    results[task.answer] = task.result
+                elif task.status == 'killed' and not resubmitted:
+                    killed.append(task.answer)
+                else:
+                    results[task.answer] = None
+                    with self._lock:
+                        self.failures += 1
+            if timed_out:
+                self._restart(handle)
+                for answer in killed:
+                    results[answer] = None
+                break
+            tasks = []
+            if killed:
+                # 其他请求超时终止了进程池：这些任务未得到完整的执行时间，在新进程池中重新提交一次
+                resubmitted = True
+                handle = self._get_handle(workers)
+                tasks = [handle.submit(answer) for answer in killed]
+                deadline = time.monotonic() + timeout
+                with self._lock:
+                    self.resubmitted += len(tasks)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            handle, self._handle = self._handle, None
+        if handle is not None and handle.pid == os.getpid():
+            handle.pool.terminate()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._current() is not None,
+                'submitted': self.submitted,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'restarts': self.restarts,
+                'resubmitted': self.resubmitted,
+            }
+
+
+grading_pool = GradingPool()
+atexit.register(grading_pool.shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=grading_pool._after_fork)
+
+
+def init_grading_pool(app):
+    """应用启动时在后台预热判题进程池，第一个长答案请求无需等待子进程启动"""
+    if app.config.get('GRADING_POOL_ENABLED', DEFAULTS['GRADING_POOL_ENABLED']) \
+            and app.config.get('GRADING_POOL_WARM', DEFAULTS['GRADING_POOL_WARM']):
+        grading_pool.warm(app.config.get('GRADING_POOL_WORKERS', DEFAULTS['GRADING_POOL_WORKERS']))
+
+
+def normalize_answers(answers):
+    """
+    标准化一组用户答案
+
+    长度不超过 GRADING_INLINE_MAX_LENGTH 的答案在当前线程中经缓存标准化；
+    更长的答案在判题进程池中标准化，GRADING_TIMEOUT_MS 内未完成的结果为 None
+    （调用方按判为错误处理）。进程池被禁用或不可用时全部在当前线程中处理。
+
+    Returns:
+        dict: 答案 -> 标准化结果或 None
+    """
+    inline_max = _config('GRADING_INLINE_MAX_LENGTH')
+    results = {}
+    isolated = []
+    for answer in set(answers):
+        if len(answer) <= inline_max or not _config('GRADING_POOL_ENABLED'):
+            results[answer] = normalize_latex(answer)
+        else:
+            isolated.append(answer)
+
+    if isolated:
+        try:
+            results.update(grading_pool.normalize_many(
+                isolated, _config('GRADING_TIMEOUT_MS') / 1000, _config('GRADING_POOL_WORKERS')
+            ))
+        except OSError:
+            # 无法启动子进程（资源受限的环境），退回当前线程处理
+            for answer in isolated:
+                results[answer] = normalize_latex_uncached(answer)
+    return results
+
+
+def grade_answer(user_answer, target_normalized):
+    """
+    判定单个答案
+
+    Returns:
+        tuple: (是否正确, 判题状态)；状态为 'ok' 或 'timeout'（超时按错误处理）
+    """
+    normalized = normalize_answers([user_answer])[user_answer]
+    if normalized is None:
+        return False, 'timeout'
+    return normalized == target_normalized, 'ok'
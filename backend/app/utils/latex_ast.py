@@ -0,0 +1,609 @@
+"""
+LaTeX 数学公式解析 - LaTeX 速成训练器
+单遍分词 + 递归下降解析，生成规范化的语法树，用于结构化地比较答案
+
+语法树节点均为元组，便于直接比较和哈希：
+    ('sym', 文本)                       字符或无参数命令，如 'x'、'+'、'\\alpha'
+    ('group', 子节点)                   花括号分组（仅在作为上下标底数时保留）
+    ('scripts', 底数, 下标, 上标)        下标/上标为子节点元组或 None，与书写顺序无关
+    ('cmd', 命令名, 参数, 可选参数)       带参数的命令，如 \\frac、\\sqrt[3]{8}
+    ('text', 命令名, 文本)               \\text{...} 等文本命令，保留规范化后的空格
+    ('env', 环境名, 列格式, 行)           \\begin{pmatrix} 等环境，行由单元格元组组成
+    ('apply', 函数, 参数)               函数作用，\\sin x、\\sin{x}、\\sin(x) 得到相同的节点
+
+分词、解析和序列化对输入长度都是线性的；嵌套深度超过 MAX_NESTING 时抛出 LatexParseError。
+"""
+import re
+
+
+# 嵌套层数上限（花括号、环境、括号），防止恶意输入耗尽栈空间
+MAX_NESTING = 100
+
+# 外层数学环境分隔符（按顺序逐层剥离）
+MATH_DELIMITERS = (
+    ('\\begin{equation}', '\\end{equation}'),
+    ('\\begin{equation*}', '\\end{equation*}'),
+    ('$$', '$$'),
+    ('\\[', '\\]'),
+    ('\\(', '\\)'),
+    ('$', '$'),
+)
+
+# 分词：控制词、控制符、空白、单个字符
+TOKEN_PATTERN = re.compile(r'\\[a-zA-Z]+|\\.|\s+|.', re.DOTALL)
+
+SINGLE_CHAR_KINDS = {
+    '{': 'open',
+    '}': 'close',
+    '^': 'sup',
+    '_': 'sub',
+    '&': 'align',
+    '~': 'ws',
+}
+
+# 不影响公式语义的命令：空格、字号/样式、定界符尺寸
+IGNORED_COMMANDS = frozenset([
+    ',', ':', ';', '!', ' ', 'thinspace', 'medspace', 'thickspace', 'negthinspace',
+    'negmedspace', 'negthickspace', 'quad', 'qquad', 'enspace', 'displaystyle', 'textstyle',
+    'scriptstyle', 'limits', 'nolimits', 'hline', 'left', 'right', 'middle', 'big', 'Big',
+    'bigg', 'Bigg', 'bigl', 'bigr', 'Bigl', 'Bigr', 'biggl', 'biggr', 'Biggl', 'Biggr',
+])
+DELIMITER_SIZING = frozenset(['left', 'right', 'middle'])
+
+# 等价命令：映射到单一的标准符号
+SYMBOL_ALIASES = {
+    'ne': '\\neq',
+    'le': '\\leq',
+    'leqslant': '\\leq',
+    'ge': '\\geq',
+    'geqslant': '\\geq',
+    'to': '\\rightarrow',
+    'gets': '\\leftarrow',
+    'iff': '\\leftrightarrow',
+    'implies': '\\Rightarrow',
+    'cong': '\\approx',
+    'subset': '\\subseteq',
+    'supset': '\\supseteq',
+    'lt': '<',
+    'gt': '>',
+    'cdot': '\\times',
+    'lbrace': '\\{',
+    'rbrace': '\\}',
+    'vert': '|',
+    'lvert': '|',
+    'rvert': '|',
+    'Vert': '\\|',
+    'lVert': '\\|',
+    'rVert': '\\|',
+}
+
+# 带参数命令的别名
+COMMAND_ALIASES = {
+    'dfrac': 'frac',
+    'tfrac': 'frac',
+    'dbinom': 'binom',
+    'tbinom': 'binom',
+}
+
+# 数集简写：\R 等价于 \mathbb{R}
+NUMBER_SET_ALIASES = frozenset(['R', 'Z', 'N', 'Q', 'C'])
+
+# 命令的必选参数个数
+COMMAND_ARITY = {
+    'frac': 2, 'binom': 2, 'stackrel': 2, 'overset': 2, 'underset': 2,
+    'sqrt': 1, 'vec': 1, 'hat': 1, 'bar': 1, 'dot': 1, 'ddot': 1, 'tilde': 1,
+    'widehat': 1, 'widetilde': 1, 'overline': 1, 'underline': 1, 'overrightarrow': 1,
+    'overbrace': 1, 'underbrace': 1, 'mathbb': 1, 'mathbf': 1, 'mathcal': 1, 'mathrm': 1,
+    'mathit': 1, 'mathfrak': 1, 'mathsf': 1, 'boldsymbol': 1, 'pmod': 1,
+}
+
+# 参数按原文处理的文本命令，值为规范化后的命令名
+TEXT_COMMANDS = {
+    'text': 'text', 'textrm': 'text', 'textnormal': 'text', 'mbox': 'text',
+    'textit': 'textit', 'textbf': 'textbf', 'operatorname': 'operatorname',
+}
+
+# 带列格式参数的环境
+ENVIRONMENTS_WITH_SPEC = frozenset(['array', 'tabular', 'alignat', 'alignat*'])
+
+# 函数名：\sin x、\sin{x}、\sin(x) 视为同一种函数作用
+FUNCTION_NAMES = frozenset([
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'sinh', 'cosh', 'tanh', 'coth',
+    'arcsin', 'arccos', 'arctan', 'ln', 'log', 'lg', 'exp',
+])
+FUNCTION_SYMBOLS = frozenset('\\' + name for name in FUNCTION_NAMES)
+# 未加反斜杠、紧跟 '(' 的函数名（如 sin(x)），按长度降序匹配
+BARE_FUNCTION_NAMES = tuple(sorted(FUNCTION_NAMES, key=len, reverse=True))
+
+# 可以作为省略括号的函数参数的希腊字母
+GREEK_LETTERS = frozenset('\\' + name for name in (
+    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'varepsilon', 'zeta', 'eta', 'theta',
+    'vartheta', 'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi', 'pi', 'varpi', 'rho', 'varrho',
+    'sigma', 'varsigma', 'tau', 'upsilon', 'phi', 'varphi', 'chi', 'psi', 'omega',
+    'Gamma', 'Delta', 'Theta', 'Lambda', 'Xi', 'Pi', 'Sigma', 'Upsilon', 'Phi', 'Psi', 'Omega',
+))
+
+OPEN_PAREN = ('sym', '(')
+CLOSE_PAREN = ('sym', ')')
+EMPTY_GROUP = ('group', ())
+
+
+class LatexParseError(ValueError):
+    """公式无法解析（花括号不匹配、缺少参数、嵌套过深等）"""
+
+
+def strip_math_delimiters(latex_str):
+    """剥离外层数学环境分隔符"""
+    for opening, closing in MATH_DELIMITERS:
+        if len(latex_str) >= len(opening) + len(closing) \
+                and latex_str.startswith(opening) and latex_str.endswith(closing):
+            latex_str = latex_str[len(opening):-len(closing)].strip()
+    return latex_str
+
+
+def _classify_token(text):
+    if text[0] == '\\' and len(text) > 1:
+        name = text[1:]
+        if name == '\\':
+            return ('newline', name)
+        if name == 'begin' or name == 'end':
+            return (name, name)
+        return ('cmd', name)
+    if text.isspace():
+        return ('ws', text)
+    return (SINGLE_CHAR_KINDS.get(text, 'char'), text)
+
+
+# 记号文本 -> 记号的缓存（公式中的记号高度重复），容量有上限
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LIMIT = 4096
+
+
+def tokenize(latex_str):
+    """
+    将公式切分为 (类型, 值) 记号列表
+
+    类型：cmd（控制词/控制符，值不含反斜杠）、begin、end、newline（\\\\）、
+    open、close、sup、sub、align、ws、char。
+    """
+    cache = _TOKEN_CACHE
+    tokens = []
+    append = tokens.append
+    for text in TOKEN_PATTERN.findall(latex_str):
+        token = cache.get(text)
+        if token is None:
+            token = _classify_token(text)
+            if len(cache) < _TOKEN_CACHE_LIMIT:
+                cache[text] = token
+        append(token)
+    return tokens
+
+
+def is_function(node):
+    """节点是否为函数名（可带上下标，如 \\sin^2）"""
+    if node[0] == 'scripts':
+        node = node[1]
+    return node[0] == 'sym' and node[1] in FUNCTION_SYMBOLS
+
+
+def is_implicit_argument(node):
+    """节点能否作为省略括号的函数参数（\\sin x、\\sin \\theta、\\sin x^2）"""
+    if node[0] == 'scripts':
+        node = node[1]
+    kind = node[0]
+    if kind == 'sym':
+        value = node[1]
+        return value.isalnum() or value in GREEK_LETTERS
+    return kind in ('cmd', 'group')
+
+
+def unwrap(group):
+    """单元素分组等价于其元素本身"""
+    children = group[1]
+    return children[0] if len(children) == 1 else group
+
+
+class _Parser:
+    """递归下降解析器，每个记号只被访问常数次"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.length = len(tokens)
+
+    def peek(self):
+        """跳过空白，返回下一个记号（不消费），输入结束时返回 None"""
+        tokens, pos = self.tokens, self.pos
+        while pos < self.length and tokens[pos][0] == 'ws':
+            pos += 1
+        self.pos = pos
+        return tokens[pos] if pos < self.length else None
+
+    def parse(self):
+        return tuple(self.parse_sequence(0, ()))
+
+    def parse_sequence(self, depth, stop_kinds, stop_char=None):
+        """解析记号序列，遇到 stop_kinds 中的记号类型或 stop_char 字符时停止（不消费）"""
+        if depth > MAX_NESTING:
+            raise LatexParseError('formula is nested too deeply')
+
+        nodes = []
+        while True:
+            token = self.peek()
+            if token is None:
+                break
+            kind, value = token
+            if kind in stop_kinds or (kind == 'char' and value == stop_char):
+                break
+
+            if kind == 'sup' or kind == 'sub':
+                base = nodes.pop() if nodes else EMPTY_GROUP
+                nodes.append(self.parse_scripts(base, depth))
+                continue
+            if kind == 'close':
+                raise LatexParseError("unbalanced '}'")
+
+            node = self.parse_atom(depth)
+            if node is None:
+                continue
+            if node[0] == 'group':
+                following = self.peek()
+                if following is not None and following[0] in ('sup', 'sub'):
+                    nodes.append(unwrap(node))
+                elif nodes and is_function(nodes[-1]):
+                    nodes.append(node)
+                else:
+                    # 普通位置的分组不影响语义
+                    nodes.extend(node[1])
+                continue
+            nodes.append(node)
+
+        return canonicalize_sequence(nodes)
+
+    def parse_atom(self, depth):
+        kind, value = self.tokens[self.pos]
+        self.pos += 1
+
+        if kind == 'char':
+            return ('sym', value)
+        if kind == 'open':
+            children = self.parse_sequence(depth + 1, ('close',))
+            self.expect('close')
+            return ('group', tuple(children))
+        if kind == 'cmd':
+            return self.parse_command(value, depth)
+        if kind == 'begin':
+            return self.parse_environment(depth)
+        if kind == 'end':
+            # 没有对应 \begin 的 \end{...}
+            self.read_raw_group()
+            return None
+        if kind == 'align':
+            return ('sym', '&')
+        if kind == 'newline':
+            return ('sym', '\\\\')
+        return None
+
+    def expect(self, kind):
+        """消费指定类型的记号，缺失时抛出 LatexParseError"""
+        if not self.consume(kind):
+            raise LatexParseError(f'expected {kind!r}')
+
+    def consume(self, kind, value=None):
+        token = self.peek()
+        if token is not None and token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse_argument(self, depth):
+        """解析命令或上下标的一个参数：花括号分组或单个记号"""
+        token = self.peek()
+        if token is None:
+            raise LatexParseError('missing argument')
+        kind = token[0]
+        if kind == 'open':
+            self.pos += 1
+            children = self.parse_sequence(depth + 1, ('close',))
+            self.expect('close')
+            return tuple(children)
+        if kind in ('char', 'cmd'):
+            node = self.parse_atom(depth)
+            return () if node is None else (node,)
+        raise LatexParseError('missing argument')
+
+    def parse_scripts(self, base, depth):
+        """解析底数之后连续的上标/下标，下标和上标的书写顺序不影响结果"""
+        sub = sup = None
+        while True:
+            token = self.peek()
+            if token is None or token[0] not in ('sup', 'sub'):
+                break
+            self.pos += 1
+            if (sup if token[0] == 'sup' else sub) is not None:
+                # 重复的上标或下标（x^2^3）：已有部分作为新的底数
+                depth += 1
+                if depth > MAX_NESTING:
+                    raise LatexParseError('formula is nested too deeply')
+                base, sub, sup = ('scripts', base, sub, sup), None, None
+            if token[0] == 'sup':
+                sup = self.parse_argument(depth + 1)
+            else:
+                sub = self.parse_argument(depth + 1)
+        return ('scripts', base, sub, sup)
+
+    def read_raw_group(self):
+        """读取花括号分组的原文（用于环境名、列格式和文本命令）"""
+        token = self.peek()
+        if token is None:
+            return ''
+        if token[0] != 'open':
+            self.pos += 1
+            return token[1]
+
+        self.pos += 1
+        parts = []
+        level = 1
+        while self.pos < self.length:
+            kind, value = self.tokens[self.pos]
+            self.pos += 1
+            if kind == 'open':
+                level += 1
+            elif kind == 'close':
+                level -= 1
+                if level == 0:
+                    break
+            parts.append('\\' + value if kind in ('cmd', 'begin', 'end') else value)
+        if level:
+            raise LatexParseError("missing '}'")
+        return ''.join(parts)
+
+    def parse_command(self, name, depth):
+        if name in IGNORED_COMMANDS:
+            if name in DELIMITER_SIZING:
+                # \left. 和 \right. 表示不显示定界符
+                self.consume('char', '.')
+            return None
+        if name in SYMBOL_ALIASES:
+            return ('sym', SYMBOL_ALIASES[name])
+        if name in NUMBER_SET_ALIASES:
+            return ('cmd', 'mathbb', ((('sym', name),),), None)
+        if name in TEXT_COMMANDS:
+            text = ' '.join(self.read_raw_group().split())
+            return ('text', TEXT_COMMANDS[name], text)
+
+        name = COMMAND_ALIASES.get(name, name)
+        arity = COMMAND_ARITY.get(name)
+        if arity is None:
+            return ('sym', '\\' + name)
+
+        optional = None
+        if name == 'sqrt' and self.consume('char', '['):
+            optional = tuple(self.parse_sequence(depth + 1, ('close',), stop_char=']'))
+            self.consume('char', ']')
+        args = tuple(self.parse_argument(depth + 1) for _ in range(arity))
+        return ('cmd', name, args, optional)
+
+    def parse_environment(self, depth):
+        """解析 \\begin{name} ... \\end{name}，按 \\\\ 分行、按 & 分列"""
+        name = ''.join(self.read_raw_group().split())
+        spec = None
+        if name in ENVIRONMENTS_WITH_SPEC:
+            spec = ''.join(self.read_raw_group().split())
+
+        rows = []
+        cells = []
+        while True:
+            cells.append(tuple(self.parse_sequence(depth + 1, ('align', 'newline', 'end', 'close'))))
+            token = self.peek()
+            if token is None or token[0] == 'close':
+                raise LatexParseError(f'missing \\end{{{name}}}')
+            self.pos += 1
+            if token[0] == 'align':
+                continue
+            if token[0] == 'newline':
+                rows.append(tuple(cells))
+                cells = []
+                continue
+            # \end{name}
+            if ''.join(self.read_raw_group().split()) != name:
+                raise LatexParseError(f'mismatched \\end for {name}')
+            break
+
+        # 最后一行末尾多余的 \\ 不产生新行
+        if cells != [()] or not rows:
+            rows.append(tuple(cells))
+        return ('env', name, spec, tuple(rows))
+
+
+def _convert_bare_functions(nodes):
+    """将紧跟 '(' 的未加反斜杠的函数名（如 sin(x)）转换为函数命令"""
+    if not any(node == OPEN_PAREN for node in nodes):
+        return nodes
+
+    result = []
+    for node in nodes:
+        if node == OPEN_PAREN:
+            # 收集紧挨着的连续单字母
+            start = len(result)
+            while start > 0 and result[start - 1][0] == 'sym' and len(result[start - 1][1]) == 1 \
+                    and result[start - 1][1].isalpha():
+                start -= 1
+            if start < len(result):
+                letters = ''.join(item[1] for item in result[start:])
+                for name in BARE_FUNCTION_NAMES:
+                    if letters.endswith(name):
+                        del result[len(result) - len(name):]
+                        result.append(('sym', '\\' + name))
+                        break
+        result.append(node)
+    return result
+
+
+def _apply_parenthesized(nodes):
+    """函数名后紧跟圆括号时，括号内容作为函数参数（单遍，使用栈匹配括号）"""
+    frames = [[]]
+    openers = []
+    for node in nodes:
+        if node == OPEN_PAREN:
+            current = frames[-1]
+            function = current.pop() if current and is_function(current[-1]) else None
+            if len(frames) > MAX_NESTING:
+                raise LatexParseError('formula is nested too deeply')
+            frames.append([])
+            openers.append(function)
+        elif node == CLOSE_PAREN and len(frames) > 1:
+            inner = frames.pop()
+            function = openers.pop()
+            if function is not None:
+                frames[-1].append(('apply', function, tuple(inner)))
+            else:
+                frames[-1].append(OPEN_PAREN)
+                frames[-1].extend(inner)
+                frames[-1].append(CLOSE_PAREN)
+        else:
+            frames[-1].append(node)
+
+    # 未闭合的括号按普通符号处理
+    while len(frames) > 1:
+        inner = frames.pop()
+        function = openers.pop()
+        if function is not None:
+            frames[-1].append(function)
+        frames[-1].append(OPEN_PAREN)
+        frames[-1].extend(inner)
+    return frames[0]
+
+
+def _apply_implicit(nodes):
+    """函数名后紧跟单个原子或分组时（\\sin x、\\sin{x}），视为省略括号的函数作用"""
+    result = []
+    index = 0
+    count = len(nodes)
+    while index < count:
+        node = nodes[index]
+        if is_function(node) and index + 1 < count and is_implicit_argument(nodes[index + 1]):
+            argument = nodes[index + 1]
+            args = argument[1] if argument[0] == 'group' else (argument,)
+            result.append(('apply', node, tuple(args)))
+            index += 2
+            continue
+        result.append(node)
+        index += 1
+    return result
+
+
+def canonicalize_sequence(nodes):
+    """对同一层级的节点序列做函数作用的规范化"""
+    if not any(node == OPEN_PAREN or is_function(node) for node in nodes):
+        return nodes
+    nodes = _convert_bare_functions(nodes)
+    nodes = _apply_parenthesized(nodes)
+    return _apply_implicit(nodes)
+
+
+def parse_latex(latex_str):
+    """
+    将 LaTeX 公式解析为规范化语法树
+
+    Raises:
+        LatexParseError: 嵌套层数超过 MAX_NESTING
+    """
+    return _Parser(tokenize(strip_math_delimiters(latex_str.strip()))).parse()
+
+
+def _ends_with_control_word(text):
+    """字符串是否以控制词结尾（其后紧跟字母时需要空格分隔）"""
+    index = len(text) - 1
+    while index >= 0 and text[index].isalpha() and text[index].isascii():
+        index -= 1
+    return index < len(text) - 1 and index >= 0 and text[index] == '\\'
+
+
+def serialize_sequence(nodes):
+    """将节点序列序列化为规范字符串"""
+    parts = []
+    previous = ''
+    for node in nodes:
+        text = serialize_node(node)
+        if text and previous and text[0].isalpha() and _ends_with_control_word(previous):
+            parts.append(' ')
+        parts.append(text)
+        if text:
+            previous = text
+    return ''.join(parts)
+
+
+def serialize_node(node):
+    """将单个节点序列化为规范字符串"""
+    kind = node[0]
+    if kind == 'sym':
+        return node[1]
+    if kind == 'group':
+        return '{' + serialize_sequence(node[1]) + '}'
+    if kind == 'scripts':
+        _, base, sub, sup = node
+        text = serialize_node(base)
+        if sub is not None:
+            text += '_{' + serialize_sequence(sub) + '}'
+        if sup is not None:
+            text += '^{' + serialize_sequence(sup) + '}'
+        return text
+    if kind == 'cmd':
+        _, name, args, optional = node
+        text = '\\' + name
+        if optional is not None:
+            text += '[' + serialize_sequence(optional) + ']'
+        return text + ''.join('{' + serialize_sequence(arg) + '}' for arg in args)
+    if kind == 'text':
+        return '\\' + node[1] + '{' + node[2] + '}'
+    if kind == 'env':
+        _, name, spec, rows = node
+        body = '\\\\'.join('&'.join(serialize_sequence(cell) for cell in row) for row in rows)
+        return '\\begin{' + name + '}' + ('{' + spec + '}' if spec is not None else '') + body + '\\end{' + name + '}'
+    if kind == 'apply':
+        return serialize_node(node[1]) + '(' + serialize_sequence(node[2]) + ')'
+    raise LatexParseError(f'unknown node kind: {kind}')
+
+
+def canonical_latex(latex_str):
+    """返回公式的规范字符串形式：结构等价的公式得到相同的字符串"""
+    return serialize_sequence(parse_latex(latex_str))
+
+
+def latex_equivalent(first, second):
+    """两个公式的语法树是否结构等价"""
+    return parse_latex(first) == parse_latex(second)
+
+
+def _raw_comparison_tokens(latex_str):
+    """无法解析的（通常是尚未输入完整的）公式：按原文记号比较，统一等价命令并忽略空格命令"""
+    tokens = []
+    for kind, value in tokenize(strip_math_delimiters(latex_str.strip())):
+        if kind == 'ws':
+            continue
+        if kind == 'cmd':
+            if value in IGNORED_COMMANDS:
+                continue
+            if value in SYMBOL_ALIASES:
+                tokens.append(SYMBOL_ALIASES[value])
+                continue
+            value = COMMAND_ALIASES.get(value, value)
+        if kind in ('cmd', 'begin', 'end', 'newline'):
+            value = '\\' + value
+        tokens.append(value)
+    return tokens
+
+
+def comparison_tokens(latex_str):
+    """
+    逐记号比较用的记号文本列表（不含空白）
+
+    能解析时取规范形式的记号，与 canonical_latex 的比较结果一致；
+    不能解析时（编辑中途的 \\frac{1、x^ 等）退回原文记号。
+    """
+    try:
+        text = canonical_latex(latex_str)
+    except LatexParseError:
+        return _raw_comparison_tokens(latex_str)
+    return [token for token in TOKEN_PATTERN.findall(text) if not token.isspace()]
@@ -0,0 +1,192 @@
+"""
+LaTeX 答案标准化 - LaTeX 速成训练器
+答案与目标公式由 app.utils.latex_ast 解析为规范化语法树后序列化比较，结果经 LRU 缓存
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from app.utils.latex_ast import LatexParseError, canonical_latex, strip_math_delimiters
+
+
+# 标准化规则版本号：规则的输出发生变化时递增，已保存的 target_normalized 随之失效
+# 2: 由正则替换改为语法树规范化（区分大小写，支持嵌套分组、矩阵等环境）
+NORMALIZER_VERSION = 2
+
+# Practice.normalize_latex_answer 使用的空白规则
+WHITESPACE_PATTERN = re.compile(r'\s+')
+BRACE_OPEN_SPACE_PATTERN = re.compile(r'\{\s+')
+BRACE_CLOSE_SPACE_PATTERN = re.compile(r'\s+\}')
+COMMAND_SPACE_PATTERN = re.compile(r'(\\[a-zA-Z]+)\s+')
+
+
+def normalize_latex_uncached(latex_str):
+    """不经过缓存的标准化（见 normalize_latex）"""
+    try:
+        return canonical_latex(latex_str)
+    except LatexParseError:
+        # 无法解析（花括号不匹配、嵌套过深等）时只剥离分隔符并去除空白，按原文比较
+        return ''.join(strip_math_delimiters(latex_str.strip()).split())
+    except Exception:
+        # 如果出错，回退到简单处理
+        return latex_str.strip().replace(' ', '')
+
+
+class NormalizationCache:
+    """
+    标准化结果的 LRU 缓存
+
+    学习者反复提交相同的答案（x^2、\\frac{1}{2} 以及常见错误写法），复习流程也会重复检查
+    相同的字符串。键为 (规则版本号, 原始输入)，按条目数限制容量；
+    超过 max_input_length 的输入不进入缓存，避免被超长输入撑大进程内存。
+    """
+
+    def __init__(self, max_entries=4096, max_input_length=256):
+        self.max_entries = max_entries
+        self.max_input_length = max_input_length
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+
+    def normalize(self, latex_str):
+        """返回 latex_str 的标准化结果，命中缓存时不重新计算"""
+        if len(latex_str) > self.max_input_length or self.max_entries <= 0:
+            with self._lock:
+                self.bypassed += 1
+            return normalize_latex_uncached(latex_str)
+
+        key = (NORMALIZER_VERSION, latex_str)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = normalize_latex_uncached(latex_str)
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_input_length': self.max_input_length,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bypassed': self.bypassed,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+normalization_cache = NormalizationCache()
+
+
+def init_normalizer_cache(app):
+    """按应用配置设置标准化缓存容量"""
+    normalization_cache.max_entries = app.config.get('NORMALIZER_CACHE_SIZE', normalization_cache.max_entries)
+    normalization_cache.max_input_length = app.config.get(
+        'NORMALIZER_CACHE_MAX_INPUT_LENGTH', normalization_cache.max_input_length
+    )
+    normalization_cache.clear()
+
+
+def normalize_latex(latex_str):
+    """
+    标准化 LaTeX 答案，用于判断用户答案与目标公式是否等价
+
+    剥离数学环境分隔符后解析为语法树（见 app.utils.latex_ast），忽略空白、空格命令和
+    \\left/\\right，统一等价命令、函数写法及上下标顺序，再序列化为规范字符串。
+    结果经 normalization_cache 缓存。
+    """
+    if not latex_str:
+        return ""
+
+    if not isinstance(latex_str, str):
+        return normalize_latex_uncached(latex_str)
+    return normalization_cache.normalize(latex_str)
+
+
+def normalize_latex_answer(answer):
+    """标准化LaTeX答案，去除多余空格和换行（保留大小写和命令间的单个空格）"""
+    if not answer:
+        return ""
+
+    # 去除首尾空白，将连续空白替换为单个空格
+    answer = WHITESPACE_PATTERN.sub(' ', answer.strip())
+
+    # 去除花括号内外的多余空格，例如: \frac { a } { b } -> \frac{a}{b}
+    answer = BRACE_OPEN_SPACE_PATTERN.sub('{', answer)
+    answer = BRACE_CLOSE_SPACE_PATTERN.sub('}', answer)
+
+    # 去除命令后的多余空格，例如: \frac  {a}{b} -> \frac{a}{b}
+    return COMMAND_SPACE_PATTERN.sub(r'\1', answer)
+
+
+def normalized_target(card):
+    """
+    获取练习卡片目标公式的标准化形式
+
+    优先使用写入课程时保存的 target_normalized；版本号过期或缺失时现场计算。
+    """
+    if card.get('normalizer_version') == NORMALIZER_VERSION and 'target_normalized' in card:
+        return card['target_normalized']
+    return normalize_latex(card.get('target_formula', ''))
+
+
+def annotate_practice_card(card):
+    """
+    为练习卡片写入 target_normalized 和 normalizer_version
+
+    Returns:
+        bool: 卡片是否发生变化
+    """
+    if card.get('type') != 'practice':
+        return False
+    target_normalized = normalize_latex(card.get('target_formula', ''))
+    if (card.get('normalizer_version') == NORMALIZER_VERSION
+            and card.get('target_normalized') == target_normalized):
+        return False
+    card['target_normalized'] = target_normalized
+    card['normalizer_version'] = NORMALIZER_VERSION
+    return True
+
+
+def check_normalized_answer(user_answer, target_normalized):
+    """用已标准化的目标公式检查答案，只需标准化用户答案"""
+    try:
+        return normalize_latex(user_answer) == target_normalized
+    except Exception:
+        return False
+
+
+def check_latex_answer(user_answer, target_answer):
+    """检查 LaTeX 答案是否正确 - 比较两者标准化后的形式"""
+    try:
+        return normalize_latex(user_answer) == normalize_latex(target_answer)
+    except Exception:
+        # 出错时回退到简单比较
+        try:
+            simple_user = user_answer.strip().lower().replace(' ', '')
+            simple_target = target_answer.strip().lower().replace(' ', '')
+            return simple_user == simple_target
+        except Exception:
+            return False
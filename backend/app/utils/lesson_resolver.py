@@ -0,0 +1,50 @@
+"""
+课程ID解析 - LaTeX 速成训练器
+统一解析 ObjectId、lesson-{sequence} 别名和整数序号形式的课程引用
+"""
+from bson import ObjectId
+from app.models.lesson_catalog import lesson_catalog
+
+
+LESSON_ALIAS_PREFIX = 'lesson-'
+
+
+def lesson_query(lesson_ref):
+    """
+    将课程引用转换为单个 Mongo 查询条件
+
+    Returns:
+        dict | None: {'_id': ...} 或 {'sequence': ...}；引用格式无效时返回 None
+    """
+    if isinstance(lesson_ref, ObjectId):
+        return {'_id': lesson_ref}
+    if isinstance(lesson_ref, bool):
+        return None
+    if isinstance(lesson_ref, int):
+        return {'sequence': lesson_ref}
+    if not isinstance(lesson_ref, str):
+        return None
+
+    if ObjectId.is_valid(lesson_ref):
+        return {'_id': ObjectId(lesson_ref)}
+    if lesson_ref.startswith(LESSON_ALIAS_PREFIX):
+        try:
+            return {'sequence': int(lesson_ref[len(LESSON_ALIAS_PREFIX):])}
+        except ValueError:
+            return None
+    return None
+
+
+def resolve_lesson(lesson_ref):
+    """
+    解析课程引用，返回课程文档
+
+    只查询课程目录缓存中的别名表（O(1)、无数据库访问）。所有写入 lessons 的路径都会递增
+    目录版本号，各进程在 check_interval 内重新加载快照，因此快照中不存在的课程即视为不存在：
+    格式正确但不存在的ID返回 None，不会在每个请求上查询数据库。格式无效的引用直接返回 None。
+
+    注意：返回的文档可能来自共享缓存，调用方不得修改。
+    """
+    if lesson_query(lesson_ref) is None:
+        return None
+    return lesson_catalog.resolve(lesson_ref)
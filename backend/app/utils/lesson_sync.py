@@ -0,0 +1,84 @@
+"""
+课程派生数据同步 - LaTeX 速成训练器
+课程内容写入后统一调用，同步派生集合并通知各进程刷新课程目录
+"""
+from pymongo import UpdateOne
+from app import get_db
+from app.models.lesson import Lesson
+from app.models.lesson_catalog import bump_catalog_version
+from app.models.practice_item import PracticeItem
+from app.utils.latex_normalizer import annotate_practice_card
+
+
+def refresh_content_hashes(db, lessons):
+    """重新计算课程的 content_hash，只写回发生变化的课程"""
+    operations = []
+    for lesson in lessons:
+        content_hash = Lesson.compute_content_hash(lesson)
+        if lesson.get('content_hash') != content_hash:
+            lesson['content_hash'] = content_hash
+            operations.append(UpdateOne({'_id': lesson['_id']}, {'$set': {'content_hash': content_hash}}))
+    if operations:
+        db.lessons.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def refresh_normalized_targets(db, lessons):
+    """
+    为练习卡片写入标准化后的目标公式（target_normalized）及标准化规则版本号
+
+    按卡片逐条条件更新：只有该位置的卡片目标公式仍与读取时一致才写入，
+    避免覆盖并发的卡片编辑。
+    """
+    operations = []
+    for lesson in lessons:
+        for field in ('cards', 'cards_en'):
+            for index, card in enumerate(lesson.get(field) or []):
+                if annotate_practice_card(card):
+                    operations.append(UpdateOne(
+                        {'_id': lesson['_id'], f'{field}.{index}.target_formula': card.get('target_formula')},
+                        {'$set': {
+                            f'{field}.{index}.target_normalized': card['target_normalized'],
+                            f'{field}.{index}.normalizer_version': card['normalizer_version']
+                        }}
+                    ))
+    if operations:
+        db.lessons.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def refresh_derived_data(db=None, lesson_ids=None):
+    """
+    根据课程当前内容刷新全部派生数据（标准化目标公式、内容哈希、练习题索引）
+
+    Args:
+        db: 数据库实例，默认使用应用数据库
+        lesson_ids: 需要刷新的课程ID列表，None 表示全部课程
+    """
+    db = db if db is not None else get_db()
+
+    lesson_filter = {} if lesson_ids is None else {'_id': {'$in': list(lesson_ids)}}
+    lessons = list(db.lessons.find(lesson_filter))
+
+    refresh_normalized_targets(db, lessons)
+    refresh_content_hashes(db, lessons)
+    PracticeItem.sync_lessons(db, lesson_ids, lessons=lessons)
+
+
+def lessons_changed(db=None, lesson_ids=None):
+    """
+    课程内容发生变化后的统一处理
+
+    所有修改 lessons 集合的路径（管理后台编辑、导入翻译、增量更新、重置数据库、
+    维护脚本等）在写入完成后都必须调用此函数。
+
+    Args:
+        db: 数据库实例，默认使用应用数据库
+        lesson_ids: 发生变化的课程ID列表，None 表示全部课程
+    """
+    db = db if db is not None else get_db()
+
+    refresh_derived_data(db, lesson_ids)
+
+    # 递增目录版本号，各进程重新加载课程目录
+    bump_catalog_version(db)
@@ -0,0 +1,215 @@
+"""
+实时答案校验 - LaTeX 速成训练器
+编辑器每次修改后判断当前答案与目标公式"目前一致 / 从第 k 个记号开始不同"，不保存练习记录
+
+会话ID是签名令牌（用户、课程、卡片），任何 worker 都能验证；会话的当前答案保存在
+live_validation_sessions 集合中（TTL 索引按会话有效期删除），按增量编辑（splice）更新答案时
+请求可以落在任何 worker 上。
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from pymongo.errors import DuplicateKeyError
+
+from app.utils.latex_ast import (
+    COMMAND_ALIASES, IGNORED_COMMANDS, SYMBOL_ALIASES, TOKEN_PATTERN, LatexParseError, canonical_latex,
+    comparison_tokens, tokenize
+)
+from app.utils.latex_normalizer import normalize_latex
+
+
+LIVE_SESSION_SALT = 'practice-live-validation'
+LIVE_SESSION_COLLECTION = 'live_validation_sessions'
+CONTROL_WORD = re.compile(r'\\[a-zA-Z]+')
+
+
+class LiveSessionError(Exception):
+    """会话令牌无效或已过期"""
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=LIVE_SESSION_SALT)
+
+
+def create_session_token(user_id, lesson_id, card_index):
+    """为用户在某张练习卡片上的实时校验生成会话令牌"""
+    return _serializer().dumps({'u': str(user_id), 'l': str(lesson_id), 'c': card_index})
+
+
+def load_session_token(token, user_id):
+    """
+    验证会话令牌
+
+    Returns:
+        tuple: (课程ID, 卡片索引)
+
+    Raises:
+        LiveSessionError: 令牌无效、过期或不属于该用户
+    """
+    max_age = current_app.config.get('LIVE_VALIDATION_SESSION_TTL', 1800)
+    try:
+        data = _serializer().loads(token, max_age=max_age)
+    except SignatureExpired:
+        raise LiveSessionError('会话已过期')
+    except BadSignature:
+        raise LiveSessionError('会话无效')
+    if data.get('u') != str(user_id):
+        raise LiveSessionError('会话无效')
+    return data['l'], data['c']
+
+
+@lru_cache(maxsize=1024)
+def target_tokens(target_normalized):
+    """目标公式（已标准化）的比较记号，按标准化结果缓存"""
+    return tuple(token for token in TOKEN_PATTERN.findall(target_normalized) if not token.isspace())
+
+
+# 补全探针：追加在答案末尾的占位命令，缺少参数的命令（\frac a）按已输入的部分规范化
+CURSOR = '\\livecursor'
+
+
+def _split_unfinished_command(answer):
+    """
+    答案末尾可能尚未输入完整的控制词（\\、\\fr、\\le 之于 \\left）
+
+    Returns:
+        tuple: (其余部分, 已输入的命令名)；末尾不是控制词时为 (答案, None)
+    """
+    tokens = TOKEN_PATTERN.findall(answer)
+    if tokens and (tokens[-1] == '\\' or CONTROL_WORD.fullmatch(tokens[-1])):
+        return answer[:-len(tokens[-1])], tokens[-1][1:]
+    return answer, None
+
+
+def _tokens_before_cursor(answer):
+    """在答案末尾追加占位命令、补齐未闭合的花括号后规范化，返回占位命令之前的记号；无法解析时返回 None"""
+    depth = 0
+    try:
+        for kind, _ in tokenize(answer):
+            if kind == 'open':
+                depth += 1
+            elif kind == 'close':
+                depth = max(0, depth - 1)
+        text = canonical_latex(answer + CURSOR + '}' * depth)
+    except LatexParseError:
+        return None
+    tokens = [token for token in TOKEN_PATTERN.findall(text) if not token.isspace()]
+    return tokens[:tokens.index(CURSOR)] if CURSOR in tokens else None
+
+
+def _may_complete_to(name, expected):
+    """未输入完整的命令名补全后能否得到下一个期望记号，或者是规范化时会被忽略的命令（\\left 等）"""
+    if any(command.startswith(name) for command in IGNORED_COMMANDS):
+        return True
+    if expected is None:
+        return False
+    if expected.startswith('\\' + name):
+        return True
+    return any(alias.startswith(name) for alias, value in SYMBOL_ALIASES.items() if value == expected) \
+        or any(alias.startswith(name) for alias, value in COMMAND_ALIASES.items() if '\\' + value == expected)
+
+
+def _common_prefix(actual, expected):
+    common = 0
+    limit = min(len(actual), len(expected))
+    while common < limit and actual[common] == expected[common]:
+        common += 1
+    return common
+
+
+def compare_answer(answer, target_normalized):
+    """
+    比较当前答案与目标公式
+
+    编辑中途的答案按可能的补全比较：末尾的控制词可能尚未输入完整（\\fr 之于 \\frac），
+    命令可能还缺少参数或右花括号（\\frac a、\\frac{a）。任一读法与目标公式的开头一致即为 prefix。
+
+    Returns:
+        dict: status 为 match（完全正确，与提交判题结果一致）、prefix（目前为止一致）
+              或 diverged（diverges_at 为第一个不同的记号位置）
+    """
+    if normalize_latex(answer) == target_normalized:
+        return {'status': 'match'}
+
+    expected = target_tokens(target_normalized)
+    rest, unfinished = _split_unfinished_command(answer)
+    readings = [(answer, None)] if unfinished is None else [(answer, None), (rest, unfinished)]
+    diverges_at = 0
+    for text, name in readings:
+        for actual in (comparison_tokens(text), _tokens_before_cursor(text)):
+            if actual is None:
+                continue
+            common = _common_prefix(actual, expected)
+            if common == len(actual) and (
+                    name is None or _may_complete_to(name, expected[common] if common < len(expected) else None)):
+                return {'status': 'prefix', 'tokens': common}
+            diverges_at = max(diverges_at, common)
+    return {'status': 'diverged', 'diverges_at': diverges_at}
+
+
+def load_session_state(db, session_id):
+    """
+    读取会话的当前答案
+
+    Returns:
+        tuple | None: (最后处理的编辑序号, 当前答案)；会话没有保存过答案或已过期时为 None
+    """
+    document = db[LIVE_SESSION_COLLECTION].find_one({'_id': session_id}, {'seq': 1, 'answer': 1})
+    if document is None:
+        return None
+    return document['seq'], document['answer']
+
+
+def save_session_state(db, session_id, seq, answer, ttl):
+    """
+    保存会话的当前答案，ttl 秒后由 TTL 索引删除
+
+    只接受更大的编辑序号：同一会话的两个请求乱序到达时，较早的编辑不会覆盖较新的答案。
+    """
+    try:
+        db[LIVE_SESSION_COLLECTION].update_one(
+            {'_id': session_id, 'seq': {'$lt': seq}},
+            {'$set': {'seq': seq, 'answer': answer,
+                      'expires_at': datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # 已保存了序号更大的答案
+        pass
+
+
+def apply_edit(state, edit):
+    """
+    将一次编辑应用到会话的当前答案
+
+    编辑为 {"seq": n, "answer": 完整答案} 或 {"seq": n, "start": i, "end": j, "text": 插入文本}。
+    增量编辑要求会话保存着序号为 n-1 的答案。
+
+    Returns:
+        str | None: 新答案；无法应用增量编辑（需要客户端发送完整答案）时返回 None
+
+    Raises:
+        ValueError: 编辑格式无效
+    """
+    seq = edit.get('seq')
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        raise ValueError('seq 格式无效')
+
+    if 'answer' in edit:
+        if not isinstance(edit['answer'], str):
+            raise ValueError('answer 格式无效')
+        return edit['answer']
+
+    start, end, text = edit.get('start'), edit.get('end'), edit.get('text', '')
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in (start, end)) \
+            or not isinstance(text, str):
+        raise ValueError('编辑格式无效')
+    if state is None or state[0] != seq - 1:
+        return None
+    answer = state[1]
+    if not 0 <= start <= end <= len(answer):
+        return None
+    return answer[:start] + text + answer[end:]
@@ -0,0 +1,125 @@
+"""
+正则匹配保护 - LaTeX 速成训练器
+管理员编写的正则（Practice.solution_regex、提示规则）作用于用户输入时，限制输入长度并设置
+执行时间预算，避免病态正则或超长答案长时间占用 gunicorn 同步 worker。
+"""
+import re
+import signal
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+
+
+# 默认值，应用上下文中以 config 为准
+DEFAULT_MAX_INPUT_LENGTH = 1000
+DEFAULT_TIME_BUDGET_MS = 50
+
+
+class RegexBudgetExceeded(Exception):
+    """正则匹配超出执行时间预算"""
+
+
+def _config(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+def max_input_length():
+    """正则匹配允许的最大输入长度"""
+    return _config('REGEX_MAX_INPUT_LENGTH', DEFAULT_MAX_INPUT_LENGTH)
+
+
+def time_budget_seconds():
+    """单次匹配（含全部提示规则）的执行时间预算（秒）"""
+    return _config('REGEX_TIME_BUDGET_MS', DEFAULT_TIME_BUDGET_MS) / 1000
+
+
+def _watchdog_available():
+    # SIGALRM 只能在主线程设置（gunicorn sync worker 在主线程处理请求）
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+def _raise_budget_exceeded(signum, frame):
+    raise RegexBudgetExceeded('regex match exceeded its time budget')
+
+
+@contextmanager
+def time_budget(seconds=None):
+    """
+    在时间预算内执行代码块，超时抛出 RegexBudgetExceeded
+
+    re 模块在匹配过程中会定期检查信号，因此 SIGALRM 可以中断回溯中的匹配。
+    非主线程或不支持 setitimer 的平台上不设看门狗，只依赖输入长度限制。
+    已有计时器（嵌套调用）时保留外层计时器，不再另设。
+    """
+    seconds = time_budget_seconds() if seconds is None else seconds
+    if seconds <= 0 or not _watchdog_available() or signal.getitimer(signal.ITIMER_REAL)[0] > 0:
+        yield
+        return
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_budget_exceeded)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def compile_or_none(pattern, flags=0):
+    """编译正则，模式无效时返回 None"""
+    try:
+        return re.compile(pattern, flags)
+    except (re.error, TypeError):
+        return None
+
+
+class CompiledPatternCache:
+    """
+    按所有者（如练习ID）缓存编译后的正则
+
+    条目保存编译时的模式原文，原文变化（其他进程修改了题目）时自动重新编译；
+    本进程保存题目后调用 invalidate 立即失效。按条目数做 LRU 淘汰。
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner_key, source, build):
+        """
+        返回 owner_key 对应的编译结果
+
+        Args:
+            owner_key: 所有者标识
+            source: 模式原文（可哈希），与缓存中不同时重新编译
+            build: 无参函数，返回编译结果
+        """
+        with self._lock:
+            entry = self._entries.get(owner_key)
+            if entry is not None and entry[0] == source:
+                self._entries.move_to_end(owner_key)
+                return entry[1]
+
+        compiled = build()
+        with self._lock:
+            self._entries[owner_key] = (source, compiled)
+            self._entries.move_to_end(owner_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, owner_key):
+        with self._lock:
+            self._entries.pop(owner_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
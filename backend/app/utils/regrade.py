@@ -0,0 +1,461 @@
+"""
+历史练习记录重新判题 - LaTeX 速成训练器
+标准化规则（normalize_latex、等价命令表）变化后，按新规则重新判定 practice_records.is_correct，
+并同步受影响的卡片完成状态、课程完成状态和复习计划。
+
+任务状态保存在 regrade_jobs 集合。练习记录按 _id 顺序分批读取（每批一次范围查询，不保留长时间
+打开的游标），每批在进程池中并行判题，bulk_write 写回变化的结果后记录检查点 last_record_id。
+进程被回收或任务失败后可从检查点继续；内存占用只与批大小有关，与记录总数无关。
+"""
+import math
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import current_app, has_app_context
+from pymongo import ReturnDocument, UpdateOne
+
+from app.models.review import Review, card_review_events, replay_schedule
+from app.utils.latex_normalizer import NORMALIZER_VERSION, normalize_latex
+
+
+DEFAULTS = {
+    'REGRADE_BATCH_SIZE': 1000,
+    'REGRADE_WORKERS': 2,
+    'REGRADE_LEASE_SECONDS': 300,
+}
+
+# 可以（重新）开始执行的任务状态；running 状态的任务只有租约过期（进程已退出）后才能接管
+RESUMABLE_STATUSES = ('pending', 'failed', 'interrupted')
+
+# 卡片的完成时间与作答时间分别取时，两者之间的最大误差
+COMPLETION_TIME_TOLERANCE = timedelta(seconds=1)
+
+RECORD_PROJECTION = {
+    'user_id': 1, 'lesson_id': 1, 'card_index': 1, 'user_answer': 1,
+    'target_answer': 1, 'is_correct': 1, 'submitted_at': 1, 'grading_status': 1
+}
+
+
+def _config(name):
+    if has_app_context():
+        return current_app.config.get(name, DEFAULTS[name])
+    return DEFAULTS[name]
+
+
+def _grade_in_worker(pairs):
+    """在子进程中判定一组 (用户答案, 目标公式)（模块级函数，spawn 子进程可导入）"""
+    return [normalize_latex(answer) == normalize_latex(target) for answer, target in pairs]
+
+
+def create_job(db, created_by=None):
+    """创建一个待执行的重新判题任务"""
+    now = datetime.utcnow()
+    job = {
+        'status': 'pending',
+        'normalizer_version': NORMALIZER_VERSION,
+        'created_by': created_by,
+        'created_at': now,
+        'updated_at': now,
+        'started_at': None,
+        'finished_at': None,
+        'heartbeat_at': None,
+        'owner': None,
+        'cancel_requested': False,
+        'last_record_id': None,
+        'total_estimate': db.practice_records.estimated_document_count(),
+        'scanned': 0,
+        'skipped': 0,
+        'changed': 0,
+        'progress_updated': 0,
+        'lessons_updated': 0,
+        'reviews_updated': 0,
+        'reviews_skipped': 0,
+        'batches': 0,
+        'error': None,
+    }
+    job['_id'] = db.regrade_jobs.insert_one(job).inserted_id
+    return job
+
+
+def active_job(db, lease_seconds=None):
+    """正在执行（租约未过期）的任务，没有时返回 None"""
+    lease_seconds = lease_seconds or _config('REGRADE_LEASE_SECONDS')
+    return db.regrade_jobs.find_one({
+        'status': 'running',
+        'heartbeat_at': {'$gte': datetime.utcnow() - timedelta(seconds=lease_seconds)}
+    })
+
+
+def claim_job(db, job_id, lease_seconds=None):
+    """
+    认领任务并标记为 running
+
+    可以认领待执行、失败、中断的任务，以及租约过期（执行进程已退出）的 running 任务。
+
+    Returns:
+        dict | None: 认领后的任务；任务不存在或正由其他进程执行时返回 None
+    """
+    lease_seconds = lease_seconds or _config('REGRADE_LEASE_SECONDS')
+    now = datetime.utcnow()
+    job = db.regrade_jobs.find_one_and_update(
+        {
+            '_id': ObjectId(job_id),
+            '$or': [
+                {'status': {'$in': list(RESUMABLE_STATUSES)}},
+                {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=lease_seconds)}},
+            ]
+        },
+        {'$set': {
+            'status': 'running',
+            'heartbeat_at': now,
+            'updated_at': now,
+            'owner': f'{socket.gethostname()}:{os.getpid()}',
+            'cancel_requested': False,
+            'error': None,
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is not None and job.get('started_at') is None:
+        db.regrade_jobs.update_one({'_id': job['_id']}, {'$set': {'started_at': now}})
+        job['started_at'] = now
+    return job
+
+
+def request_cancel(db, job_id):
+    """请求取消任务：running 任务在当前批次结束后停止，未开始的任务直接取消"""
+    now = datetime.utcnow()
+    result = db.regrade_jobs.update_one(
+        {'_id': ObjectId(job_id), 'status': {'$in': list(RESUMABLE_STATUSES)}},
+        {'$set': {'status': 'cancelled', 'finished_at': now, 'updated_at': now}}
+    )
+    if result.modified_count:
+        return True
+    result = db.regrade_jobs.update_one(
+        {'_id': ObjectId(job_id), 'status': 'running'},
+        {'$set': {'cancel_requested': True, 'updated_at': now}}
+    )
+    return result.modified_count > 0
+
+
+def recompute_progress(db, changed_records):
+    """
+    更新判定结果变化的卡片的完成状态，只修改这些卡片，尝试次数保持不变
+
+    - 按新判定结果存在正确作答：完成，first_completed_at 为最早的正确作答时间
+      （原完成状态不是由练习记录产生、且更早时保留原时间）
+    - 不存在正确作答：只有原完成状态来自被改判为错误的作答时才取消完成；
+      经 /practice/complete 标记、没有任何旧判定为正确的作答与之对应的完成状态保持不变
+
+    Returns:
+        tuple: (更新的进度文档数, [(user_id, lesson_id), ...] 卡片完成状态发生变化的课程)
+    """
+    if not changed_records:
+        return 0, []
+    changed_ids = {record['_id'] for record in changed_records}
+    cards = dict.fromkeys((record['user_id'], record['lesson_id'], record['card_index']) for record in changed_records)
+
+    # 每张卡片按旧判定和新判定分别求最早的正确作答时间
+    first_correct = {}
+    for record in db.practice_records.find(
+        {'$or': [{'user_id': user_id, 'lesson_id': lesson_id, 'card_index': card_index}
+                 for user_id, lesson_id, card_index in cards]},
+        {'user_id': 1, 'lesson_id': 1, 'card_index': 1, 'is_correct': 1, 'submitted_at': 1}
+    ):
+        if record.get('submitted_at') is None:
+            continue
+        key = (record['user_id'], record['lesson_id'], record['card_index'])
+        was_correct = (not record['is_correct']) if record['_id'] in changed_ids else record['is_correct']
+        old, new = first_correct.get(key, (None, None))
+        if was_correct and (old is None or record['submitted_at'] < old):
+            old = record['submitted_at']
+        if record['is_correct'] and (new is None or record['submitted_at'] < new):
+            new = record['submitted_at']
+        first_correct[key] = (old, new)
+
+    user_lessons = dict.fromkeys((user_id, lesson_id) for user_id, lesson_id, _ in cards)
+    progress = {
+        (document['user_id'], document['lesson_id']): document.get('cards_progress') or {}
+        for document in db.user_progress.find(
+            {'$or': [{'user_id': user_id, 'lesson_id': lesson_id} for user_id, lesson_id in user_lessons]},
+            {'user_id': 1, 'lesson_id': 1, 'cards_progress': 1}
+        )
+    }
+
+    updates = {}
+    completion_changed = {}
+    for user_id, lesson_id, card_index in cards:
+        current = progress.get((user_id, lesson_id), {}).get(str(card_index))
+        if current is None:
+            continue
+        old_first, new_first = first_correct.get((user_id, lesson_id, card_index), (None, None))
+        completed_at = current.get('first_completed_at')
+        # 完成状态由旧判定为正确的作答产生（与最早的旧正确作答同时或更晚完成）
+        from_records = old_first is not None and (
+            completed_at is None or completed_at >= old_first - COMPLETION_TIME_TOLERANCE
+        )
+        kept = bool(current.get('completed')) and not from_records
+        completed = kept or new_first is not None
+        candidates = [value for value in ((completed_at if kept else None), new_first) if value is not None]
+        first_completed_at = min(candidates) if candidates else None
+        if completed == bool(current.get('completed')) and first_completed_at == completed_at:
+            continue
+        fields = updates.setdefault((user_id, lesson_id), {'updated_at': datetime.utcnow()})
+        fields[f'cards_progress.{card_index}.completed'] = completed
+        fields[f'cards_progress.{card_index}.first_completed_at'] = first_completed_at
+        if completed != bool(current.get('completed')):
+            completion_changed[(user_id, lesson_id)] = True
+
+    operations = [
+        UpdateOne({'user_id': user_id, 'lesson_id': lesson_id}, {'$set': fields})
+        for (user_id, lesson_id), fields in updates.items()
+    ]
+    if operations:
+        db.user_progress.bulk_write(operations, ordered=False)
+    return len(operations), list(completion_changed)
+
+
+def recompute_lesson_completion(db, user_lessons):
+    """
+    卡片完成状态发生变化的课程：按全部练习卡片是否完成更新 users.progress.completed_lessons
+
+    与 /lessons/<id>/complete 的条件一致；课程已不在课程目录中时不做修改。
+
+    Returns:
+        int: 完成状态发生变化的 (用户, 课程) 数
+    """
+    from app.models.lesson_catalog import lesson_catalog
+
+    if not user_lessons:
+        return 0
+    progress = {
+        (document['user_id'], document['lesson_id']): document.get('cards_progress') or {}
+        for document in db.user_progress.find(
+            {'$or': [{'user_id': user_id, 'lesson_id': lesson_id} for user_id, lesson_id in user_lessons]},
+            {'user_id': 1, 'lesson_id': 1, 'cards_progress': 1}
+        )
+    }
+    operations = []
+    for user_id, lesson_id in user_lessons:
+        lesson = lesson_catalog.get_by_id(lesson_id)
+        if lesson is None:
+            continue
+        cards = progress.get((user_id, lesson_id), {})
+        completed = all(
+            (cards.get(str(index)) or {}).get('completed', False)
+            for index, card in enumerate(lesson.get('cards', [])) if card.get('type') == 'practice'
+        )
+        if completed:
+            operations.append(UpdateOne(
+                {'_id': user_id, 'progress.completed_lessons': {'$ne': str(lesson_id)}},
+                {'$push': {'progress.completed_lessons': str(lesson_id)}}
+            ))
+        else:
+            operations.append(UpdateOne(
+                {'_id': user_id, 'progress.completed_lessons': str(lesson_id)},
+                {'$pull': {'progress.completed_lessons': str(lesson_id)}}
+            ))
+    if not operations:
+        return 0
+    return db.users.bulk_write(operations, ordered=False).modified_count
+
+
+def refresh_reviews(db, changed_records):
+    """
+    更新判定结果变化的练习记录所在卡片的复习计划
+
+    复习记录按 (用户, 课程, 卡片) 汇总该卡片的全部作答。按旧判定结果重放全部作答（练习记录和
+    复习提交），与当前复习状态一致时改为按新判定结果重放的计划；不一致（例如经 /reviews/items
+    手动调整过）的复习记录不做修改。
+
+    Returns:
+        tuple: (更新数, 跳过数)
+    """
+    changed_ids = {record['_id'] for record in changed_records}
+    cards = dict.fromkeys((record['user_id'], record['lesson_id'], record['card_index']) for record in changed_records)
+    updated = skipped = 0
+    for user_id, lesson_id, card_index in cards:
+        review = db.reviews.find_one(Review.card_key(user_id, lesson_id, card_index))
+        if review is None:
+            skipped += 1
+            continue
+
+        events = card_review_events(db, user_id, lesson_id, card_index, [review['_id']])
+        previous_events = [
+            (answered_at, not is_correct, 1 if is_correct else 4) if record_id in changed_ids
+            else (answered_at, is_correct, quality)
+            for answered_at, is_correct, quality, record_id in events
+        ]
+        previous = replay_schedule(previous_events)
+        if (previous is None
+                or previous['repetitions'] != review.get('repetitions')
+                or previous['last_interval_days'] != review.get('last_interval_days')
+                or not math.isclose(previous['easiness_factor'], review.get('easiness_factor', 0))):
+            skipped += 1
+            continue
+
+        result = db.reviews.update_one(
+            {'_id': review['_id'], 'repetitions': review['repetitions'],
+             'easiness_factor': review['easiness_factor']},
+            {'$set': dict(replay_schedule(events), updated_at=datetime.utcnow())}
+        )
+        if result.matched_count:
+            updated += 1
+        else:
+            skipped += 1
+    return updated, skipped
+
+
+def regrade_batch(db, pool, records, workers, job_id=None):
+    """
+    重新判定一批练习记录并写回变化的结果
+
+    Returns:
+        dict: 本批的计数（与任务文档中的计数字段同名）
+    """
+    gradable = [
+        record for record in records
+        if isinstance(record.get('user_answer'), str) and isinstance(record.get('target_answer'), str)
+    ]
+    pairs = list(dict.fromkeys((record['user_answer'], record['target_answer']) for record in gradable))
+    chunk_size = max(1, -(-len(pairs) // (workers * 4)))
+    chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+    verdicts = {}
+    for chunk, results in zip(chunks, pool.map(_grade_in_worker, chunks)):
+        verdicts.update(zip(chunk, results))
+
+    now = datetime.utcnow()
+    operations = []
+    changed = []
+    for record in gradable:
+        is_correct = verdicts[(record['user_answer'], record['target_answer'])]
+        if is_correct == record.get('is_correct') and 'grading_status' not in record:
+            continue
+        operations.append(UpdateOne(
+            {'_id': record['_id'], 'is_correct': record.get('is_correct')},
+            {
+                '$set': {'is_correct': is_correct, 'regraded_at': now, 'regrade_job_id': job_id},
+                '$unset': {'grading_status': ''}
+            }
+        ))
+        if is_correct != record.get('is_correct'):
+            changed.append(dict(record, is_correct=is_correct))
+
+    if operations:
+        db.practice_records.bulk_write(operations, ordered=False)
+
+    progress_updated, completion_changed = recompute_progress(db, changed)
+    reviews_updated, reviews_skipped = refresh_reviews(db, changed)
+    return {
+        'scanned': len(records),
+        'skipped': len(records) - len(gradable),
+        'changed': len(changed),
+        'progress_updated': progress_updated,
+        'lessons_updated': recompute_lesson_completion(db, completion_changed),
+        'reviews_updated': reviews_updated,
+        'reviews_skipped': reviews_skipped,
+        'batches': 1,
+    }
+
+
+def run_job(db, job, batch_size=None, workers=None):
+    """
+    从检查点开始执行已认领的任务，直到完成、取消或出错
+
+    Returns:
+        str: 任务的最终状态
+    """
+    batch_size = batch_size or _config('REGRADE_BATCH_SIZE')
+    workers = workers or _config('REGRADE_WORKERS')
+    job_id = job['_id']
+    last_id = job.get('last_record_id')
+
+    pool = multiprocessing.get_context('spawn').Pool(processes=workers)
+    try:
+        while True:
+            if db.regrade_jobs.find_one({'_id': job_id, 'cancel_requested': True}, {'_id': 1}):
+                status = 'cancelled'
+                break
+
+            query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+            records = list(db.practice_records.find(query, RECORD_PROJECTION).sort('_id', 1).limit(batch_size))
+            if not records:
+                status = 'completed'
+                break
+
+            counts = regrade_batch(db, pool, records, workers, job_id)
+            last_id = records[-1]['_id']
+            now = datetime.utcnow()
+            db.regrade_jobs.update_one(
+                {'_id': job_id},
+                {'$set': {'last_record_id': last_id, 'heartbeat_at': now, 'updated_at': now}, '$inc': counts}
+            )
+    except Exception as e:
+        traceback.print_exc()
+        now = datetime.utcnow()
+        db.regrade_jobs.update_one(
+            {'_id': job_id},
+            {'$set': {'status': 'failed', 'error': str(e), 'updated_at': now}}
+        )
+        return 'failed'
+    finally:
+        pool.terminate()
+
+    now = datetime.utcnow()
+    db.regrade_jobs.update_one(
+        {'_id': job_id},
+        {'$set': {'status': status, 'finished_at': now, 'updated_at': now}}
+    )
+    return status
+
+
+def start_job_in_background(app, job):
+    """在后台线程中执行已认领的任务（管理后台触发），返回线程"""
+    def target():
+        with app.app_context():
+            from app import get_db
+            run_job(get_db(), job)
+
+    thread = threading.Thread(target=target, name=f'regrade-{job["_id"]}', daemon=True)
+    thread.start()
+    return thread
+
+
+def serialize_job(job):
+    """转换为 JSON 可序列化的字典，附带进度百分比"""
+    data = {}
+    for key, value in job.items():
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        data['id' if key == '_id' else key] = value
+    total = job.get('total_estimate') or 0
+    data['percent'] = round(min(100.0, job.get('scanned', 0) * 100 / total), 1) if total else (
+        100.0 if job.get('status') == 'completed' else 0.0
+    )
+    return data
+
+
+if __name__ == '__main__':
+    # 在前台执行（适合记录量很大的一次性重新判题）：
+    #   python -m app.utils.regrade            创建并执行新任务
+    #   python -m app.utils.regrade <job_id>   从检查点继续执行已有任务
+    import sys
+    from app import create_app, get_db
+
+    app = create_app()
+    with app.app_context():
+        db = get_db()
+        job_id = sys.argv[1] if len(sys.argv) > 1 else create_job(db, created_by='cli')['_id']
+        job = claim_job(db, job_id)
+        if job is None:
+            print(f'任务 {job_id} 不存在或正在其他进程中执行')
+            sys.exit(1)
+        status = run_job(db, job)
+        print(serialize_job(db.regrade_jobs.find_one({'_id': job['_id']})))
+        sys.exit(0 if status == 'completed' else 1)
@@ -0,0 +1,293 @@
+"""
+追加写缓冲 - LaTeX 速成训练器
+只追加、写入后不在同一请求中读取的集合（hint_records、practice_records、review_submissions）
+先写入进程内缓冲区，由后台线程按条数或时间间隔用 insert_many 批量写入，请求不再等待数据库往返。
+
+文档在入队时分配 _id，调用方可以立即引用（例如复习记录引用练习记录ID）。
+进程正常退出时（gunicorn worker 收到 SIGTERM、开发服务器退出）写入剩余文档；
+进程被强制终止时最多丢失一个刷新间隔内的文档。
+
+写入失败分两类：
+- 永久错误（文档校验失败、文档过大等单条文档的写入错误）：不重试，写入死信集合
+  write_behind_dead_letters 并记录日志
+- 暂时错误（数据库连接失败）：文档放回缓冲区，按指数退避重试，每条文档最多重试 max_retries 次，
+  之后丢弃并记录日志；退避期间缓冲区满时丢弃最早的文档，缓冲区始终不超过 max_queue 条
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+
+DUPLICATE_KEY_ERROR = 11000
+DEAD_LETTER_COLLECTION = 'write_behind_dead_letters'
+# 暂时错误后的最长退避时间（秒）
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class WriteBehindBuffer:
+    """
+    按集合分组的写缓冲
+
+    缓冲的文档数达到 max_batch 时立即唤醒后台线程，否则每 flush_interval 秒写入一次。
+    缓冲区达到 max_queue 时由入队的请求线程同步写入（背压）；数据库不可用（退避期间）时
+    不再同步写入，而是丢弃最早的文档。
+    """
+
+    def __init__(self, max_batch=200, flush_interval=1.0, max_queue=10000, max_retries=5):
+        self.enabled = True
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._pending = {}
+        self._depth = 0
+        self._attempts = {}
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._owner_pid = None
+        self.enqueued = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.sync_flushes = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def append(self, collection, document):
+        """
+        将文档加入 collection 的写缓冲
+
+        Returns:
+            ObjectId: 文档的 _id
+        """
+        document.setdefault('_id', ObjectId())
+        if not self.enabled:
+            from app import get_db
+            get_db()[collection].insert_one(document)
+            return document['_id']
+
+        self._ensure_thread()
+        with self._lock:
+            self._pending.setdefault(collection, []).append(document)
+            self._depth += 1
+            self.enqueued += 1
+            depth = self._depth
+            backing_off = self._backing_off()
+            if depth >= self.max_queue:
+                if backing_off:
+                    # 数据库不可用时同步写入只会再次失败，丢弃最早的文档保持缓冲区有界
+                    self._drop_oldest(depth - self.max_queue + 1, '缓冲区已满且数据库不可用')
+                else:
+                    self.sync_flushes += 1
+
+        if depth >= self.max_queue and not backing_off:
+            self.flush()
+        elif depth >= self.max_batch:
+            self._wakeup.set()
+        return document['_id']
+
+    def flush(self, force=False):
+        """
+        写入当前缓冲的全部文档，返回写入的文档数
+
+        暂时错误后的退避期间不写入，除非 force（进程退出时）。
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._backing_off() and not force:
+                    return 0
+                batches, self._pending = self._pending, {}
+                self._depth = 0
+            if not batches:
+                return 0
+            return self._insert(batches)
+
+    def _insert(self, batches):
+        from app import get_db
+        db = get_db()
+        started = time.perf_counter()
+        written = 0
+        failed = {}
+        rejected = []
+        for collection, documents in batches.items():
+            try:
+                db[collection].insert_many(documents, ordered=False)
+                written += len(documents)
+            except BulkWriteError as e:
+                # 上次写入失败后重试时，已写入的文档按重复键跳过；其余单条文档的写入错误不会因重试而成功
+                errors = [error for error in e.details.get('writeErrors', [])
+                          if error.get('code') != DUPLICATE_KEY_ERROR]
+                rejected.extend((collection, documents[error['index']], error.get('errmsg')) for error in errors)
+                written += len(documents) - len(errors)
+            except ConnectionFailure:
+                failed[collection] = documents
+            except Exception:
+                # 客户端拒绝整批（如文档无法编码、超过大小上限）时逐条写入，找出有问题的文档
+                for document in documents:
+                    try:
+                        db[collection].insert_one(document)
+                        written += 1
+                    except ConnectionFailure:
+                        failed.setdefault(collection, []).append(document)
+                    except Exception as e:
+                        if getattr(e, 'code', None) != DUPLICATE_KEY_ERROR:
+                            rejected.append((collection, document, str(e)))
+                        else:
+                            written += 1
+
+        if rejected:
+            self._dead_letter(db, rejected)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.flushes += 1
+            self.written += written
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            if self._attempts:
+                # 写入成功或被拒绝的文档不再计重试次数
+                failed_ids = {document['_id'] for documents in failed.values() for document in documents}
+                for documents in batches.values():
+                    for document in documents:
+                        if document['_id'] not in failed_ids:
+                            self._attempts.pop(document['_id'], None)
+            if failed:
+                # 数据库暂时不可用：文档放回缓冲区，退避后重试；超过重试次数的文档丢弃
+                self.failures += 1
+                self._consecutive_failures += 1
+                self._retry_at = time.monotonic() + min(
+                    MAX_BACKOFF_SECONDS, self.flush_interval * 2 ** (self._consecutive_failures - 1)
+                )
+                for collection, documents in failed.items():
+                    retry = []
+                    for document in documents:
+                        attempts = self._attempts.get(document['_id'], 0) + 1
+                        if attempts > self.max_retries:
+                            self._attempts.pop(document['_id'], None)
+                            self.dropped += 1
+                            print(f"Write-behind dropped {collection} document {document['_id']} "
+                                  f"after {self.max_retries} retries")
+                        else:
+                            self._attempts[document['_id']] = attempts
+                            retry.append(document)
+                    self._pending[collection] = retry + self._pending.get(collection, [])
+                    self._depth += len(retry)
+                if self._depth > self.max_queue:
+                    self._drop_oldest(self._depth - self.max_queue, '重试的文档超过缓冲区上限')
+            else:
+                self._consecutive_failures = 0
+                self._retry_at = 0.0
+        return written
+
+    def _backing_off(self):
+        # 调用方持有 self._lock
+        return self._retry_at > time.monotonic()
+
+    def _drop_oldest(self, count, reason):
+        """丢弃缓冲区中最早的 count 条文档（调用方持有 self._lock）"""
+        dropped = 0
+        while dropped < count and self._depth:
+            collection = min(
+                (name for name, documents in self._pending.items() if documents),
+                key=lambda name: self._pending[name][0]['_id']
+            )
+            document = self._pending[collection].pop(0)
+            self._attempts.pop(document['_id'], None)
+            self._depth -= 1
+            dropped += 1
+        self.dropped += dropped
+        if dropped:
+            print(f"Write-behind dropped {dropped} documents: {reason}")
+
+    def _dead_letter(self, db, rejected):
+        """被数据库拒绝的文档写入死信集合，便于排查；死信本身写入失败时只记录日志"""
+        now = datetime.utcnow()
+        for collection, document, error in rejected:
+            print(f"Write-behind rejected {collection} document {document['_id']}: {error}")
+            entry = {'collection': collection, 'document_id': document['_id'], 'error': error, 'failed_at': now}
+            try:
+                db[DEAD_LETTER_COLLECTION].insert_one(dict(entry, document=document))
+            except Exception:
+                try:
+                    db[DEAD_LETTER_COLLECTION].insert_one(entry)  # 文档本身无法保存（如过大）时只保存错误信息
+                except Exception as e:
+                    print(f"Write-behind dead letter failed: {e}")
+        with self._lock:
+            self.dead_lettered += len(rejected)
+
+    def _ensure_thread(self):
+        # fork 后子进程中没有父进程的后台线程，按 PID 判断是否需要重新启动
+        if self._thread is not None and self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._owner_pid == os.getpid():
+                return
+            if self._owner_pid != os.getpid():
+                self._pending, self._depth = {}, 0
+            self._owner_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed: {e}")
+
+    def shutdown(self):
+        """进程退出前写入剩余文档"""
+        if self._owner_pid == os.getpid():
+            try:
+                self.flush(force=True)
+            except Exception as e:
+                print(f"Write-behind flush on shutdown failed: {e}")
+
+    def stats(self):
+        """缓冲区统计信息"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queue_depth': self._depth,
+                'queue_by_collection': {name: len(docs) for name, docs in self._pending.items() if docs},
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'flushes': self.flushes,
+                'failures': self.failures,
+                'sync_flushes': self.sync_flushes,
+                'retrying': len(self._attempts),
+                'dropped': self.dropped,
+                'dead_lettered': self.dead_lettered,
+                'backing_off': self._backing_off(),
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            }
+
+
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.shutdown)
+
+
+def init_write_behind(app):
+    """按应用配置设置写缓冲"""
+    write_behind.enabled = app.config.get('WRITE_BEHIND_ENABLED', True)
+    write_behind.max_batch = app.config.get('WRITE_BEHIND_MAX_BATCH', write_behind.max_batch)
+    write_behind.flush_interval = app.config.get('WRITE_BEHIND_FLUSH_INTERVAL_MS', 1000) / 1000
+    write_behind.max_queue = app.config.get('WRITE_BEHIND_MAX_QUEUE', write_behind.max_queue)
+    write_behind.max_retries = app.config.get('WRITE_BEHIND_MAX_RETRIES', write_behind.max_retries)
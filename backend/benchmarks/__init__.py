@@ -0,0 +1,3 @@
+"""
+基准测试脚本 - LaTeX 速成训练器
+"""
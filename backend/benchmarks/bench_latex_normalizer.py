@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaTeX 标准化基准测试
+
+以课程中全部练习题的目标公式及其生成的改写作为提交语料，比较旧版正则实现
+（benchmarks/legacy_latex_normalizer.py）与 app.utils.latex_normalizer
+（语法树规范化，不经缓存 / 经 LRU 缓存）：
+  - 每秒可判定提交数（每次提交标准化用户答案和目标公式各一次）
+  - 判定正确率：等价改写应判为正确，改动了内容的写法应判为错误
+  - 输入长度增长时的耗时（含旧版正则呈平方复杂度的未闭合 \\frac{ 输入）
+  - 随机输入不抛出异常；normalize_latex_answer 与旧版输出完全一致
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_latex_normalizer.py [--rounds 20] [--fuzz 20000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.legacy_latex_normalizer import (  # noqa: E402
+    legacy_check_latex_answer, legacy_normalize_latex, legacy_normalize_latex_answer
+)
+from app.utils.latex_normalizer import (  # noqa: E402
+    check_latex_answer, normalize_latex, normalize_latex_answer, normalize_latex_uncached,
+    normalization_cache
+)
+
+
+def load_target_formulas():
+    """收集课程（含英文翻译）中全部练习题的目标公式"""
+    from comprehensive_lessons import create_comprehensive_lessons
+
+    formulas = []
+    for lesson in create_comprehensive_lessons():
+        formulas.extend(card['target_formula'] for card in lesson['cards'] if card.get('type') == 'practice')
+
+    translations_path = os.path.join(BACKEND_DIR, 'translations', 'lessons_en_US.json')
+    if os.path.exists(translations_path):
+        with open(translations_path, 'r', encoding='utf-8') as f:
+            for lesson in json.load(f).get('lessons', []):
+                cards = lesson.get('translations', {}).get('en-US', {}).get('cards', [])
+                formulas.extend(card['target_formula'] for card in cards if card.get('type') == 'practice')
+    return formulas
+
+
+# 等价命令的另一种写法
+EQUIVALENT_REWRITES = (
+    ('\\leq', '\\le'), ('\\geq', '\\ge'), ('\\neq', '\\ne'), ('\\rightarrow', '\\to'),
+    ('\\times', '\\cdot'), ('\\dfrac', '\\frac'), ('\\,', ''), ('\\quad', ' '),
+)
+
+# 公式片段：命令、控制符或单个字符
+LATEX_PART_PATTERN = re.compile(r'\\[a-zA-Z]+|\\.|.', re.DOTALL)
+
+
+def answer_variants(formula):
+    """构造用户可能提交的等价写法"""
+    bare = formula.strip('$')
+    rewritten = bare
+    for old, new in EQUIVALENT_REWRITES:
+        rewritten = rewritten.replace(old, new)
+    return [
+        formula,
+        bare,
+        f'$$ {bare} $$',
+        f'\\( {bare} \\)',
+        bare.replace('{', '{ ').replace('}', ' }'),
+        bare.replace('^', ' ^ ').replace('_', ' _ ').replace('=', ' = '),
+        rewritten,
+    ]
+
+
+def wrong_variants(formula):
+    """构造与目标公式内容不同的写法：字母大小写互换、数字改变、删去最后一个字母或数字"""
+    parts = LATEX_PART_PATTERN.findall(formula.strip('$'))
+    variants = []
+
+    swapped = [part.swapcase() if len(part) == 1 else part for part in parts]
+    if swapped != parts:
+        variants.append(''.join(swapped))
+
+    digits = [i for i, part in enumerate(parts) if part.isdigit()]
+    if digits:
+        changed = list(parts)
+        changed[digits[0]] = str((int(changed[digits[0]]) + 1) % 10)
+        variants.append(''.join(changed))
+
+    alnum = [i for i, part in enumerate(parts) if len(part) == 1 and part.isalnum()]
+    if alnum:
+        variants.append(''.join(parts[:alnum[-1]] + parts[alnum[-1] + 1:]))
+    return variants
+
+
+FUZZ_ALPHABET = (
+    list('abcxyz0123456789 {}()[]^_=+-<>,.;:!&$\\') +
+    ['\\frac', '\\sqrt', '\\left', '\\right', '\\le', '\\leq', '\\ne', '\\to', '\\gets', '\\cdot',
+     '\\quad', '\\qquad', '\\,', '\\!', 'sin', 'cos', 'log', 'ln', 'exp', '\\sin', ' sin ', 'sin(',
+     '\\begin{equation}', '\\end{equation}', '\\begin{pmatrix}', '\\end{pmatrix}', '\\\\',
+     '\\text{', '\\subset', '\\iff', '\\lt', '\\gt', '\t', '\n']
+)
+
+
+def fuzz_inputs(count, seed=0):
+    """随机拼接 LaTeX 片段，用于检查非常规输入"""
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 24))) for _ in range(count)]
+
+
+def check_robust(inputs):
+    """返回标准化抛出异常的输入，以及 normalize_latex_answer 与旧版不一致的输入"""
+    failures = []
+    for text in inputs:
+        try:
+            normalize_latex_uncached(text)
+        except Exception as e:
+            failures.append(('normalize_latex', text, repr(e)))
+        if normalize_latex_answer(text) != legacy_normalize_latex_answer(text):
+            failures.append(('normalize_latex_answer', text, ''))
+    return failures
+
+
+def verdict_accuracy(check, labeled):
+    """返回 (判定正确数, 误判列表)"""
+    errors = [(answer, target, expected) for answer, target, expected in labeled
+              if bool(check(answer, target)) != expected]
+    return len(labeled) - len(errors), errors
+
+
+def submissions_per_second(normalize, submissions, rounds):
+    """每次提交标准化用户答案和目标公式各一次，返回最佳一轮的吞吐量"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for answer, target in submissions:
+            normalize(answer) == normalize(target)
+        best = min(best, time.perf_counter() - start)
+    return len(submissions) / best
+
+
+def seconds_per_call(normalize, text, rounds=3):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        normalize(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scaling_table(formulas, sizes):
+    """输入长度增长时单次标准化的耗时（毫秒）"""
+    longest = max(formulas, key=len).strip('$')
+    cases = (
+        ('拼接目标公式', lambda n: '+'.join([longest] * n)),
+        ('嵌套分数', lambda n: '\\frac{' * n + 'x' + '}{y}' * n),
+        ('未闭合 \\frac{', lambda n: '\\frac{' * n),
+    )
+    rows = []
+    for name, build in cases:
+        for n in sizes:
+            text = build(n)
+            rows.append((name, len(text),
+                         seconds_per_call(legacy_normalize_latex, text) * 1000,
+                         seconds_per_call(normalize_latex_uncached, text) * 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LaTeX 标准化基准测试')
+    parser.add_argument('--rounds', type=int, default=20, help='计时轮数，取最快一轮')
+    parser.add_argument('--fuzz', type=int, default=20000, help='健壮性检查的随机输入数量')
+    args = parser.parse_args()
+
+    formulas = load_target_formulas()
+    submissions = [(variant, formula) for formula in formulas for variant in answer_variants(formula)]
+    labeled = [(answer, target, True) for answer, target in submissions] + [
+        (variant, formula, False) for formula in formulas for variant in wrong_variants(formula)
+    ]
+
+    inputs = [answer for answer, _, _ in labeled] + fuzz_inputs(args.fuzz)
+    failures = check_robust(inputs)
+
+    legacy_correct, _ = verdict_accuracy(legacy_check_latex_answer, labeled)
+    correct, errors = verdict_accuracy(check_latex_answer, labeled)
+
+    legacy_rate = submissions_per_second(legacy_normalize_latex, submissions, args.rounds)
+    uncached_rate = submissions_per_second(normalize_latex_uncached, submissions, args.rounds)
+    normalization_cache.clear()
+    cached_rate = submissions_per_second(normalize_latex, submissions, args.rounds)
+
+    print(f'目标公式: {len(formulas)}  带标注提交: {len(labeled)}  健壮性检查输入: {len(inputs)}')
+    print(f'判定正确率: 旧版 {legacy_correct / len(labeled):.1%}  语法树 {correct / len(labeled):.1%}')
+    print(f'旧版实现:     {legacy_rate:12,.0f} 次提交/秒')
+    print(f'语法树:       {uncached_rate:12,.0f} 次提交/秒  ({uncached_rate / legacy_rate:.2f}x)')
+    print(f'语法树+缓存:  {cached_rate:12,.0f} 次提交/秒  ({cached_rate / legacy_rate:.2f}x)')
+    print(f'缓存统计: {normalization_cache.stats()}')
+
+    print('输入长度与单次耗时（毫秒）:')
+    for name, length, legacy_ms, ast_ms in scaling_table(formulas, (10, 100, 1000)):
+        print(f'  {name:<14} {length:>7} 字符  旧版 {legacy_ms:10.3f}  语法树 {ast_ms:10.3f}')
+
+    status = 0
+    if errors:
+        print(f'误判: {len(errors)} 条')
+        for answer, target, expected in errors[:10]:
+            print(f'  {answer!r} vs {target!r} 应判为 {expected}')
+        status = 1
+    if failures:
+        print(f'健壮性检查失败: {len(failures)} 条')
+        for name, text, error in failures[:10]:
+            print(f'  {name}: {text!r} {error}')
+        status = 1
+    if not status:
+        print('全部判定正确，随机输入无异常')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+旧版 LaTeX 标准化实现（仅供基准测试对照）
+
+原样保留 app/routes/practice.py 中每次调用都重新构建映射表和正则的实现，
+基准脚本用它测量优化前的吞吐量，并逐条核对新实现的输出完全一致。
+"""
+import re
+
+
+def legacy_normalize_latex(latex_str):
+    """增强的LaTeX标准化函数，与前端逻辑对齐"""
+    if not latex_str:
+        return ""
+
+    try:
+        # 移除首尾空格
+        latex_str = latex_str.strip()
+
+        # 1. 标准化数学环境分隔符
+        if latex_str.startswith('\\begin{equation}') and latex_str.endswith('\\end{equation}'):
+            latex_str = latex_str[len('\\begin{equation}'):-len('\\end{equation}')].strip()
+        if latex_str.startswith('$$') and latex_str.endswith('$$'):
+            latex_str = latex_str[2:-2].strip()
+        if latex_str.startswith('\\(') and latex_str.endswith('\\)'):
+            latex_str = latex_str[2:-2].strip()
+        if latex_str.startswith('$') and latex_str.endswith('$'):
+            latex_str = latex_str[1:-1].strip()
+
+        # 2. 标准化括号
+        latex_str = latex_str.replace('\\left', '').replace('\\right', '')
+
+        # 3. 移除常见空格命令
+        spacing_commands = ['\\,', '\\thinspace', '\\:', '\\medspace', '\\;', '\\thickspace', '\\!', '\\negthinspace', '\\negmedspace', '\\negthickspace', '\\quad', '\\qquad']
+        for cmd in spacing_commands:
+            latex_str = latex_str.replace(cmd, ' ')
+
+        # 4. 标准化等价命令 (核心变更)
+        # 将各种形式映射到单一的、标准的LaTeX形式
+        equivalence_mappings = {
+            '\\ne': '\\neq',
+            '\\le': '\\leq',
+            '\\ge': '\\geq',
+            '\\to': '\\rightarrow',
+            '\\gets': '\\leftarrow',
+            '\\iff': '\\leftrightarrow',
+            '\\cong': '\\approx',
+            '\\subset': '\\subseteq',
+            '\\supset': '\\supseteq',
+            '\\lt': '<',
+            '\\gt': '>',
+            '\\cdot': '\\times',
+        }
+        # 4. 标准化等价命令 (最终修复方案：使用 re.sub 和精确的负向先行断言)
+        replacement_map = {
+            '\\ne': '\\neq',
+            '\\le': '\\leq',
+            '\\ge': '\\geq',
+            '\\to': '\\rightarrow',
+            '\\gets': '\\leftarrow',
+            '\\iff': '\\leftrightarrow',
+            '\\cong': '\\approx',
+            '\\subset': '\\subseteq',
+            '\\supset': '\\supseteq',
+            '\\lt': '<',
+            '\\gt': '>',
+            '\\cdot': '\\times',
+        }
+
+        # 按键(old)的长度降序排序，以优先匹配更长的字符串（如 \gets vs \ge）
+        sorted_keys = sorted(replacement_map.keys(), key=len, reverse=True)
+        
+        # 为每个key创建一个带负向先行断言的pattern，确保匹配的是完整命令
+        # 例如，`\ne` 会变成 `\\ne(?![a-zA-Z])`
+        # 这能匹配 `\ne ` 或 `\ne{`，但不会匹配 `\neq` 中的 `\ne`
+        pattern = re.compile("|".join(f"{re.escape(k)}(?![a-zA-Z])" for k in sorted_keys))
+
+        # 定义一个清晰的回调函数来执行替换
+        def replacer(match):
+            # match.group(0) 是匹配到的完整字符串，例如 `\ne`
+            return replacement_map[match.group(0)]
+
+        # 执行安全的、非递归的替换
+        latex_str = pattern.sub(replacer, latex_str)
+        
+        # 5. 标准化数学函数名
+        function_mappings = {
+            ' sin ': ' \\sin ', ' cos ': ' \\cos ', ' tan ': ' \\tan ',
+            ' cot ': ' \\cot ', ' sec ': ' \\sec ', ' csc ': ' \\csc ',
+            ' ln ': ' \\ln ', ' log ': ' \\log ', ' exp ': ' \\exp ',
+            'sin(': '\\sin(', 'cos(': '\\cos(', 'tan(': '\\tan(',
+            'ln(': '\\ln(', 'log(': '\\log(', 'exp(': '\\exp(',
+        }
+        latex_str = ' ' + latex_str + ' '
+        for old, new in function_mappings.items():
+            latex_str = latex_str.replace(old, new)
+        latex_str = latex_str.strip()
+
+        # 6. 结构化标准化
+        latex_str = re.sub(r'\^([a-zA-Z0-9])', r'^{\1}', latex_str)
+        latex_str = re.sub(r'_([a-zA-Z0-9])', r'_{\1}', latex_str)
+        latex_str = re.sub(r'\\frac\s*\{\s*([^}]+)\s*\}\s*\{\s*([^}]+)\s*\}', r'\\frac{\1}{\2}', latex_str)
+        latex_str = re.sub(r'\\sqrt\s*\{\s*([^}]+)\s*\}', r'\\sqrt{\1}', latex_str)
+
+        # 7. 最终清理
+        # 移除所有空格进行比较。这是在完全对齐前端的复杂语义分析之前，
+        # 实现鲁棒性价比较高的方式。它能处理绝大多数格式问题。
+        latex_str = re.sub(r'\s+', '', latex_str)
+
+        return latex_str.lower()
+
+    except Exception:
+        # 如果出错，回退到简单处理
+        return latex_str.strip().lower().replace(' ', '')
+
+
+def legacy_check_latex_answer(user_answer, target_answer):
+    """旧版答案检查：对用户答案和目标公式各执行一次旧版标准化"""
+    return legacy_normalize_latex(user_answer) == legacy_normalize_latex(target_answer)
+
+
+def legacy_normalize_latex_answer(answer):
+    """旧版 Practice.normalize_latex_answer"""
+    if not answer:
+        return ""
+
+    answer = answer.strip()
+    answer = re.sub(r'\s+', ' ', answer)
+    answer = re.sub(r'\{\s+', '{', answer)
+    answer = re.sub(r'\s+\}', '}', answer)
+    answer = re.sub(r'(\\[a-zA-Z]+)\s+', r'\1', answer)
+    return answer
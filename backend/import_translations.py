@@ -70,6 +70,11 @@ def import_translations_directly():
                 print(f"[ERROR] 处理课程 {lesson_data.get('id', 'unknown')} 时出错: {str(e)}")
                 error_count += 1
 
+        if updated_count > 0:
+            # 通知运行中的服务重新加载课程目录
+            from app.utils.lesson_sync import lessons_changed
+            lessons_changed(db)
+
         print(f"\n[RESULT] 导入结果:")
         print(f"[SUCCESS] 成功更新: {updated_count} 个课程")
         print(f"[ERROR] 处理失败: {error_count} 个课程")
@@ -217,6 +217,10 @@ def create_comprehensive_lessons(db):
     # 插入新课程数据
     result = db.lessons.insert_many(lessons)
     print(f"✅ 成功创建 {len(result.inserted_ids)} 个课程")
+
+    # 通知运行中的服务重新加载课程目录
+    from app.utils.lesson_sync import lessons_changed
+    lessons_changed(db)
     print(f"📋 课程列表:")
     for i, lesson in enumerate(lessons, 1):
         print(f"   {i}. {lesson['title']}")
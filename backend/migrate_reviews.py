@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+复习记录迁移脚本
+- 旧版本每次提交练习都以新的练习记录ID创建一条复习记录，同一卡片会有多条复习记录
+- 迁移后每个 (用户, 课程, 卡片) 只保留一条复习记录，写入 lesson_id 和 card_index
+- 合并后的复习计划按该卡片的全部作答（练习记录和复习提交）依次重放 SM-2 得到
+- 可重复执行：只处理还没有 lesson_id 的旧记录
+
+用法:
+    python migrate_reviews.py            执行迁移
+    python migrate_reviews.py --dry-run  只统计，不修改数据
+"""
+
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+
+from app import create_app, get_db
+from app.models.review import Review, card_review_events, replay_schedule
+
+
+LEGACY_FILTER = {'$or': [{'lesson_id': {'$exists': False}}, {'lesson_id': None}]}
+
+
+def group_legacy_reviews(db, user_id):
+    """
+    按练习记录把用户的旧复习记录分组
+
+    Returns:
+        tuple: ({(课程ID, 卡片索引): [旧复习记录, ...]}, 找不到练习记录的旧复习记录数)
+    """
+    reviews = list(db.reviews.find(dict(LEGACY_FILTER, user_id=user_id)))
+    practice_ids = [ObjectId(review['practice_id']) for review in reviews
+                    if ObjectId.is_valid(review.get('practice_id') or '')]
+    records = {
+        str(record['_id']): record
+        for record in db.practice_records.find(
+            {'_id': {'$in': practice_ids}}, {'lesson_id': 1, 'card_index': 1, 'submitted_at': 1}
+        )
+    }
+
+    groups = {}
+    orphaned = 0
+    for review in reviews:
+        record = records.get(review.get('practice_id'))
+        if record is None:
+            orphaned += 1
+            continue
+        review['_practice_submitted_at'] = record.get('submitted_at') or datetime.min
+        groups.setdefault((record['lesson_id'], record['card_index']), []).append(review)
+    return groups, orphaned
+
+
+def merge_card_reviews(db, user_id, lesson_id, card_index, legacy_reviews, dry_run=False):
+    """
+    将一张卡片的旧复习记录合并为一条按 (用户, 课程, 卡片) 键的复习记录
+
+    已有新格式的复习记录时保留它，否则保留最近一次作答的旧记录（前端可能持有其ID）。
+
+    Returns:
+        int: 删除的复习记录数
+    """
+    keyed = db.reviews.find_one(Review.card_key(user_id, lesson_id, card_index))
+    survivor = keyed or max(legacy_reviews, key=lambda review: review['_practice_submitted_at'])
+    others = [review['_id'] for review in legacy_reviews if review['_id'] != survivor['_id']]
+    if dry_run:
+        return len(others)
+
+    review_ids = [review['_id'] for review in legacy_reviews] + ([keyed['_id']] if keyed else [])
+    events = card_review_events(db, user_id, lesson_id, card_index, review_ids)
+    fields = dict(Review.card_key(user_id, lesson_id, card_index), updated_at=datetime.utcnow())
+    created = [review['created_at'] for review in legacy_reviews + ([keyed] if keyed else []) if review.get('created_at')]
+    if created:
+        fields['created_at'] = min(created)
+    state = replay_schedule(events)
+    if state is not None:
+        fields.update(state)
+        latest_practice = max((event for event in events if event[3] is not None), key=lambda event: event[0], default=None)
+        if latest_practice is not None:
+            fields['practice_id'] = str(latest_practice[3])
+
+    if others:
+        db.reviews.delete_many({'_id': {'$in': others}})
+        db.review_submissions.update_many({'review_id': {'$in': others}}, {'$set': {'review_id': survivor['_id']}})
+    db.reviews.update_one({'_id': survivor['_id']}, {'$set': fields})
+    return len(others)
+
+
+def migrate_reviews(db, dry_run=False):
+    """逐个用户迁移旧复习记录，返回统计信息"""
+    summary = {'users': 0, 'cards': 0, 'removed': 0, 'orphaned': 0}
+    user_ids = [row['_id'] for row in db.reviews.aggregate(
+        [{'$match': LEGACY_FILTER}, {'$group': {'_id': '$user_id'}}], allowDiskUse=True
+    )]
+
+    for user_id in user_ids:
+        if not ObjectId.is_valid(user_id or ''):
+            continue
+        groups, orphaned = group_legacy_reviews(db, user_id)
+        summary['users'] += 1
+        summary['orphaned'] += orphaned
+        for (lesson_id, card_index), legacy_reviews in groups.items():
+            summary['removed'] += merge_card_reviews(db, user_id, lesson_id, card_index, legacy_reviews, dry_run)
+            summary['cards'] += 1
+        if summary['users'] % 100 == 0:
+            print(f"⏳ 已处理 {summary['users']}/{len(user_ids)} 个用户")
+    return summary
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv
+    app = create_app()
+    with app.app_context():
+        db = get_db()
+        before = db.reviews.count_documents({})
+        print(f"🔍 复习记录总数: {before}{'（试运行，不修改数据）' if dry_run else ''}")
+
+        summary = migrate_reviews(db, dry_run)
+
+        print(f"\n🎉 迁移完成！")
+        print(f"👤 处理用户: {summary['users']} 个")
+        print(f"🗂️  合并卡片: {summary['cards']} 张")
+        print(f"🧹 {'将删除' if dry_run else '已删除'}重复复习记录: {summary['removed']} 条")
+        if summary['orphaned']:
+            print(f"⚠️  找不到练习记录的旧复习记录: {summary['orphaned']} 条（保持不变）")
+        if not dry_run:
+            print(f"📊 复习记录数: {before} -> {db.reviews.count_documents({})}")
+
+
+if __name__ == '__main__':
+    main()
@@ -209,6 +209,10 @@ def reset_database():
         except Exception as e:
             print(f"导入翻译数据时出错: {str(e)}")
 
+        # 课程数据已整体替换，通知各进程重新加载课程目录
+        from app.utils.lesson_sync import lessons_changed
+        lessons_changed(db)
+
         # 创建管理员用户
         from datetime import datetime
         from bson import ObjectId
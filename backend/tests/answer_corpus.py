@@ -0,0 +1,198 @@
+"""
+答案判定回归语料 - LaTeX 速成训练器
+
+从 comprehensive_lessons.py 和 translations/*.json 中的全部练习题生成语料：
+每个目标公式配以等价改写（空格、等价命令、花括号写法、数学分隔符）和错误写法
+（大小写、数字、缺失字符、运算符）。
+
+固定判定结果保存在 tests/data/answer_check_verdicts.json，判定逻辑有意修改后重新生成：
+    python -m tests.answer_corpus --update
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+VERDICTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'answer_check_verdicts.json')
+
+# 等价改写的类型（期望判为正确）与错误写法的类型（期望判为错误）
+EQUIVALENT_KINDS = ('exact', 'bare', 'delimiters', 'spacing', 'compact', 'equivalent_command', 'braces')
+WRONG_KINDS = ('case', 'digit', 'missing', 'operator')
+
+# 等价命令的两种写法（双向替换）
+EQUIVALENT_COMMAND_PAIRS = (
+    ('\\leq', '\\le'), ('\\geq', '\\ge'), ('\\neq', '\\ne'),
+    ('\\rightarrow', '\\to'), ('\\times', '\\cdot'),
+)
+
+# 公式片段：命令、控制符或单个字符
+LATEX_PART_PATTERN = re.compile(r'\\[a-zA-Z]+|\\.|.', re.DOTALL)
+SINGLE_SCRIPT_PATTERN = re.compile(r'([_^])([a-zA-Z0-9])')
+BRACED_SCRIPT_PATTERN = re.compile(r'([_^])\{([a-zA-Z0-9])\}')
+SIMPLE_FRAC_PATTERN = re.compile(r'\\frac\{([a-zA-Z0-9])\}\{([a-zA-Z0-9])\}')
+
+
+def load_target_formulas():
+    """收集课程及全部翻译文件中练习题的目标公式（按出现顺序去重）"""
+    from comprehensive_lessons import create_comprehensive_lessons
+
+    formulas = []
+    for lesson in create_comprehensive_lessons():
+        formulas.extend(card['target_formula'] for card in lesson['cards'] if card.get('type') == 'practice')
+
+    for path in sorted(glob.glob(os.path.join(BACKEND_DIR, 'translations', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for lesson in json.load(f).get('lessons', []):
+                for translation in lesson.get('translations', {}).values():
+                    formulas.extend(
+                        card['target_formula'] for card in translation.get('cards', [])
+                        if card.get('type') == 'practice' and card.get('target_formula')
+                    )
+    return list(dict.fromkeys(formulas))
+
+
+def compact(latex_str):
+    """去掉不影响语义的空白（控制词与其后字母之间的空格保留一个）"""
+    parts = LATEX_PART_PATTERN.findall(latex_str)
+    result = []
+    for i, part in enumerate(parts):
+        if part.isspace():
+            previous = result[-1] if result else ''
+            following = parts[i + 1] if i + 1 < len(parts) else ''
+            if re.fullmatch(r'\\[a-zA-Z]+', previous) and following[:1].isalpha():
+                result.append(' ')
+            continue
+        result.append(part)
+    return ''.join(result)
+
+
+def equivalent_variants(formula):
+    """与目标公式等价的写法"""
+    bare = formula.strip('$')
+    variants = [
+        ('exact', formula),
+        ('bare', bare),
+        ('delimiters', f'\\( {bare} \\)'),
+        ('spacing', bare.replace('{', '{ ').replace('}', ' }').replace('=', ' = ')),
+        ('compact', compact(bare)),
+    ]
+    for long_form, short_form in EQUIVALENT_COMMAND_PAIRS:
+        if re.search(re.escape(long_form) + r'(?![a-zA-Z])', bare):
+            variants.append(('equivalent_command', re.sub(re.escape(long_form) + r'(?![a-zA-Z])',
+                                                          lambda _: short_form, bare)))
+    if SINGLE_SCRIPT_PATTERN.search(bare):
+        variants.append(('braces', SINGLE_SCRIPT_PATTERN.sub(r'\1{\2}', bare)))
+    if BRACED_SCRIPT_PATTERN.search(bare):
+        variants.append(('braces', BRACED_SCRIPT_PATTERN.sub(r'\1\2', bare)))
+    if SIMPLE_FRAC_PATTERN.search(bare):
+        variants.append(('braces', SIMPLE_FRAC_PATTERN.sub(r'\\frac\1\2', bare)))
+    return variants
+
+
+def wrong_variants(formula):
+    """内容与目标公式不同的写法"""
+    parts = LATEX_PART_PATTERN.findall(formula.strip('$'))
+    variants = []
+
+    swapped = [part.swapcase() if len(part) == 1 else part for part in parts]
+    if swapped != parts:
+        variants.append(('case', ''.join(swapped)))
+
+    digits = [i for i, part in enumerate(parts) if part.isdigit()]
+    if digits:
+        changed = list(parts)
+        changed[digits[0]] = str((int(changed[digits[0]]) + 1) % 10)
+        variants.append(('digit', ''.join(changed)))
+
+    alnum = [i for i, part in enumerate(parts) if len(part) == 1 and part.isalnum()]
+    if alnum:
+        variants.append(('missing', ''.join(parts[:alnum[-1]] + parts[alnum[-1] + 1:])))
+
+    operators = [i for i, part in enumerate(parts) if part in ('+', '-')]
+    if operators:
+        changed = list(parts)
+        changed[operators[0]] = '-' if changed[operators[0]] == '+' else '+'
+        variants.append(('operator', ''.join(changed)))
+    return variants
+
+
+def build_corpus():
+    """
+    生成语料
+
+    Returns:
+        list: [{'target': 目标公式, 'kind': 改写类型, 'answer': 提交的答案}, ...]，
+              (target, answer) 唯一，顺序固定
+    """
+    corpus = []
+    seen = set()
+    for formula in load_target_formulas():
+        for kind, answer in equivalent_variants(formula) + wrong_variants(formula):
+            if (formula, answer) in seen:
+                continue
+            seen.add((formula, answer))
+            corpus.append({'target': formula, 'kind': kind, 'answer': answer})
+    return corpus
+
+
+def practice_for_target(formula):
+    """按目标公式构造 Practice 题目：solution_regex 匹配标准化后的目标公式（不含 $ 分隔符）"""
+    from app.models.practice import Practice
+    from app.utils.latex_normalizer import normalize_latex_answer
+
+    return Practice(solution_regex='^' + re.escape(normalize_latex_answer(formula.strip('$'))) + '$')
+
+
+def compute_verdicts(corpus):
+    """计算语料中每条答案在 check_latex_answer 和 Practice.check_answer 下的判定结果"""
+    from app.utils.latex_normalizer import check_latex_answer
+
+    practices = {}
+    verdicts = []
+    for entry in corpus:
+        target = entry['target']
+        if target not in practices:
+            practices[target] = practice_for_target(target)
+        verdicts.append({
+            **entry,
+            'check_latex_answer': bool(check_latex_answer(entry['answer'], target)),
+            'practice_check_answer': bool(practices[target].check_answer(entry['answer'])),
+        })
+    return verdicts
+
+
+def load_pinned_verdicts():
+    with open(VERDICTS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)['verdicts']
+
+
+def write_pinned_verdicts(verdicts):
+    os.makedirs(os.path.dirname(VERDICTS_PATH), exist_ok=True)
+    with open(VERDICTS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'verdicts': verdicts}, f, ensure_ascii=False, indent=1)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='答案判定回归语料')
+    parser.add_argument('--update', action='store_true', help='重新生成固定的判定结果')
+    args = parser.parse_args()
+
+    verdicts = compute_verdicts(build_corpus())
+    if args.update:
+        write_pinned_verdicts(verdicts)
+        print(f'已写入 {len(verdicts)} 条判定结果: {VERDICTS_PATH}')
+    else:
+        accepted = sum(entry['check_latex_answer'] for entry in verdicts)
+        print(f'语料 {len(verdicts)} 条，check_latex_answer 判为正确 {accepted} 条')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
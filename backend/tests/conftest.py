@@ -0,0 +1,103 @@
+"""
+pytest 配置 - LaTeX 速成训练器
+
+数据库测试使用 mongo_db 夹具：设置了 MONGODB_TEST_URI 时连接真实 MongoDB，
+在临时数据库中测试，结束后删除（需要 MongoDB >= 4.2）；否则使用 mongomock（见 requirements.txt）。
+"""
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+class SerializedCollection:
+    """
+    mongomock 集合的包装：每个操作持有同一把锁
+
+    mongomock 不是线程安全的；串行执行单个操作相当于 MongoDB 的单文档原子性，
+    多线程测试仍然覆盖各操作之间的所有交错。
+    """
+
+    def __init__(self, collection, lock):
+        self._collection = collection
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
+
+
+class SerializedDatabase:
+    def __init__(self, database):
+        self._database = database
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        return SerializedCollection(self._database[name], self._lock)
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+def support_pipeline_updates(monkeypatch, aggregate):
+    """
+    mongomock 缺少复习计划管道更新用到的两个 MongoDB 4.2 表达式：$round 和日期加毫秒的 $add。
+    按 MongoDB 的语义补上（$round 与 Python round 一样四舍六入五成双）。
+    """
+    handle_arithmetic = aggregate._Parser._handle_arithmetic_operator
+
+    def handle(parser, operator, values):
+        if operator == '$round':
+            number, *place = parser.parse_many(values)
+            return None if number is None else float(round(number, place[0] if place else 0))
+        if operator == '$add':
+            operands = list(parser.parse_many(values))
+            dates = [value for value in operands if isinstance(value, datetime)]
+            if len(dates) == 1:
+                return dates[0] + timedelta(milliseconds=sum(value for value in operands if value is not dates[0]))
+        return handle_arithmetic(parser, operator, values)
+
+    monkeypatch.setattr(aggregate._Parser, '_handle_arithmetic_operator', handle)
+    monkeypatch.setattr(aggregate, 'arithmetic_operators', aggregate.arithmetic_operators | {'$round'})
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """测试数据库，同时替换 app.db（get_db() 返回它）"""
+    import app as app_module
+
+    uri = os.environ.get('MONGODB_TEST_URI')
+    if uri:
+        from pymongo import MongoClient
+        from pymongo.errors import PyMongoError
+
+        client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+        try:
+            client.admin.command('ping')
+        except PyMongoError as e:
+            pytest.skip(f'无法连接 MongoDB: {e}')
+        name = f'pipeak_test_{os.getpid()}'
+        database = client[name]
+        monkeypatch.setattr(app_module, 'db', database)
+        yield database
+        client.drop_database(name)
+        client.close()
+        return
+
+    mongomock = pytest.importorskip('mongomock')
+    support_pipeline_updates(monkeypatch, pytest.importorskip('mongomock.aggregate'))
+    database = SerializedDatabase(mongomock.MongoClient()['pipeak_test'])
+    monkeypatch.setattr(app_module, 'db', database)
+    yield database
@@ -0,0 +1,81 @@
+"""
+答案判定回归测试 - LaTeX 速成训练器
+
+语料与固定判定结果见 tests/answer_corpus.py
+"""
+import pytest
+
+from tests.answer_corpus import (
+    EQUIVALENT_KINDS, WRONG_KINDS, build_corpus, compute_verdicts, load_pinned_verdicts
+)
+from app.utils.latex_normalizer import check_latex_answer
+
+
+@pytest.fixture(scope='module')
+def verdicts():
+    return compute_verdicts(build_corpus())
+
+
+def test_corpus_matches_pinned_verdicts(verdicts):
+    """判定结果与固定结果逐条一致；课程或语料变化时需重新生成固定结果"""
+    pinned = load_pinned_verdicts()
+    pinned_keys = [(entry['target'], entry['answer']) for entry in pinned]
+    current_keys = [(entry['target'], entry['answer']) for entry in verdicts]
+    assert current_keys == pinned_keys, '语料已变化，请运行 python -m tests.answer_corpus --update'
+
+    changed = [
+        (entry['target'], entry['answer'], name, expected[name], entry[name])
+        for entry, expected in zip(verdicts, pinned)
+        for name in ('check_latex_answer', 'practice_check_answer')
+        if entry[name] != expected[name]
+    ]
+    assert not changed, f'{len(changed)} 条判定结果发生变化，例如: {changed[:5]}'
+
+
+def test_corpus_covers_every_variant_kind(verdicts):
+    kinds = {entry['kind'] for entry in verdicts}
+    assert set(EQUIVALENT_KINDS) <= kinds
+    assert set(WRONG_KINDS) <= kinds
+
+
+def test_equivalent_variants_are_accepted(verdicts):
+    rejected = [(entry['kind'], entry['answer'], entry['target']) for entry in verdicts
+                if entry['kind'] in EQUIVALENT_KINDS and not entry['check_latex_answer']]
+    assert not rejected
+
+
+def test_wrong_variants_are_rejected(verdicts):
+    accepted = [(entry['kind'], entry['answer'], entry['target']) for entry in verdicts
+                if entry['kind'] in WRONG_KINDS and entry['check_latex_answer']]
+    assert not accepted
+
+
+@pytest.mark.parametrize('answer, target', [
+    ('x^2_i', 'x_i^2'),
+    ('\\sin(x)', '\\sin x'),
+    ('\\sin{x}', '\\sin x'),
+    ('sin(x)', '\\sin(x)'),
+    ('\\int_{0}^{\\pi} \\sin(x) dx = 2', '\\int_0^\\pi \\sin x \\, dx = 2'),
+    ('\\sum_{i=1}^{n} i^2', '\\sum_{i=1}^n i^{2}'),
+    ('\\frac12', '\\frac{1}{2}'),
+    ('\\dfrac{a}{b}', '\\frac{a}{b}'),
+    ('\\left( x + 1 \\right)', '(x+1)'),
+    ('a \\le b', 'a \\leq b'),
+    ('\\sqrt[3]{8}', '\\sqrt[3] 8'),
+    ('\\begin{pmatrix} 1 & 2 \\\\ 3 & 4 \\\\ \\end{pmatrix}', '\\begin{pmatrix}1&2\\\\3&4\\end{pmatrix}'),
+])
+def test_equivalent_forms(answer, target):
+    assert check_latex_answer(answer, target)
+
+
+@pytest.mark.parametrize('answer, target', [
+    ('X', 'x'),
+    ('\\Delta', '\\delta'),
+    ('x^{2}', 'x_{2}'),
+    ('\\sqrt[3]{8}', '\\sqrt{8}'),
+    ('\\frac{a}{b', '\\frac{a}{b}'),
+    ('\\begin{pmatrix} a & b \\end{bmatrix}', '\\begin{pmatrix} a & b \\end{pmatrix}'),
+    ('', 'x'),
+])
+def test_different_forms(answer, target):
+    assert not check_latex_answer(answer, target)
@@ -0,0 +1,101 @@
+"""
+答案判定性能基准 - LaTeX 速成训练器
+
+在回归语料上测量 check_latex_answer 与 Practice.check_answer 的吞吐量和尾延迟，
+低于下限时失败。下限可通过环境变量调整（例如在较慢的 CI 机器上）：
+    ANSWER_CHECK_MIN_THROUGHPUT      check_latex_answer 不经缓存的最低次数/秒（默认 2000）
+    ANSWER_CHECK_MAX_P99_MS          check_latex_answer 不经缓存的 p99 延迟上限（默认 5 毫秒）
+    PRACTICE_CHECK_MIN_THROUGHPUT    Practice.check_answer 的最低次数/秒（默认 20000）
+
+只运行功能测试时可跳过: pytest -m "not benchmark"
+"""
+import os
+import time
+
+import pytest
+
+from tests.answer_corpus import build_corpus, practice_for_target
+from app.utils.latex_normalizer import check_latex_answer, normalization_cache
+
+pytestmark = pytest.mark.benchmark
+
+ROUNDS = 5
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def measure(check, pairs, rounds=ROUNDS):
+    """
+    逐次计时
+
+    Returns:
+        tuple: (最快一轮的每秒次数, 全部调用的 p50 毫秒, p99 毫秒)
+    """
+    latencies = []
+    best = float('inf')
+    for _ in range(rounds):
+        round_start = time.perf_counter()
+        for first, second in pairs:
+            start = time.perf_counter()
+            check(first, second)
+            latencies.append(time.perf_counter() - start)
+        best = min(best, time.perf_counter() - round_start)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(pairs) / best, p50, p99
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return build_corpus()
+
+
+@pytest.fixture
+def cache_disabled():
+    """关闭标准化缓存，测量每次都完整解析的最坏情况"""
+    max_entries = normalization_cache.max_entries
+    normalization_cache.max_entries = 0
+    normalization_cache.clear()
+    yield
+    normalization_cache.max_entries = max_entries
+    normalization_cache.clear()
+
+
+def test_check_latex_answer_uncached(corpus, cache_disabled):
+    pairs = [(entry['answer'], entry['target']) for entry in corpus]
+    throughput, p50, p99 = measure(check_latex_answer, pairs)
+    print(f'\ncheck_latex_answer（不经缓存）: {throughput:,.0f} 次/秒  p50 {p50:.3f} ms  p99 {p99:.3f} ms')
+
+    assert throughput >= env_float('ANSWER_CHECK_MIN_THROUGHPUT', 2000)
+    assert p99 <= env_float('ANSWER_CHECK_MAX_P99_MS', 5)
+
+
+def test_check_latex_answer_cached(corpus):
+    """缓存命中时的吞吐量不应低于不经缓存时"""
+    pairs = [(entry['answer'], entry['target']) for entry in corpus]
+    normalization_cache.clear()
+    cached, _, cached_p99 = measure(check_latex_answer, pairs)
+
+    normalization_cache.max_entries, max_entries = 0, normalization_cache.max_entries
+    try:
+        uncached, _, _ = measure(check_latex_answer, pairs)
+    finally:
+        normalization_cache.max_entries = max_entries
+        normalization_cache.clear()
+    print(f'\ncheck_latex_answer（经缓存）: {cached:,.0f} 次/秒  p99 {cached_p99:.3f} ms')
+
+    assert cached >= uncached
+
+
+def test_practice_check_answer(corpus):
+    practices = {target: practice_for_target(target) for target in {entry['target'] for entry in corpus}}
+    pairs = [(practices[entry['target']], entry['answer']) for entry in corpus]
+
+    throughput, p50, p99 = measure(lambda practice, answer: practice.check_answer(answer), pairs)
+    print(f'\nPractice.check_answer: {throughput:,.0f} 次/秒  p50 {p50:.3f} ms  p99 {p99:.3f} ms')
+
+    assert throughput >= env_float('PRACTICE_CHECK_MIN_THROUGHPUT', 20000)
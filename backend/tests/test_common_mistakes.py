@@ -0,0 +1,157 @@
+"""
+常见错误挖掘测试 - LaTeX 速成训练器
+
+聚类、匹配和针对性提示都是纯函数，不需要数据库；生成聚类任务的测试使用 mongo_db 夹具。
+"""
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from app.models.lesson_catalog import lesson_catalog
+from app.utils.common_mistakes import (
+    cluster_card_answers, iter_card_tasks, match_common_mistake, targeted_hint, token_edit_distance, tokenize
+)
+from app.utils.latex_normalizer import NORMALIZER_VERSION, normalize_latex
+
+TARGET = 'x^{2}+y^{2}'
+ANSWERS = [('x^2+y^3', 5), ('x^{2}+y^{3}', 4), ('x^2-y^2', 3)]
+
+
+def mined(answers=ANSWERS, target=TARGET, top_n=5, min_count=1):
+    """按挖掘任务写入的格式返回卡片的常见错误文档"""
+    _, _, target_normalized, total, clusters = cluster_card_answers(('lesson', 0, target, answers, top_n, min_count))
+    return {
+        'normalizer_version': NORMALIZER_VERSION,
+        'target_normalized': target_normalized,
+        'total_wrong': total,
+        'clusters': clusters,
+    }
+
+
+@pytest.mark.parametrize('first, second, limit, expected', [
+    ('abc', 'abc', 3, 0),
+    ('abc', 'abd', 3, 1),
+    ('abc', 'ab', 3, 1),
+    ('abc', 'xbcd', 3, 2),
+    ('', 'abc', 3, 3),
+    ('abcdef', 'fedcba', 2, 3),  # 超过 limit 时返回 limit + 1
+    ('a', 'abcdef', 2, 3),
+])
+def test_token_edit_distance(first, second, limit, expected):
+    assert token_edit_distance(tuple(first), tuple(second), limit) == expected
+
+
+def test_token_edit_distance_matches_full_levenshtein_within_limit():
+    def levenshtein(first, second):
+        previous = list(range(len(second) + 1))
+        for i, token in enumerate(first, 1):
+            current = [i]
+            for j, other in enumerate(second, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (token != other)))
+            previous = current
+        return previous[-1]
+
+    words = ['x^{2}', 'x^{3}', 'x_{2}', '\\frac{a}{b}', '\\frac{b}{a}', 'a+b', 'ab+', '']
+    for first in words:
+        for second in words:
+            distance = levenshtein(first, second)
+            for limit in range(4):
+                assert token_edit_distance(tuple(first), tuple(second), limit) == min(distance, limit + 1)
+
+
+def test_cluster_merges_equivalent_forms_and_skips_correct_answers():
+    _, _, target_normalized, total, clusters = cluster_card_answers(
+        ('lesson', 0, TARGET, ANSWERS + [('x^2+y^2', 7)], 5, 1)
+    )
+    assert target_normalized == normalize_latex(TARGET)
+    assert total == 12  # 与目标等价的答案不计入错误
+    top = clusters[0]
+    assert top['count'] == 9
+    assert top['example'] == 'x^2+y^3'
+    assert top['share'] == 0.75
+
+
+def test_cluster_keeps_errors_at_different_positions_apart():
+    clusters = mined()['clusters']
+    assert [(cluster['normalized'], cluster['count']) for cluster in clusters] == [
+        ('x^{2}+y^{3}', 9), ('x^{2}-y^{2}', 3)
+    ]
+    assert clusters[1]['difference'] == {'position': 5, 'found': '-', 'expected': '+'}
+
+
+def test_cluster_merges_nearby_errors_at_the_same_position():
+    clusters = mined(ANSWERS + [('x^2+y^4', 2)])['clusters']
+    assert clusters[0]['count'] == 11
+    assert 'x^{2}+y^{4}' in clusters[0]['forms']
+
+
+def test_cluster_applies_min_count_and_top_n():
+    answers = [('xbcd', 5), ('axcd', 4), ('abxd', 3), ('abcx', 1)]  # 错误位置各不相同
+    clusters = mined(answers, target='abcd', top_n=2, min_count=2)['clusters']
+    assert [cluster['count'] for cluster in clusters] == [5, 4]
+
+
+def test_match_common_mistake():
+    mistakes = mined()
+    assert match_common_mistake(mistakes, 'x^{2}+y^{3}')['count'] == 9
+    assert match_common_mistake(mistakes, 'x^{2}+y^{4}')['count'] == 9  # 相同位置的相近错误
+    assert match_common_mistake(mistakes, 'x^{2}-y^{2}')['count'] == 3
+    assert match_common_mistake(mistakes, 'x^{3}+y^{2}') is None  # 位置不同，不匹配
+    assert match_common_mistake(mistakes, '\\alpha') is None
+    assert match_common_mistake(None, 'x^{2}+y^{3}') is None
+    assert match_common_mistake(dict(mistakes, normalizer_version='old'), 'x^{2}+y^{3}') is None
+
+
+@pytest.mark.parametrize('answer, difference', [
+    ('x^2-y^2', {'position': 5, 'found': '-', 'expected': '+'}),
+    ('x^2+y^4', {'position': 9, 'found': '4', 'expected': '2'}),
+    ('x^2+y^3', {'position': 9, 'found': '3', 'expected': '2'}),
+])
+def test_targeted_hint_describes_the_submitted_answer(answer, difference):
+    mistakes = mined()
+    db = SimpleNamespace(common_mistakes=SimpleNamespace(find_one=lambda query, projection: mistakes))
+    with Flask(__name__).app_context():
+        hint = targeted_hint(db, 'lesson', 0, answer, normalize_latex(TARGET))
+    assert {key: hint[key] for key in difference} == difference
+    assert hint['message_key'] == 'practice.commonMistake'
+
+
+def test_targeted_hint_ignores_mistakes_mined_for_an_old_target():
+    mistakes = mined()
+    db = SimpleNamespace(common_mistakes=SimpleNamespace(find_one=lambda query, projection: mistakes))
+    with Flask(__name__).app_context():
+        assert targeted_hint(db, 'lesson', 0, 'x^2+y^3', normalize_latex('x^{3}+y^{3}')) is None
+
+
+def test_card_tasks_use_the_current_target_only(mongo_db):
+    lesson_id = ObjectId()
+    mongo_db.lessons.insert_one({'_id': lesson_id, 'sequence': 1, 'cards': [
+        {'type': 'knowledge'},
+        {'type': 'practice', 'target_formula': 'x^{3}+y^{3}'},
+    ]})
+    lesson_catalog.invalidate()
+    records = (
+        [('x^2+y^3', 'x^{2}+y^{2}')] * 4  # 修改目标前按旧目标判错的记录
+        + [('x^2+y^2', 'x^{3}+y^{3}')] * 3
+        + [('x^3-y^3', 'x^3 + y^3')] * 2  # 与当前目标等价的写法
+        + [('z', None)]
+    )
+    mongo_db.practice_records.insert_many([
+        {'lesson_id': lesson_id, 'card_index': 1, 'user_answer': answer, 'target_answer': target, 'is_correct': False}
+        for answer, target in records
+    ] + [{'lesson_id': ObjectId(), 'card_index': 0, 'user_answer': 'a', 'target_answer': 'b', 'is_correct': False}])
+
+    try:
+        tasks = list(iter_card_tasks(mongo_db, 5, 1))
+    finally:
+        lesson_catalog.invalidate()
+    assert len(tasks) == 1  # 已不存在的课程不产生任务
+    task_lesson, card_index, target, answers, _, _ = tasks[0]
+    assert (task_lesson, card_index, target) == (lesson_id, 1, 'x^{3}+y^{3}')
+    assert sorted(answers) == [('x^2+y^2', 3), ('x^3-y^3', 2)]
+
+
+def test_tokenize_ignores_whitespace():
+    assert tokenize('x ^ {2}') == ('x', '^', '{', '2', '}')
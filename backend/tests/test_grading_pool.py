@@ -0,0 +1,135 @@
+"""
+判题进程池和练习接口请求体上限测试 - LaTeX 速成训练器
+
+用可控的进程池替身检查：一个请求超时终止进程池时，同一进程池中其他请求的任务在新进程池中
+重新提交，而不是被判为超时；没有 Content-Length 的请求体同样受大小上限约束。
+"""
+import io
+import threading
+import time
+
+import pytest
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from app.routes.practice import limit_request_size
+from app.utils import grading_pool as grading_pool_module
+from app.utils.grading_pool import GradingPool
+
+
+class FakePool:
+    """答案 'stuck' 永远不完成；其他答案在 release() 之后完成"""
+
+    def __init__(self, processes, released):
+        self.pending = []
+        self.terminated = False
+        self.released = released
+
+    def apply(self, func, args):
+        return func(*args)
+
+    def apply_async(self, func, args, callback, error_callback):
+        self.pending.append((args[0], callback))
+        if self.released.is_set():
+            self.release()
+
+    def release(self):
+        for answer, callback in self.pending:
+            if answer != 'stuck':
+                callback(f'normalized:{answer}')
+
+    def terminate(self):
+        self.terminated = True
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """记录创建的进程池；第一个进程池中的任务只在显式 release() 后完成，之后的进程池立即完成"""
+    created = []
+
+    class Context:
+        def Pool(self, processes):
+            pool = FakePool(processes, threading.Event())
+            if created:
+                pool.released.set()
+            created.append(pool)
+            return pool
+
+    monkeypatch.setattr(grading_pool_module.multiprocessing, 'get_context', lambda method: Context())
+    monkeypatch.setattr(grading_pool_module, '_normalize_in_worker', lambda answer: answer)
+    return created
+
+
+def test_timeout_only_fails_the_callers_own_tasks(pools):
+    pool = GradingPool()
+    pool._get_handle(2)
+    results = {}
+    other = threading.Thread(target=lambda: results.update(pool.normalize_many(['x^2'], 5, 2)))
+    other.start()
+    while not pools[0].pending:
+        time.sleep(0.001)
+
+    assert pool.normalize_many(['stuck'], 0.05, 2) == {'stuck': None}
+    other.join(5)
+
+    assert pools[0].terminated
+    assert results == {'x^2': 'normalized:x^2'}
+    assert len(pools) == 2
+    stats = pool.stats()
+    assert (stats['timeouts'], stats['restarts'], stats['resubmitted'], stats['failures']) == (1, 1, 1, 0)
+
+
+def test_completed_tasks_keep_their_results_when_another_task_times_out(pools):
+    pool = GradingPool()
+    pool._get_handle(2)
+    pools[0].released.set()
+    assert pool.normalize_many(['a', 'stuck'], 0.05, 2) == {'a': 'normalized:a', 'stuck': None}
+    assert pool.stats()['running'] is False
+
+
+def test_warm_starts_the_pool_in_the_background(pools):
+    pool = GradingPool()
+    pool.warm(2)
+    for thread in threading.enumerate():
+        if thread.name == 'grading-pool-warm':
+            thread.join(5)
+    assert pool.stats()['running']
+    pool.normalize_many(['a'], 1, 2)
+    assert len(pools) == 1
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['PRACTICE_MAX_REQUEST_BYTES'] = 16
+    return app
+
+
+def chunked_request(app, body):
+    """分块传输的请求：没有 Content-Length，服务器设置 wsgi.input_terminated"""
+    builder = EnvironBuilder(path='/api/practice/submit', method='POST', input_stream=io.BytesIO(body),
+                             content_type='application/json')
+    environ = builder.get_environ()
+    environ.pop('CONTENT_LENGTH', None)
+    environ['wsgi.input_terminated'] = True
+    return app.request_context(environ)
+
+
+def test_request_without_content_length_is_limited(app):
+    with chunked_request(app, b'{"user_answer": "' + b'x' * 64 + b'"}') as context:
+        assert context.request.content_length is None
+        response, status = limit_request_size()
+        assert status == 413
+
+
+def test_small_request_without_content_length_is_still_readable(app):
+    with chunked_request(app, b'{"a": 1}') as context:
+        assert context.request.content_length is None
+        assert limit_request_size() is None
+        assert context.request.get_json() == {'a': 1}
+
+
+def test_request_with_content_length_over_the_limit_is_rejected(app):
+    with app.test_request_context('/api/practice/submit', method='POST', data=b'x' * 17):
+        response, status = limit_request_size()
+        assert status == 413
@@ -0,0 +1,48 @@
+"""
+课程ID解析测试 - LaTeX 速成训练器
+
+解析只使用课程目录快照：不存在的课程返回 None，不再逐个请求查询数据库。
+"""
+import pytest
+from bson import ObjectId
+
+from app.models.lesson_catalog import bump_catalog_version, lesson_catalog
+from app.utils.lesson_resolver import resolve_lesson
+
+
+@pytest.fixture
+def db(mongo_db):
+    lesson_catalog.invalidate()
+    lesson_id = mongo_db.lessons.insert_one({'sequence': 1, 'title': '第一课'}).inserted_id
+    bump_catalog_version(mongo_db)
+    yield mongo_db, lesson_id
+    lesson_catalog.invalidate()
+
+
+def test_resolves_ids_and_aliases_from_the_catalog(db):
+    _, lesson_id = db
+    for lesson_ref in (lesson_id, str(lesson_id), 'lesson-1', 1):
+        assert resolve_lesson(lesson_ref)['_id'] == lesson_id
+    for lesson_ref in ('lesson-x', 'abc', True, None, 2):
+        assert resolve_lesson(lesson_ref) is None
+
+
+def test_missing_lesson_is_not_looked_up_in_the_database(db, monkeypatch):
+    mongo_db, _ = db
+    resolve_lesson('lesson-1')  # 加载快照
+
+    class NoLessonQueries:
+        def __getattr__(self, name):
+            raise AssertionError(f'unexpected lessons.{name}')
+
+    monkeypatch.setattr(type(mongo_db), 'lessons', NoLessonQueries(), raising=False)
+    assert resolve_lesson(str(ObjectId())) is None
+    assert resolve_lesson('lesson-99') is None
+
+
+def test_new_lessons_become_visible_after_the_version_bump(db):
+    mongo_db, _ = db
+    assert resolve_lesson('lesson-2') is None
+    lesson_id = mongo_db.lessons.insert_one({'sequence': 2, 'title': '第二课'}).inserted_id
+    bump_catalog_version(mongo_db)
+    assert resolve_lesson('lesson-2')['_id'] == lesson_id
@@ -0,0 +1,66 @@
+"""
+实时答案校验测试 - LaTeX 速成训练器
+
+编辑中途的答案（命令名、参数或花括号尚未输入完整）是目标公式的前缀时不能报告为 diverged；
+会话答案保存在数据库中，增量编辑可以由任何 worker 处理。
+"""
+import pytest
+
+from app.utils.latex_normalizer import normalize_latex
+from app.utils.live_validation import apply_edit, compare_answer, load_session_state, save_session_state
+
+TARGETS = [
+    r'\frac{a}{b}+\sqrt{x}',
+    r'x^{2}+\alpha',
+    r'\sqrt[3]{8}',
+    r'\left(x\right)\cdot y',
+    r'\dfrac{1}{2} \le x',
+    r'\sin x',
+]
+
+
+@pytest.mark.parametrize('target', TARGETS)
+def test_every_typed_prefix_of_the_target_is_a_prefix(target):
+    target_normalized = normalize_latex(target)
+    for end in range(len(target)):
+        answer = target[:end].strip()
+        assert compare_answer(answer, target_normalized)['status'] == 'prefix', answer
+    assert compare_answer(target, target_normalized) == {'status': 'match'}
+
+
+@pytest.mark.parametrize('answer', [r'\fr', r'\frac a', r'\frac a{', r'\frac{a}', r'\frac{a}{'])
+def test_unfinished_commands_and_groups_are_prefixes(answer):
+    assert compare_answer(answer, normalize_latex(r'\frac{a}{b}'))['status'] == 'prefix'
+
+
+@pytest.mark.parametrize('answer, position', [
+    (r'\frac12', 2),
+    (r'\frac{b', 2),
+    (r'\alpha', 0),
+    (r'\frac{a}{c', 5),
+])
+def test_wrong_input_still_diverges(answer, position):
+    assert compare_answer(answer, normalize_latex(r'\frac{a}{b}')) == {'status': 'diverged', 'diverges_at': position}
+
+
+def test_unfinished_command_must_complete_to_the_expected_token():
+    assert compare_answer(r'x+\be', normalize_latex(r'x+\beta'))['status'] == 'prefix'
+    assert compare_answer(r'x+\ga', normalize_latex(r'x+\beta'))['status'] == 'diverged'
+
+
+def test_session_state_is_shared_through_the_database(mongo_db):
+    session_id = 'signed-session-token'
+    assert load_session_state(mongo_db, session_id) is None
+
+    save_session_state(mongo_db, session_id, 1, 'x^', ttl=60)
+    # 下一个请求落在另一个 worker 上：从数据库读取上一个答案后应用增量编辑
+    state = load_session_state(mongo_db, session_id)
+    assert apply_edit(state, {'seq': 2, 'start': 2, 'end': 2, 'text': '2'}) == 'x^2'
+
+
+def test_older_edits_do_not_overwrite_the_session(mongo_db):
+    session_id = 'signed-session-token'
+    save_session_state(mongo_db, session_id, 5, 'x^2', ttl=60)
+    save_session_state(mongo_db, session_id, 3, 'x', ttl=60)
+    assert load_session_state(mongo_db, session_id) == (5, 'x^2')
+    assert mongo_db.live_validation_sessions.count_documents({}) == 1
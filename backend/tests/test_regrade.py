@@ -0,0 +1,134 @@
+"""
+重新判题后的进度同步测试 - LaTeX 速成训练器
+
+只修改判定结果变化的卡片；不是由练习记录产生的完成状态（/practice/complete）保持不变；
+卡片完成状态变化的课程重新计算 users.progress.completed_lessons。
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.models.lesson_catalog import lesson_catalog
+from app.utils.regrade import claim_job, create_job, recompute_lesson_completion, recompute_progress, run_job
+
+T0 = datetime(2024, 5, 1, 9, 0)
+
+
+@pytest.fixture
+def db(mongo_db):
+    lesson_catalog.invalidate()
+    yield mongo_db
+    lesson_catalog.invalidate()
+
+
+@pytest.fixture
+def user_lesson(db):
+    """一门有两张练习卡片的课程，以及已完成该课程的用户"""
+    user_id, lesson_id = ObjectId(), ObjectId()
+    db.lessons.insert_one({'_id': lesson_id, 'sequence': 1, 'cards': [
+        {'type': 'practice', 'target_formula': 'a'},
+        {'type': 'knowledge'},
+        {'type': 'practice', 'target_formula': 'b'},
+    ]})
+    db.users.insert_one({'_id': user_id, 'progress': {'completed_lessons': [str(lesson_id)]}})
+    return user_id, lesson_id
+
+
+def add_record(db, user_id, lesson_id, card_index, is_correct, submitted_at):
+    record = {'user_id': user_id, 'lesson_id': lesson_id, 'card_index': card_index,
+              'is_correct': is_correct, 'submitted_at': submitted_at}
+    record['_id'] = db.practice_records.insert_one(record).inserted_id
+    return record
+
+
+def set_progress(db, user_id, lesson_id, cards):
+    db.user_progress.insert_one({'user_id': user_id, 'lesson_id': lesson_id, 'cards_progress': {
+        str(index): {'attempts': 1, 'completed': completed_at is not None, 'first_completed_at': completed_at}
+        for index, completed_at in cards.items()
+    }})
+
+
+def cards_progress(db, user_id, lesson_id):
+    return db.user_progress.find_one({'user_id': user_id, 'lesson_id': lesson_id})['cards_progress']
+
+
+def completed_lessons(db, user_id):
+    return db.users.find_one({'_id': user_id})['progress']['completed_lessons']
+
+
+def test_card_completed_by_a_regraded_answer_is_uncompleted(db, user_lesson):
+    user_id, lesson_id = user_lesson
+    # 卡片 0 的完成来自旧规则判为正确、新规则判为错误的作答
+    record = add_record(db, user_id, lesson_id, 0, False, T0)
+    set_progress(db, user_id, lesson_id, {0: T0 + timedelta(milliseconds=3), 2: T0})
+
+    updated, changed = recompute_progress(db, [record])
+    assert updated == 1
+    assert changed == [(user_id, lesson_id)]
+    assert cards_progress(db, user_id, lesson_id)['0'] == {
+        'attempts': 1, 'completed': False, 'first_completed_at': None
+    }
+
+    assert recompute_lesson_completion(db, changed) == 1
+    assert completed_lessons(db, user_id) == []
+
+
+def test_only_cards_with_changed_verdicts_are_touched(db, user_lesson):
+    user_id, lesson_id = user_lesson
+    record = add_record(db, user_id, lesson_id, 0, True, T0 + timedelta(hours=1))
+    # 卡片 2 经 /practice/complete 标记完成，只有错误的作答
+    add_record(db, user_id, lesson_id, 2, False, T0)
+    set_progress(db, user_id, lesson_id, {0: None, 2: T0 + timedelta(minutes=1)})
+
+    updated, changed = recompute_progress(db, [record])
+    cards = cards_progress(db, user_id, lesson_id)
+    assert cards['0']['completed'] is True
+    assert cards['0']['first_completed_at'] == T0 + timedelta(hours=1)
+    assert cards['2'] == {'attempts': 1, 'completed': True, 'first_completed_at': T0 + timedelta(minutes=1)}
+
+    db.users.update_one({'_id': user_id}, {'$set': {'progress.completed_lessons': []}})
+    assert recompute_lesson_completion(db, changed) == 1
+    assert completed_lessons(db, user_id) == [str(lesson_id)]
+
+
+def test_completion_that_precedes_every_old_correct_answer_is_kept(db, user_lesson):
+    user_id, lesson_id = user_lesson
+    # 先经 /practice/complete 标记完成，之后的作答旧规则判为正确、新规则判为错误
+    record = add_record(db, user_id, lesson_id, 0, False, T0 + timedelta(days=1))
+    set_progress(db, user_id, lesson_id, {0: T0, 2: T0})
+
+    assert recompute_progress(db, [record]) == (0, [])
+    assert cards_progress(db, user_id, lesson_id)['0']['completed'] is True
+    assert completed_lessons(db, user_id) == [str(lesson_id)]
+
+
+def test_earlier_correct_answer_moves_first_completed_at(db, user_lesson):
+    user_id, lesson_id = user_lesson
+    record = add_record(db, user_id, lesson_id, 0, True, T0)
+    add_record(db, user_id, lesson_id, 0, True, T0 + timedelta(days=2))
+    set_progress(db, user_id, lesson_id, {0: T0 + timedelta(days=2), 2: T0})
+
+    updated, changed = recompute_progress(db, [record])
+    assert (updated, changed) == (1, [])  # 完成状态不变，只更新首次完成时间
+    assert cards_progress(db, user_id, lesson_id)['0']['first_completed_at'] == T0
+
+
+def test_job_regrades_records_and_syncs_progress(db, user_lesson):
+    user_id, lesson_id = user_lesson
+    # 旧规则把等价写法判为错误：重新判题后卡片 0 完成，课程随之完成
+    db.users.update_one({'_id': user_id}, {'$set': {'progress.completed_lessons': []}})
+    for card_index, answer, target, is_correct in [(0, 'a ', 'a', False), (2, 'b', 'b', True)]:
+        db.practice_records.insert_one({
+            'user_id': user_id, 'lesson_id': lesson_id, 'card_index': card_index, 'user_answer': answer,
+            'target_answer': target, 'is_correct': is_correct, 'submitted_at': T0
+        })
+    set_progress(db, user_id, lesson_id, {0: None, 2: T0})
+
+    job = claim_job(db, create_job(db, 'test')['_id'])
+    assert run_job(db, job, batch_size=1, workers=1) == 'completed'
+
+    job = db.regrade_jobs.find_one({'_id': job['_id']})
+    assert (job['scanned'], job['changed'], job['progress_updated'], job['lessons_updated']) == (2, 1, 1, 1)
+    assert cards_progress(db, user_id, lesson_id)['0']['first_completed_at'] == T0
+    assert completed_lessons(db, user_id) == [str(lesson_id)]
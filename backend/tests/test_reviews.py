@@ -0,0 +1,215 @@
+"""
+复习计划测试 - LaTeX 速成训练器
+
+管道更新（数据库中计算 SM-2）必须与 sm2_schedule 逐步一致；每个 (用户, 课程, 卡片)
+只有一条复习记录；migrate_reviews.py 把旧版本按练习记录创建的复习记录合并为一条。
+"""
+import math
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import app as app_module
+import migrate_reviews
+from app.models.review import Review, replay_schedule, sm2_schedule
+
+QUALITIES = [5, 4, 3, 5, 5, 2, 0, 4, 5, 5, 3, 5, 1, 5, 4, 5, 5]
+START = datetime(2024, 3, 1, 8, 30)
+
+
+@pytest.fixture
+def db(mongo_db):
+    app_module.create_indexes()
+    return mongo_db
+
+
+def assert_same_schedule(review, expected):
+    assert review.repetitions == expected['repetitions']
+    assert review.last_interval_days == expected['last_interval_days']
+    assert math.isclose(review.easiness_factor, expected['easiness_factor'])
+    assert abs(review.next_review_date - expected['next_review_date']) < timedelta(milliseconds=1)
+
+
+def test_pipeline_matches_sm2_schedule(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    expected = {'easiness_factor': 2.5, 'repetitions': 0, 'last_interval_days': 0}
+    for step, quality in enumerate(QUALITIES):
+        answered_at = START + timedelta(days=step)
+        is_correct = quality >= 3
+        expected = sm2_schedule(expected['easiness_factor'], expected['repetitions'],
+                                expected['last_interval_days'], is_correct, quality, answered_at)
+        review = Review.record_attempt(user_id, lesson_id, 0, ObjectId(), is_correct, quality, answered_at)
+        assert_same_schedule(review, expected)
+
+    assert db.reviews.count_documents(Review.card_key(user_id, lesson_id, 0)) == 1
+    assert expected['last_interval_days'] > 6  # 序列覆盖了按 E-Factor 计算间隔的分支
+
+
+def test_review_submit_continues_the_same_schedule(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    review = Review.record_attempt(user_id, lesson_id, 2, ObjectId(), True, 4, START)
+    expected = sm2_schedule(2.5, 0, 0, True, 4, START)
+    for quality in (5, 4, 2):
+        expected = sm2_schedule(expected['easiness_factor'], expected['repetitions'],
+                                expected['last_interval_days'], quality >= 3, quality)
+        assert review.update_review_schedule(quality >= 3, quality)
+        assert review.repetitions == expected['repetitions']
+        assert review.last_interval_days == expected['last_interval_days']
+        assert math.isclose(review.easiness_factor, expected['easiness_factor'])
+
+
+def test_bulk_upsert_matches_single_attempts(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    attempts = [
+        (lesson_id, step % 2, ObjectId(), quality >= 3, quality, START + timedelta(hours=step))
+        for step, quality in enumerate(QUALITIES)
+    ]
+    assert Review.bulk_upsert_reviews(user_id, attempts) == len(attempts)
+
+    for card_index in (0, 1):
+        card_attempts = [attempt for attempt in attempts if attempt[1] == card_index]
+        expected = replay_schedule([(answered_at, is_correct, quality)
+                                    for _, _, _, is_correct, quality, answered_at in card_attempts])
+        reviews = list(db.reviews.find(Review.card_key(user_id, lesson_id, card_index)))
+        assert len(reviews) == 1
+        assert_same_schedule(Review.from_dict(reviews[0]), expected)
+        assert reviews[0]['practice_id'] == str(card_attempts[-1][2])
+
+
+def test_record_attempt_retries_after_losing_the_insert_race(db, monkeypatch):
+    """并发请求先创建了同一卡片的复习记录：upsert 被唯一索引拒绝后重试为普通更新"""
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    reviews = db.reviews
+
+    class LosesFirstInsert:
+        raced = False
+
+        def __getattr__(self, name):
+            return getattr(reviews, name)
+
+        def find_one_and_update(self, *args, **kwargs):
+            if not self.raced:
+                self.raced = True
+                Review.record_attempt(user_id, lesson_id, 0, ObjectId(), True, 4, START)
+                raise DuplicateKeyError('E11000 duplicate key error')
+            return reviews.find_one_and_update(*args, **kwargs)
+
+    racing = LosesFirstInsert()
+    monkeypatch.setattr(app_module, 'db', type('Database', (), {'reviews': racing})())
+    review = Review.record_attempt(user_id, lesson_id, 0, ObjectId(), True, 4, START + timedelta(days=1))
+    monkeypatch.setattr(app_module, 'db', db)
+
+    assert racing.raced
+    assert review.repetitions == 2
+    assert db.reviews.count_documents(Review.card_key(user_id, lesson_id, 0)) == 1
+
+
+def test_unique_index_rejects_a_second_review_for_the_same_card(db):
+    key = Review.card_key(ObjectId(), ObjectId(), 0)
+    db.reviews.insert_one(dict(key, repetitions=0))
+    with pytest.raises(DuplicateKeyError):
+        db.reviews.insert_one(dict(key, repetitions=0))
+    # 旧版本的复习记录没有 lesson_id，不受唯一索引约束
+    db.reviews.insert_many([{'user_id': key['user_id'], 'practice_id': str(ObjectId())} for _ in range(2)])
+
+
+def legacy_history(db, user_id, lesson_id, card_index, verdicts, start):
+    """按旧版本的方式为每次作答创建练习记录和一条复习记录，返回复习记录ID（按作答顺序）"""
+    review_ids = []
+    for step, is_correct in enumerate(verdicts):
+        submitted_at = start + timedelta(days=step)
+        practice_id = db.practice_records.insert_one({
+            'user_id': ObjectId(user_id), 'lesson_id': ObjectId(lesson_id), 'card_index': card_index,
+            'is_correct': is_correct, 'submitted_at': submitted_at
+        }).inserted_id
+        review_ids.append(db.reviews.insert_one(dict(
+            sm2_schedule(2.5, 0, 0, is_correct, 4 if is_correct else 1, submitted_at),
+            user_id=user_id, practice_id=str(practice_id), created_at=submitted_at
+        )).inserted_id)
+    return review_ids
+
+
+def test_migration_leaves_one_review_per_card(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    other_user = str(ObjectId())
+    card0 = legacy_history(db, user_id, lesson_id, 0, [True, False, True, True], START)
+    card1 = legacy_history(db, user_id, lesson_id, 1, [False, True], START)
+    legacy_history(db, other_user, lesson_id, 0, [True, True, True], START)
+    # 卡片 1 在迁移前已用新方式作答过一次，已有按卡片键的复习记录
+    keyed = Review.record_attempt(user_id, lesson_id, 1, ObjectId(), True, 5, START + timedelta(days=9))
+    # 针对旧复习记录的复习提交
+    submitted_at = START + timedelta(days=10)
+    db.review_submissions.insert_one({'user_id': ObjectId(user_id), 'review_id': card0[1],
+                                      'is_correct': True, 'quality': 5, 'submitted_at': submitted_at})
+    orphan = db.reviews.insert_one({'user_id': user_id, 'practice_id': str(ObjectId())}).inserted_id
+
+    dry_run = migrate_reviews.migrate_reviews(db, dry_run=True)
+    assert dry_run['removed'] == 3 + 2 + 2
+    assert db.reviews.count_documents({}) == 4 + 2 + 3 + 1 + 1
+
+    summary = migrate_reviews.migrate_reviews(db)
+    assert summary == {'users': 2, 'cards': 3, 'removed': 7, 'orphaned': 1}
+
+    keys = [(review['user_id'], review['lesson_id'], review['card_index'])
+            for review in db.reviews.find({'lesson_id': {'$type': 'string'}})]
+    assert sorted(keys) == sorted([(user_id, lesson_id, 0), (user_id, lesson_id, 1), (other_user, lesson_id, 0)])
+    assert db.reviews.find_one({'_id': orphan}) is not None
+
+    # 复习计划为该卡片全部作答（练习记录和复习提交）依次重放的结果
+    survivor0 = db.reviews.find_one(Review.card_key(user_id, lesson_id, 0))
+    assert survivor0['_id'] == card0[-1]  # 保留最近一次作答的旧复习记录
+    expected0 = replay_schedule(
+        [(START + timedelta(days=step), is_correct, 4 if is_correct else 1)
+         for step, is_correct in enumerate([True, False, True, True])] + [(submitted_at, True, 5)]
+    )
+    assert_same_schedule(Review.from_dict(survivor0), expected0)
+    assert db.review_submissions.find_one({})['review_id'] == card0[-1]
+
+    survivor1 = db.reviews.find_one(Review.card_key(user_id, lesson_id, 1))
+    assert survivor1['_id'] == keyed._id  # 已有按卡片键的复习记录时保留它
+    assert not db.reviews.find_one({'_id': {'$in': card1}})
+
+    assert migrate_reviews.migrate_reviews(db) == {'users': 1, 'cards': 0, 'removed': 0, 'orphaned': 1}
+
+
+def practice_attempt(db, user_id, lesson_id, card_index, is_correct, submitted_at):
+    """写入练习记录，返回 bulk_upsert_reviews 的作答元组"""
+    practice_id = db.practice_records.insert_one({
+        'user_id': ObjectId(user_id), 'lesson_id': ObjectId(lesson_id), 'card_index': card_index,
+        'is_correct': is_correct, 'submitted_at': submitted_at
+    }).inserted_id
+    return lesson_id, card_index, practice_id, is_correct, 4 if is_correct else 1, submitted_at
+
+
+def test_offline_attempt_synced_after_a_newer_submit_is_replayed_in_order(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    online = [practice_attempt(db, user_id, lesson_id, 0, True, START + timedelta(days=day)) for day in (0, 3)]
+    for attempt in online:
+        Review.record_attempt(user_id, *attempt[:2], *attempt[2:])
+    # 第 1 天离线答错，第 3 天在线作答之后才同步
+    offline = practice_attempt(db, user_id, lesson_id, 0, False, START + timedelta(days=1))
+    assert Review.bulk_upsert_reviews(user_id, [offline]) == 1
+
+    review = db.reviews.find_one(Review.card_key(user_id, lesson_id, 0))
+    expected = replay_schedule([(attempt[5], attempt[3], attempt[4]) for attempt in online + [offline]])
+    assert_same_schedule(Review.from_dict(review), expected)
+    assert review['practice_id'] == str(online[-1][2])  # 最近一次作答仍是在线作答
+    assert review['last_reviewed_at'] == START + timedelta(days=3)
+
+
+def test_offline_attempts_newer_than_the_review_continue_the_schedule(db):
+    user_id, lesson_id = str(ObjectId()), str(ObjectId())
+    first = practice_attempt(db, user_id, lesson_id, 0, True, START)
+    Review.record_attempt(user_id, *first[:2], *first[2:])
+    # 同一批中乱序的离线作答按作答时间计算
+    offline = [practice_attempt(db, user_id, lesson_id, 0, is_correct, START + timedelta(days=day))
+               for day, is_correct in ((4, True), (2, False))]
+    Review.bulk_upsert_reviews(user_id, offline)
+
+    review = db.reviews.find_one(Review.card_key(user_id, lesson_id, 0))
+    expected = replay_schedule([(attempt[5], attempt[3], attempt[4]) for attempt in [first] + offline])
+    assert_same_schedule(Review.from_dict(review), expected)
+    assert review['practice_id'] == str(offline[0][2])
+    assert review['last_reviewed_at'] == START + timedelta(days=4)
@@ -0,0 +1,144 @@
+"""
+用户进度并发更新测试 - LaTeX 速成训练器
+
+多个线程同时提交同一课程的作答，尝试次数不能丢失，完成状态只写入一次，
+每个 (用户, 课程) 只有一条进度文档。默认在 mongomock 上运行；针对真实 MongoDB：
+    MONGODB_TEST_URI=mongodb://localhost:27017 pytest tests/test_user_progress_concurrency.py
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import app as app_module
+from app.routes.practice import bulk_update_user_progress, update_user_progress
+
+THREADS = 16
+SUBMITS_PER_THREAD = 25
+
+
+@pytest.fixture
+def db(mongo_db):
+    app_module.create_unique_progress_index()
+    return mongo_db
+
+
+def hammer(worker, threads=THREADS):
+    """所有线程就绪后同时开始，收集线程中的异常"""
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def run(index):
+        barrier.wait()
+        try:
+            worker(index)
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    assert not errors, errors[:3]
+
+
+def test_concurrent_submits_keep_every_attempt(db):
+    user_id, lesson_id = ObjectId(), ObjectId()
+
+    def worker(index):
+        for submit in range(SUBMITS_PER_THREAD):
+            card_index = submit % 3
+            # 卡片 0 和 1 偶尔答对，卡片 2 始终答错
+            is_correct = card_index < 2 and (index + submit) % 7 == 0
+            update_user_progress(db, str(user_id), str(lesson_id), card_index, is_correct)
+
+    hammer(worker)
+
+    documents = list(db.user_progress.find({'user_id': user_id, 'lesson_id': lesson_id}))
+    assert len(documents) == 1
+    cards = documents[0]['cards_progress']
+    assert sum(card['attempts'] for card in cards.values()) == THREADS * SUBMITS_PER_THREAD
+    expected_attempts = {str(card): sum(1 for submit in range(SUBMITS_PER_THREAD) if submit % 3 == card) * THREADS
+                         for card in range(3)}
+    assert {key: card['attempts'] for key, card in cards.items()} == expected_attempts
+    assert cards['0']['completed'] and cards['0']['first_completed_at'] is not None
+    assert cards['1']['completed'] and cards['1']['first_completed_at'] is not None
+    assert cards['2']['completed'] is False
+    assert cards['2'].get('first_completed_at') is None
+
+
+def test_concurrent_first_correct_answers_complete_once(db):
+    """所有线程同时首次答对同一张卡片：只创建一条文档，首次完成时间不被后来者覆盖"""
+    user_id, lesson_id = ObjectId(), ObjectId()
+    hammer(lambda index: update_user_progress(db, str(user_id), str(lesson_id), 0, True))
+
+    documents = list(db.user_progress.find({'user_id': user_id, 'lesson_id': lesson_id}))
+    assert len(documents) == 1
+    card = documents[0]['cards_progress']['0']
+    assert card['attempts'] == THREADS
+    assert card['completed'] is True
+    assert card['first_completed_at'] <= documents[0]['updated_at']
+
+
+def test_concurrent_sync_and_submit(db):
+    user_id, lesson_id = ObjectId(), ObjectId()
+    answered_at = datetime.utcnow().replace(microsecond=0) - timedelta(days=1)  # MongoDB 只保存到毫秒
+
+    def worker(index):
+        if index % 2:
+            records = [
+                {'lesson_id': lesson_id, 'card_index': submit % 2, 'is_correct': submit == 3,
+                 'submitted_at': answered_at + timedelta(minutes=submit)}
+                for submit in range(SUBMITS_PER_THREAD)
+            ]
+            bulk_update_user_progress(db, str(user_id), records)
+        else:
+            for _ in range(SUBMITS_PER_THREAD):
+                update_user_progress(db, str(user_id), str(lesson_id), 0, False)
+
+    hammer(worker)
+
+    documents = list(db.user_progress.find({'user_id': user_id, 'lesson_id': lesson_id}))
+    assert len(documents) == 1
+    cards = documents[0]['cards_progress']
+    assert cards['0']['attempts'] + cards['1']['attempts'] == THREADS * SUBMITS_PER_THREAD
+    assert cards['0']['completed'] is False
+    assert cards['1']['completed'] is True
+    assert cards['1']['first_completed_at'] == answered_at + timedelta(minutes=3)
+
+
+def test_unique_index_merges_existing_duplicates(db):
+    user_id, lesson_id = ObjectId(), ObjectId()
+    first, second = datetime(2024, 1, 1), datetime(2024, 1, 2)
+    db.user_progress.drop_indexes()
+    db.user_progress.insert_many([
+        {'user_id': user_id, 'lesson_id': lesson_id, 'created_at': first,
+         'cards_progress': {'0': {'attempts': 2, 'completed': True, 'first_completed_at': second}}},
+        {'user_id': user_id, 'lesson_id': lesson_id, 'created_at': second,
+         'cards_progress': {'0': {'attempts': 3, 'completed': True, 'first_completed_at': first},
+                            '1': {'attempts': 1, 'completed': False, 'first_completed_at': None}}},
+    ])
+
+    app_module.create_unique_progress_index()
+
+    documents = list(db.user_progress.find({'user_id': user_id, 'lesson_id': lesson_id}))
+    assert len(documents) == 1
+    assert documents[0]['cards_progress']['0'] == {'attempts': 5, 'completed': True, 'first_completed_at': first}
+    assert documents[0]['cards_progress']['1']['attempts'] == 1
+    assert db.user_progress.index_information()['user_id_1_lesson_id_1'].get('unique')
+
+
+def test_completed_card_resubmits_do_not_depend_on_unique_index(db):
+    """唯一索引缺失时，已完成卡片的重复答对也不会插入第二条进度文档"""
+    db.user_progress.drop_indexes()
+    user_id, lesson_id = ObjectId(), ObjectId()
+    for is_correct in (True, True, False, True):
+        update_user_progress(db, str(user_id), str(lesson_id), 0, is_correct)
+
+    documents = list(db.user_progress.find({'user_id': user_id, 'lesson_id': lesson_id}))
+    assert len(documents) == 1
+    card = documents[0]['cards_progress']['0']
+    assert card['attempts'] == 4
+    assert card['completed'] is True
@@ -0,0 +1,118 @@
+"""
+追加写缓冲测试 - LaTeX 速成训练器
+
+用内存中的集合替身模拟数据库不可用和文档被拒绝，检查缓冲区有界、重试有上限、
+被拒绝的文档进入死信集合。
+"""
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import app as app_module
+from app.utils.write_behind import DEAD_LETTER_COLLECTION, WriteBehindBuffer
+
+
+class FakeCollection:
+    def __init__(self, database):
+        self.database = database
+        self.documents = []
+
+    def insert_many(self, documents, ordered=False):
+        if self.database.down:
+            raise AutoReconnect('connection refused')
+        errors = []
+        for index, document in enumerate(documents):
+            if document.get('invalid'):
+                errors.append({'index': index, 'code': 121, 'errmsg': 'Document failed validation'})
+            else:
+                self.documents.append(document)
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+    def insert_one(self, document):
+        if self.database.down:
+            raise AutoReconnect('connection refused')
+        self.documents.append(document)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.down = False
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(app_module, 'db', database)
+    return database
+
+
+@pytest.fixture
+def buffer():
+    # 刷新间隔足够长，后台线程在测试期间不会自行刷新
+    return WriteBehindBuffer(max_batch=1000, flush_interval=60, max_queue=5, max_retries=2)
+
+
+def test_flush_writes_buffered_documents(database, buffer):
+    ids = [buffer.append('hint_records', {'n': n}) for n in range(3)]
+    assert buffer.flush() == 3
+    assert [document['_id'] for document in database['hint_records'].documents] == ids
+    assert buffer.stats()['queue_depth'] == 0
+
+
+def test_rejected_documents_go_to_dead_letters_without_retry(database, buffer):
+    buffer.append('practice_records', {'n': 1})
+    bad_id = buffer.append('practice_records', {'n': 2, 'invalid': True})
+    assert buffer.flush() == 1
+
+    dead_letters = database[DEAD_LETTER_COLLECTION].documents
+    assert [entry['document_id'] for entry in dead_letters] == [bad_id]
+    assert dead_letters[0]['collection'] == 'practice_records'
+    stats = buffer.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['dead_lettered'] == 1
+    assert not stats['backing_off']
+
+
+def test_transient_failures_retry_a_limited_number_of_times(database, buffer):
+    database.down = True
+    buffer.append('review_submissions', {'n': 1})
+    for _ in range(buffer.max_retries + 1):
+        buffer.flush(force=True)
+    stats = buffer.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['dropped'] == 1
+    assert stats['retrying'] == 0
+
+
+def test_documents_are_written_once_the_database_recovers(database, buffer):
+    database.down = True
+    buffer.append('review_submissions', {'n': 1})
+    buffer.flush()
+    assert buffer.stats()['backing_off']
+    assert buffer.flush() == 0  # 退避期间不写入
+
+    database.down = False
+    assert buffer.flush(force=True) == 1
+    stats = buffer.stats()
+    assert stats['retrying'] == 0
+    assert not stats['backing_off']
+
+
+def test_queue_stays_bounded_while_the_database_is_down(database, buffer, monkeypatch):
+    database.down = True
+    buffer.append('hint_records', {'n': 0})
+    buffer.flush()
+    assert buffer.stats()['backing_off']
+
+    flushes = []
+    monkeypatch.setattr(buffer, 'flush', lambda force=False: flushes.append(force))
+    ids = [buffer.append('hint_records', {'n': n}) for n in range(1, 20)]
+
+    stats = buffer.stats()
+    assert stats['queue_depth'] < buffer.max_queue
+    assert not flushes  # 退避期间请求线程不做同步写入
+    assert [document['_id'] for document in buffer._pending['hint_records']] == ids[-stats['queue_depth']:]
@@ -275,6 +275,11 @@ def main():
             else:
                 skipped_count += 1
         
+        if updated_count > 0:
+            # 通知运行中的服务重新加载课程目录
+            from app.utils.lesson_sync import lessons_changed
+            lessons_changed(db)
+
         # 显示更新结果
         print(f"\n🎉 更新完成！")
         print(f"✅ 成功更新: {updated_count} 个课程")
@@ -162,6 +162,17 @@ class RealApiAdapter {
     }
   }
 
+  // 一次请求获取所有课程的完成状态，返回以课程ID为键的对象
+  async getAllLessonsCompletionStatus() {
+    try {
+      const response = await this.api.get('/lessons/completion-status')
+      return response.data
+    } catch (error) {
+      console.error('获取课程完成状态失败:', error)
+      throw new Error('获取课程完成状态失败')
+    }
+  }
+
   // learningAPI需要的方法
   async getCompletionStatus(lessonId) {
     return this.getLessonCompletionStatus(lessonId)